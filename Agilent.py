@@ -8,11 +8,10 @@ parent_directory = os.path.dirname(os.path.realpath(__file__))
 sys.path.insert(0, parent_directory)
 # Add also directory two levels up
 sys.path.insert(0, os.path.dirname(parent_directory))
-from GenericDevice import _GenericDevice
+from GenericDevice import _SpectrumAnalyzer
 
 import numpy as np
 import matplotlib.pyplot as plt
-from time import sleep
 
 def set_time_unit(times):
     """Determine most appropriate SI prefix for time. 
@@ -59,7 +58,13 @@ def set_freq_unit(freqs):
         fUnit = "Hz"
     return freqs, fUnit
 
-class SpectrumAnalyzer(_GenericDevice):
+class SpectrumAnalyzer(_SpectrumAnalyzer):
+    # ESA and X-Series
+    binary_trace_models = r'E44\d{2}B|N9\d{3}[AB]'
+    trace_query = ':TRACe:DATA? TRACE1'
+    # Front panel use is reported in the event status register
+    user_request_bit = True
+
     def get_max_point(self) -> float:
         self.resource.write(':CALCulate:MARKer1:MAXimum')
         return float(self.resource.query(':CALCulate:MARKer1:X?'))
@@ -70,9 +75,11 @@ class SpectrumAnalyzer(_GenericDevice):
         Returns:
             np.ndarray: 2 numpy arrays data and frequencies
         """
-        span = float(self.resource.query(':FREQuency:SPAN?'))
-        center = float(self.resource.query(':FREQuency:CENTer?'))
-        self.resource.write(':FORMat:TRACe:DATA ASCii')
+        # Read from the instrument, the frequencies may have been changed
+        # from the front panel or by another client
+        span, center = map(float, self.query_many([':FREQuency:SPAN?',
+                                                   ':FREQuency:CENTer?']))
+        self.set_trace_format()
         data = self.query_data()
         freqs = np.linspace(center-span/2, center+span/2, len(data))
         return data, freqs
@@ -99,89 +106,14 @@ class SpectrumAnalyzer(_GenericDevice):
         :rtype: np.ndarray
 
         """
-        self.resource.write(':FREQuency:SPAN 0')
-        self.resource.write(f':FREQuency:CENTer {center}')
-        self.resource.write(f':BANDwidth:RESolution {int(rbw)}')
-        self.resource.write(f':BANDwidth:VIDeo {int(vbw)}')
-        if swt != 'auto':
-            self.resource.write(f':SENSe:SWEep:TIME {swt}')  # in s.
-        else:
-            self.resource.write(':SENSe:SWEep:TIME:AUTO ON')
-        self.resource.write(
-            ':DISPlay:WINdow:TRACe:Y:SCALe:SPACing LOGarithmic')
-        
-        if trig is not None:
-            trigstate = self.resource.query(':TRIGger:SEQuence:SOURce?').replace('\n','')
-            istrigged = trigstate != 'IMM' # whether SA is initially triggered
-            # If trigger true and initial trigger type IMMediate, then set to EXTernal
-            if trig and not (istrigged): 
-                self.resource.write(':TRIGger:SEQuence:SOURce EXTernal')
-                self.resource.write(
-                    ':TRIGger:SEQuence:EXTernal:SLOPe POSitive')
-            # If trigger false and initial trigger type not IMMediate, set to IMMediate
-            elif not (trig) and istrigged:
-                self.resource.write(':TRIGger:SEQuence:SOURce IMMediate')
-        set_trigstate = self.resource.query(':TRIGger:SEQuence:SOURce?').replace('\n','')
-
-        # Query current instrument sweep state
-        sweep_state = int(self.resource.query(':INITiate:CONTinuous?'))
-        if single == False:
-            if sweep_state == 1: 
-                # Already in continuous
-                pass
-            elif sweep_state == 0:
-                # Put into continous
-                self.resource.write(':INITiate:CONTinuous 1')
-            triginfo_msg = ' with trigger' if set_trigstate == 'EXT' else ''
-            print(f'{self.short_name} | Getting zero span scan (continuous sweep mode' +
-                  triginfo_msg + ')')
-        elif single == True:
-            # In following conditional blocks, *OPC command (operation complete)
-            # is sent subsequent to command intializing scan so that operation 
-            # complete status can be polled (must wait for scan completion).
-            self.resource.write('*CLS') # Reset status registers, clear error queue
-            if sweep_state == 1:
-                # Put into single
-                self.resource.write(':INITiate:CONTinuous 0')
-                if barrier is not None:
-                        barrier.wait()
-                        self.resource.write(':INITiate:IMMediate; *OPC')
-                        print(f'{self.short_name} | Waiting for trigger as of {time()} s')
-                else:
-                    self.resource.write(':INITiate:IMMediate; *OPC')
-            elif sweep_state == 0:
-                if trig is None or trig == False:
-                    self.resource.write(':INITiate:IMMediate; *OPC')
-                elif trig == True:
-                    # Must reset trigger just before initiating scan, otherwise
-                    # it seems trigger success condition is stored, because scan
-                    # starts immediately instead of waiting for next trigger
-                    self.resource.write(':TRIGger:SEQuence:SOURce EXTernal')
-                    if barrier is not None:
-                        barrier.wait()
-                        self.resource.write(':INITiate:IMMediate; *OPC')
-                        print(f'{self.short_name} | Waiting for trigger as of {time()} s')
-                    else:
-                        self.resource.write(':INITiate:IMMediate; *OPC')
-            triginfo_msg = ' on trigger' if set_trigstate == 'EXT' else ''
-            print(f'{self.short_name} | Getting zero span scan (single sweep' +
-                  triginfo_msg + ')')
-            # Poll the operation complete status in the event status 
-            # register (ESR). (Once all commands before *OPC have been executed, 
-            # the operation complete bit in the ESR is set to 1)
-            while int(self.resource.query('*ESR?')) != 1:
-                sleep(0.1)
+        data = self._measure({':FREQuency:SPAN': 0,
+                              ':FREQuency:CENTer': center,
+                              ':BANDwidth:RESolution': int(rbw),
+                              ':BANDwidth:VIDeo': int(vbw)},
+                             swt, trig, single, barrier,
+                             'zero span scan')
         print(f"{self.short_name} | Zero span scan complete as of {time()} s")
-        self.resource.write(':FORMat:TRACe:DATA ASCii')
-        data = self.query_data()
-         # If SA was trigged before, put it back in the same state
-        if trig is not None:
-            if not (trig) and istrigged:
-                self.resource.write(f":TRIGger:SEQuence:SOURce {trigstate}")
-        # Put SA back into the state it started in
-        if sweep_state != int(self.resource.query(':INITiate:CONTinuous?')):
-            self.resource.write(f':INITiate:CONTinuous {int(sweep_state)}')
-        sweeptime = float(self.resource.query(':SWEep:TIME?'))
+        sweeptime = float(self.query_setting(':SENSe:SWEep:TIME'))
         times = np.linspace(0, sweeptime, len(data))
         if plot:
             fig, ax = plt.subplots()
@@ -196,7 +128,8 @@ class SpectrumAnalyzer(_GenericDevice):
                                      rbw: int = 100,
                                      vbw: int = 30, swt: float = 'auto',
                                      trig: bool = None, single = False,
-                                     plot: bool = False) -> np.ndarray:
+                                     plot: bool = False,
+                                     barrier = None) -> np.ndarray:
         """Configure and execute measurement of noise power spectrum
 
         THIS FUNCTION REPLACES NOW DEPRECATED FUNCTION <set_trace_parameters_and_get>
@@ -215,81 +148,19 @@ class SpectrumAnalyzer(_GenericDevice):
         :param bool single: Set True for single sweep mode,
             defaults to False for continuous sweep mode
         :param bool plot: option to plot
+        :param barrier: <multiprocessing.Barrier> instance,
+           useful for synchronizing multiple processes (measurements)
         :return: data, freqs for data and frequencies
         :rtype: np.ndarray
 
         """
-        self.resource.write(f':FREQuency:SPAN {span}')
-        self.resource.write(f':FREQuency:CENTer {center}')
-        self.resource.write(f':BANDwidth:RESolution {int(rbw)}')
-        self.resource.write(f':BANDwidth:VIDeo {int(vbw)}')
-        if swt != 'auto':
-            self.resource.write(f':SENSe:SWEep:TIME {swt}')  # in s.
-        else:
-            self.resource.write(':SENSe:SWEep:TIME:AUTO ON')
-        self.resource.write(
-            ':DISPlay:WINdow:TRACe:Y:SCALe:SPACing LOGarithmic')
-
-        if trig is not None:
-            trigstate = self.resource.query(':TRIGger:SEQuence:SOURce?').replace('\n','')
-            istrigged = trigstate != 'IMM' # whether SA is initially triggered
-            # If trigger true and initial trigger type IMMediate, then set to EXTernal
-            if trig and not (istrigged): 
-                self.resource.write(':TRIGger:SEQuence:SOURce EXTernal')
-                self.resource.write(
-                    ':TRIGger:SEQuence:EXTernal:SLOPe POSitive')
-            # If trigger false and initial trigger type not IMMediate, set to IMMediate
-            elif not (trig) and istrigged:
-                self.resource.write(':TRIGger:SEQuence:SOURce IMMediate')
-        set_trigstate = self.resource.query(':TRIGger:SEQuence:SOURce?').replace('\n','')
-
-        # Query current instrument sweep state
-        sweep_state = int(self.resource.query(':INITiate:CONTinuous?'))
-        if single == False:
-            if sweep_state == 1: 
-                # Already in continuous
-                pass
-            elif sweep_state == 0:
-                # Put into continous
-                self.resource.write(':INITiate:CONTinuous 1')
-            triginfo_msg = ' with trigger' if set_trigstate == 'EXT' else ''
-            print(f'{self.short_name} | Getting power spectrum (continuous sweep mode' +
-                  triginfo_msg + ')')
-        elif single == True:
-            # In following conditional blocks, *OPC command (operation complete)
-            # is sent subsequent to command intializing scan so that operation 
-            # complete status can be polled (must wait for scan completion).
-            self.resource.write('*CLS') # Reset status registers, clear error queue
-            if sweep_state == 1:
-                # Put into single
-                self.resource.write(':INITiate:CONTinuous 0')
-                self.resource.write(':INITiate:IMMediate; *OPC')
-            elif sweep_state == 0:
-                if trig is None or trig == False:
-                    self.resource.write(':INITiate:IMMediate; *OPC')
-                elif trig == True:
-                    # Must reset trigger just before initiating scan, otherwise
-                    # it seems trigger success condition is stored, because scan
-                    # starts immediately instead of waiting for next trigger
-                    self.resource.write(':TRIGger:SEQuence:SOURce EXTernal')
-                    self.resource.write(':INITiate:IMMediate; *OPC')
-            triginfo_msg = ' on trigger' if set_trigstate == 'EXT' else ''
-            print(f'{self.short_name} | Getting power spectrum (single sweep' +
-                  triginfo_msg + ')')
-            # Poll the operation complete status in the event status 
-            # register (ESR). (Once all commands before *OPC have been executed, 
-            # the operation complete bit in the ESR is set to 1)
-            while int(self.resource.query('*ESR?')) != 1:
-                sleep(0.1)
-        self.resource.write(':FORMat:TRACe:DATA ASCii')
-        data = self.query_data()
-        # If SA was trigged before, put it back in the same state
-        if trig is not None:
-            if not (trig) and istrigged:
-                self.resource.write(f":TRIGger:SEQuence:SOURce {trigstate}")
-        # Put SA back into the state it started in
-        if sweep_state != int(self.resource.query(':INITiate:CONTinuous?')):
-            self.resource.write(f':INITiate:CONTinuous {int(sweep_state)}')
+        # The settings are followed by *OPC? in the same message
+        data = self._measure({':FREQuency:SPAN': span,
+                              ':FREQuency:CENTer': center,
+                              ':BANDwidth:RESolution': int(rbw),
+                              ':BANDwidth:VIDeo': int(vbw)},
+                             swt, trig, single, barrier,
+                             'power spectrum', opc=True)
         freqs = np.linspace(center-span//2, center+span//2, len(data))
         if plot:
             fig, ax = plt.subplots()
@@ -299,15 +170,3 @@ class SpectrumAnalyzer(_GenericDevice):
             ax.set_ylabel('Noise Power (dBm)')
             plt.show()
         return data, freqs
-
-    def query_data(self) -> np.ndarray:
-        """Lower level function to grab the data from the SpecAnalyzer
-
-        :return: data
-        :rtype: list
-
-        """
-        rawdata = self.resource.query(':TRACe:DATA? TRACE1')
-        data = rawdata.split(',')[:]
-        data = [float(i) for i in data]
-        return np.asarray(data)
@@ -0,0 +1,165 @@
+"""
+Asyncio interface to the instruments.
+
+Every method of the blocking instrument classes is exposed as a coroutine
+running in an executor dedicated to the device : calls to one instrument
+stay serialized while a single event loop drives many instruments at once.
+
+Example, synchronized single acquisitions on a scope and a spectrum
+analyzer, replacing the multiprocessing.Barrier of the blocking API :
+
+    scope = await AsyncScope.open('TCPIP::169.254.63.138::INSTR')
+    sa = await AsyncAgilentSpectrumAnalyzer.open('GPIB0::18::INSTR')
+    barrier = ArmBarrier(2)
+    (times, data), (trace, t_sa) = await asyncio.gather(
+        scope.get_waveform_raw([1], single=True, barrier=barrier),
+        sa.zero_span(single=True, barrier=barrier))
+"""
+import asyncio
+import functools
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Directory containing GenericDevice must be in path
+# Add parent directory of current file to path
+parent_directory = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, parent_directory)
+from RigolInterface import Scope, SpectrumAnalyzer, ArbitraryFG
+from Agilent import SpectrumAnalyzer as AgilentSpectrumAnalyzer
+
+
+class ArmBarrier:
+    """Barrier synchronizing the arming of several instruments driven from
+    one event loop. It is passed as the barrier argument of the blocking
+    methods (in place of a multiprocessing.Barrier) : each device waits on
+    it in its own executor thread, so the event loop is never blocked.
+    If one of the calls fails before reaching the barrier, the barrier is
+    aborted so that the other instruments do not wait forever.
+    """
+    def __init__(self, parties: int, timeout: float = None):
+        """
+        :param int parties: Number of instruments to synchronize
+        :param float timeout: Maximum waiting time in s, defaults to None
+            (no limit)
+        """
+        self._barrier = threading.Barrier(parties, timeout=timeout)
+
+    def wait(self) -> int:
+        """Blocks until all the parties are waiting (called from the device
+        threads by the blocking methods)."""
+        return self._barrier.wait()
+
+    def armed(self):
+        """Called from the device threads once their instrument acknowledged
+        the arming command (see _GenericDevice._arm). Does nothing here."""
+
+    def abort(self):
+        self._barrier.abort()
+
+    def reset(self):
+        self._barrier.reset()
+
+    @property
+    def broken(self) -> bool:
+        return self._barrier.broken
+
+
+class AsyncDevice:
+    """Asyncio wrapper around a connected instrument.
+    Methods of the wrapped instrument are returned as coroutine functions,
+    other attributes are returned as is.
+    """
+    # Blocking class instantiated by open
+    _device_class = None
+
+    def __init__(self, device):
+        """
+        :param device: Connected instrument (e.g. Scope instance)
+        """
+        self.device = device
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=getattr(device, 'short_name', 'device'))
+
+    @classmethod
+    async def open(cls, *args, **kwargs):
+        """Connects to the instrument without blocking the event loop.
+        Takes the arguments of the blocking class constructor.
+        """
+        if cls._device_class is None:
+            print("ERROR : open is only available on the instrument " +
+                  "specific classes (e.g. AsyncScope)")
+            return None
+        loop = asyncio.get_running_loop()
+        device = await loop.run_in_executor(
+            None, functools.partial(cls._device_class, *args, **kwargs))
+        return cls(device)
+
+    async def run(self, function, *args, **kwargs):
+        """Runs any blocking callable in the executor of the device.
+
+        :param callable function: Function to run
+        :return: return value of function
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(function, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.device, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            try:
+                return await self.run(attr, *args, **kwargs)
+            except BaseException:
+                barrier = kwargs.get('barrier')
+                if isinstance(barrier, ArmBarrier):
+                    barrier.abort()
+                raise
+        return method
+
+    async def close(self):
+        await self.run(self.device.close)
+        self._executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class AsyncScope(AsyncDevice):
+    _device_class = Scope
+
+    async def stream(self, *args, **kwargs):
+        """Asynchronous version of Scope.stream, takes the same arguments.
+        The frames are fetched in the executor of the device.
+        """
+        frames = await self.run(self.device.stream, *args, **kwargs)
+        try:
+            while True:
+                # next() cannot raise StopIteration into a Future
+                frame = await self.run(next, frames, None)
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            await self.run(frames.close)
+
+
+class AsyncSpectrumAnalyzer(AsyncDevice):
+    _device_class = SpectrumAnalyzer
+
+
+class AsyncAgilentSpectrumAnalyzer(AsyncDevice):
+    _device_class = AgilentSpectrumAnalyzer
+
+
+class AsyncArbitraryFG(AsyncDevice):
+    _device_class = ArbitraryFG
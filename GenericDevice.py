@@ -1,67 +1,509 @@
+import atexit
+import json
+import os
+import re
 import sys
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from time import perf_counter, sleep, time
+import numpy as np
 import pyvisa as visa
 
 
+def parse_ascii_block(rawdata: str) -> np.ndarray:
+    """Decodes a comma separated SCPI ASCII response into a float array.
+    The optional IEEE 488.2 definite length block header (#<N><length>, sent
+    by some instruments before the values), the spaces after commas and the
+    trailing newline are all handled in a single vectorized pass.
+
+    Args:
+        rawdata (str): response of the instrument
+
+    Returns:
+        np.ndarray: decoded values
+    """
+    start = 0
+    if rawdata.startswith('#'):
+        start = 2 + int(rawdata[1])
+    with warnings.catch_warnings():
+        # np.fromstring warns when it cannot parse the string to its end,
+        # this is checked below with the number of values
+        warnings.simplefilter('ignore', DeprecationWarning)
+        data = np.fromstring(rawdata[start:], sep=',')
+    if len(data) != rawdata.count(',', start) + 1:
+        # Malformed response, let float() report the faulty value
+        data = np.asarray([float(i) for i in rawdata[start:].split(',')])
+    return data
+
+
+def _same_setting(cached: str, value: str) -> bool:
+    """Whether a cached setting and the value returned by the instrument are
+    the same, e.g. 1000000.0 and 1.000000e+06, or POSitive and POS."""
+    try:
+        return np.isclose(float(cached), float(value), rtol=1e-9, atol=0)
+    except ValueError:
+        pass
+    cached, value = cached.strip().upper(), value.strip().strip('"').upper()
+    aliases = {'ON': '1', 'OFF': '0'}
+    cached, value = aliases.get(cached, cached), aliases.get(value, value)
+    # Long and short forms of a mnemonic
+    return cached.startswith(value) or value.startswith(cached)
+
+
+class _CountingResource:
+    """Thin wrapper around a PyVisa resource counting the bus transactions.
+    Every response read (queries and explicit reads) counts as a round trip,
+    every write as a one-way transaction. All other attributes are forwarded
+    to the wrapped resource.
+    Transactions are serialised by lock (reentrant), which a thread also
+    holds around a sequence of transactions that must not be interleaved
+    with those of other threads (e.g. selecting a source then reading it).
+    """
+    _ROUND_TRIPS = ('query', 'query_ascii_values', 'query_binary_values',
+                    'read', 'read_raw', 'read_bytes', 'read_ascii_values',
+                    'read_binary_values')
+    _WRITES = ('write', 'write_raw', 'write_ascii_values',
+               'write_binary_values')
+
+    def __init__(self, resource, on_reset=None):
+        """
+        :param resource: PyVisa resource
+        :param callable on_reset: Called when a message containing *RST is
+            sent, defaults to None
+        """
+        object.__setattr__(self, '_resource', resource)
+        object.__setattr__(self, 'round_trips', 0)
+        object.__setattr__(self, 'writes', 0)
+        object.__setattr__(self, 'on_reset', on_reset)
+        object.__setattr__(self, 'lock', threading.RLock())
+
+    def __getattr__(self, name):
+        attr = getattr(self._resource, name)
+        if name in self._ROUND_TRIPS:
+            counter = 'round_trips'
+        elif name in self._WRITES:
+            counter = 'writes'
+        else:
+            return attr
+
+        def counted(*args, **kwargs):
+            with self.lock:
+                object.__setattr__(self, counter, getattr(self, counter) + 1)
+                if self.on_reset is not None and len(args) > 0 and \
+                        isinstance(args[0], str) and '*RST' in args[0].upper():
+                    self.on_reset()
+                return attr(*args, **kwargs)
+        return counted
+
+    def __setattr__(self, name, value):
+        if name in ('round_trips', 'writes', 'on_reset', 'lock'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._resource, name, value)
+
+
+# Process wide resource managers, by backend
+_resource_managers = {}
+_resource_managers_lock = threading.Lock()
+
+
+def get_resource_manager(py_backend: bool = None):
+    """Returns the ResourceManager shared by all the instruments of the
+    process (one per backend), creating it on first use.
+
+    Args:
+        py_backend (bool, optional): Use the pyvisa-py backend. Defaults to
+            None (pyvisa-py on Linux, the default backend otherwise).
+
+    Returns:
+        visa.ResourceManager: shared resource manager
+    """
+    if py_backend == True or sys.platform.startswith('linux'):
+        backend = '@py'
+    else:
+        backend = ''
+    with _resource_managers_lock:
+        if backend not in _resource_managers:
+            _resource_managers[backend] = visa.ResourceManager(backend)
+        return _resource_managers[backend]
+
+
+class ResourcePool:
+    """Pool of open sessions keyed by address.
+    Instruments handing their session back (see _GenericDevice.release) make
+    it available to the next instrument opened at the same address, which
+    skips the connection. Idle sessions are closed after idle_timeout, and
+    checked with *IDN? before being reused.
+    """
+    def __init__(self, idle_timeout: float = 300.0):
+        """
+        :param float idle_timeout: Time in s after which an idle session is
+            closed, defaults to 300. None keeps idle sessions open.
+        """
+        self.idle_timeout = idle_timeout
+        # [resource, identity, release time] by address
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, addr: str, rm=None) -> tuple:
+        """Returns an open session to addr, reusing an idle one if possible.
+
+        :param str addr: Address of the device
+        :param rm: ResourceManager opening new sessions (not needed for
+            simulated devices)
+        :return: resource and identity (*IDN? response) of the device
+        :rtype: tuple
+        """
+        self.evict()
+        while True:
+            with self._lock:
+                sessions = self._idle.get(addr, [])
+                entry = sessions.pop() if len(sessions) > 0 else None
+            if entry is None:
+                break
+            resource, identity, _ = entry
+            if self._healthy(resource, identity):
+                with self._lock:
+                    self.hits += 1
+                return resource, identity
+            self._close(resource)
+        with self._lock:
+            self.misses += 1
+        if addr.startswith('SIM::'):
+            # Only loaded when a simulated instrument is requested
+            from SimulatedDevice import SimulatedResource
+            resource = SimulatedResource.from_address(addr)
+        else:
+            resource = rm.open_resource(addr)
+        try:
+            identity = resource.query('*IDN?').replace('\n','')
+        except Exception:
+            self._close(resource)
+            raise
+        return resource, identity
+
+    def release(self, addr: str, resource, identity: str):
+        """Hands a session back to the pool."""
+        with self._lock:
+            self._idle.setdefault(addr, []).append(
+                [resource, identity, perf_counter()])
+        self.evict()
+
+    def evict(self, idle_timeout: float = None):
+        """Closes the sessions idle for longer than idle_timeout (defaults
+        to the idle_timeout of the pool)."""
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+        if idle_timeout is None:
+            return
+        now = perf_counter()
+        expired = []
+        with self._lock:
+            for addr, sessions in self._idle.items():
+                expired += [entry[0] for entry in sessions
+                            if now - entry[2] > idle_timeout]
+                sessions[:] = [entry for entry in sessions
+                               if now - entry[2] <= idle_timeout]
+        for resource in expired:
+            self._close(resource)
+
+    def clear(self):
+        """Closes all the idle sessions."""
+        self.evict(idle_timeout=-1)
+
+    @staticmethod
+    def _healthy(resource, identity: str) -> bool:
+        try:
+            return resource.query('*IDN?').replace('\n','') == identity
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(resource):
+        try:
+            resource.close()
+        except Exception:
+            pass
+
+
+# Connection pool shared by all the instruments of the process
+resource_pool = ResourcePool()
+atexit.register(resource_pool.clear)
+
+
+# Persistent cache of the discovered instruments (address -> identity)
+IDN_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache',
+                              'RigolInterface', 'instruments.json')
+# Time in s after which a cache entry is considered stale
+IDN_CACHE_TTL = 24*3600
+
+
+def _read_idn_cache() -> dict:
+    try:
+        with open(IDN_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_idn_cache(cache: dict):
+    try:
+        os.makedirs(os.path.dirname(IDN_CACHE_FILE), exist_ok=True)
+        temp_file = f'{IDN_CACHE_FILE}.{os.getpid()}'
+        with open(temp_file, 'w') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(temp_file, IDN_CACHE_FILE)
+    except OSError as e:
+        print(f"ERROR : Could not write the instrument cache ({e})")
+
+
+def _probe(rm, addr: str, timeout: float) -> str:
+    """Opens addr and queries its identity within timeout. The session is
+    kept in the resource_pool. Returns None if the device does not answer.
+    """
+    try:
+        resource = rm.open_resource(addr, open_timeout=int(timeout*1000))
+    except Exception:
+        return None
+    try:
+        previous_timeout = resource.timeout
+        resource.timeout = timeout*1000
+        identity = resource.query('*IDN?').replace('\n','').strip()
+        resource.timeout = previous_timeout
+    except Exception:
+        ResourcePool._close(resource)
+        return None
+    resource_pool.release(addr, resource, identity)
+    return identity
+
+
+def discover(py_backend: bool = None, timeout: float = 0.5,
+             refresh: bool = False, ttl: float = None) -> dict:
+    """Lists the connected instruments, from the on-disk cache if it is
+    fresh, otherwise by probing all the resources concurrently. The
+    instruments found are merged into the cache, whose entries older than
+    ttl are dropped.
+
+    Args:
+        py_backend (bool, optional): Use the pyvisa-py backend. Defaults to
+            None (see get_resource_manager).
+        timeout (float, optional): Time in s given to each device to open
+            and answer *IDN?. Defaults to 0.5.
+        refresh (bool, optional): Scan even if the cache is fresh.
+            Defaults to False.
+        ttl (float, optional): Maximum age in s of the cache entries.
+            Defaults to None (IDN_CACHE_TTL).
+
+    Returns:
+        dict: identity, manufacturer, model, serial and time of discovery
+            by address
+    """
+    if ttl is None:
+        ttl = IDN_CACHE_TTL
+    if not refresh:
+        cache = {addr: entry for addr, entry in _read_idn_cache().items()
+                 if time() - entry['time'] <= ttl}
+        if len(cache) > 0:
+            return cache
+    rm = get_resource_manager(py_backend)
+    addresses = [addr for addr in rm.list_resources() if 'ASRL' not in addr]
+    found = {}
+    if len(addresses) > 0:
+        with ThreadPoolExecutor(max_workers=len(addresses)) as executor:
+            identities = list(executor.map(
+                lambda addr: _probe(rm, addr, timeout), addresses))
+        for addr, identity in zip(addresses, identities):
+            if identity is None:
+                continue
+            fields = [field.strip() for field in identity.split(',')]
+            fields += [''] * (3 - len(fields))
+            found[addr] = {'identity': identity, 'manufacturer': fields[0],
+                           'model': fields[1], 'serial': fields[2],
+                           'time': time()}
+    # Merged into the fresh entries, which may come from other processes
+    # or backends, or be held by another process and not answer the probe
+    cache = {addr: entry for addr, entry in _read_idn_cache().items()
+             if time() - entry['time'] <= ttl}
+    cache.update(found)
+    _write_idn_cache(cache)
+    return found
+
+
+def find_address(model: str = None, serial: str = None,
+                 py_backend: bool = None, refresh: bool = False) -> str:
+    """Returns the address of the first instrument matching a model and/or
+    serial number (case insensitive), looked up in the discovery cache and
+    rescanning once if it is not found.
+
+    Args:
+        model (str, optional): Model number (e.g. 'DS7014').
+        serial (str, optional): Serial number (e.g. 'DS7F222900085').
+        py_backend (bool, optional): Use the pyvisa-py backend.
+        refresh (bool, optional): Always scan. Defaults to False.
+
+    Returns:
+        str: address of the instrument, None if it was not found
+    """
+    def match(entries):
+        for addr, entry in entries.items():
+            if serial is not None and \
+                    entry['serial'].upper() != serial.upper():
+                continue
+            if model is not None and entry['model'].replace(' ','').upper() \
+                    != model.replace(' ','').upper():
+                continue
+            return addr
+        return None
+    addr = match(discover(py_backend, refresh=refresh))
+    if addr is None and not refresh:
+        addr = match(discover(py_backend, refresh=True))
+    return addr
+
+
 class _GenericDevice:
     """A class to handle connection logic through PyVisa for all
     devices.
     Not meant to use "as is" rather it is subclassed by each instrument
     class.
+    The instruments share one ResourceManager, and their sessions come from
+    the resource_pool : used as a context manager, an instrument hands its
+    session back to the pool on exit instead of closing it, so that short
+    lived measurement jobs do not pay the connection time.
+    Settings written with configure are cached (write-through), so that
+    unchanged settings are not sent again, see configure.
+    Commands written with write inside a batch are sent together, see batch.
     """
-    def __init__(self, addr: str = None, py_backend: bool = None):
+    # Maximum length in bytes of a program message. Not documented by the
+    # programming guides, conservative default.
+    input_buffer_size = 1024
+    # The user request bit (6) of the event status register is set when the
+    # front panel is used. The Rigol programming guides (e.g. DSA800,
+    # MSO7000/DS7000) state that it is not used and always reads 0.
+    user_request_bit = False
+
+    def __init__(self, addr=None, py_backend: bool = None):
         """
         Scans for USB devices
+
+        :param addr: VISA address of the device, simulated device address
+            (SIM::<model>[::<serial>]::INSTR, see SimulatedDevice) or already
+            opened resource. Defaults to None (scan).
+        :param bool py_backend: Use the pyvisa-py backend
         """
-        if py_backend == True:
-            self.rm = visa.ResourceManager('@py')
-        elif sys.platform.startswith('linux'):
-            self.rm = visa.ResourceManager('@py')
-        elif sys.platform.startswith('win32'):
-            self.rm = visa.ResourceManager()
+        self.rm = None
+        self._addr = None
+        # Settings cache : last value sent or read, by command header
+        self.settings = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Check for front panel changes before trusting the cache
+        self.front_panel_check = True
+        # Commands gathered by the current batch
+        self._batch = None
+        if addr is not None and not isinstance(addr, str):
+            # Already opened resource (e.g. SimulatedResource)
+            self._connect(addr)
+            return
+        if addr is None or not addr.startswith('SIM::'):
+            self.rm = get_resource_manager(py_backend)
         if addr is None:
-            instruments = self.rm.list_resources()
-            # usb = list(filter(lambda x: 'USB' in x, instruments))
-            usb = list(filter(lambda x: 'ASRL' not in x, instruments))
-            # usb = instruments
+            found = discover(py_backend, refresh=True)
+            usb = list(found)
             if len(usb) == 0:
                 print('Could not find any device !')
-                print(f"\n Instruments found : {instruments}")
+                print(f"\n Instruments found : {self.rm.list_resources()}")
                 sys.exit(-1)
             elif len(usb) > 1:
                 print('More than one USB instrument connected' +
                       ' please choose instrument')
                 for counter, dev in enumerate(usb):
-                    instr = self.rm.open_resource(dev)
-                    try:
-                        print(f"{dev} : {counter} (" +
-                              f"{instr.query('*IDN?')})")
-                        instr.close()
-                    except Exception:
-                        print(f"Could not open device : {Exception}")
+                    print(f"{dev} : {counter} ({found[dev]['identity']})")
                 answer = input("\n Choice (number between 0 and " +
                                f"{len(usb)-1}) ? ")
-                answer = int(answer)
-                self.resource = self.rm.open_resource(usb[answer])
+                addr = usb[int(answer)]
             else:
-                self.resource = self.rm.open_resource(usb[0])
-                self.identity = self.resource.query('*IDN?').replace('\n','')
-                self.short_name = self.identity.split(',')[1].replace(' ','')
-                print(f"Connected to {self.identity}")
-        else:
-            try:
-                self.resource = self.rm.open_resource(addr)
-                self.identity = self.resource.query('*IDN?').replace('\n','')
-                # Device returns string of the form 
-                # <manufacturer>,<model number>,<serial number>,<software revision>  
-                # Use model number to give device a short name
-                self.short_name = self.identity.split(',')[1].replace(' ','')
-                print(f"Connected to {self.identity}")
-            except Exception:
-                print("ERROR : Could not connect to specified device")
+                addr = usb[0]
+        try:
+            resource, identity = resource_pool.acquire(addr, self.rm)
+            self._addr = addr
+            self._connect(resource, identity)
+        except Exception:
+            print("ERROR : Could not connect to specified device")
+
+    @classmethod
+    def by_serial(cls, serial: str, py_backend: bool = None, **kwargs):
+        """Opens the instrument with a given serial number, found without
+        rescanning if it is in the discovery cache (see discover).
+        Other keyword arguments are passed to the constructor.
+
+        :param str serial: Serial number, e.g. 'DS7F222900085'
+        :param bool py_backend: Use the pyvisa-py backend
+        :return: connected instrument, None if it was not found
+        """
+        return cls._open_found(py_backend, kwargs, serial=serial)
+
+    @classmethod
+    def by_model(cls, model: str, py_backend: bool = None, **kwargs):
+        """Opens the first instrument of a given model, found without
+        rescanning if it is in the discovery cache (see discover).
+        Other keyword arguments are passed to the constructor.
+
+        :param str model: Model number, e.g. 'DS7014'
+        :param bool py_backend: Use the pyvisa-py backend
+        :return: connected instrument, None if it was not found
+        """
+        return cls._open_found(py_backend, kwargs, model=model)
+
+    @classmethod
+    def _open_found(cls, py_backend: bool, kwargs: dict, model: str = None,
+                    serial: str = None):
+        for refresh in (False, True):
+            addr = find_address(model, serial, py_backend, refresh=refresh)
+            if addr is None:
+                break
+            device = cls(addr, py_backend, **kwargs)
+            if hasattr(device, 'identity'):
+                return device
+            # Stale cache entry, e.g. the device changed address
+        print(f"ERROR : Could not find device (model {model}, " +
+              f"serial {serial})")
+        return None
+
+    def _connect(self, resource, identity: str = None):
+        """Wraps an opened resource and identifies the device."""
+        self.resource = _CountingResource(resource, on_reset=self.invalidate)
+        if identity is None:
+            identity = self.resource.query('*IDN?').replace('\n','')
+        self.identity = identity
+        # Device returns string of the form 
+        # <manufacturer>,<model number>,<serial number>,<software revision>  
+        # Use model number to give device a short name
+        self.short_name = self.identity.split(',')[1].replace(' ','')
+        print(f"Connected to {self.identity}")
 
     def close(self):
+        """Closes the session. The shared ResourceManager stays open."""
         self.resource.close()
-        self.rm.close()
+
+    def release(self):
+        """Hands the session back to the connection pool, to be reused by the
+        next instrument opened at the same address. Sessions which were not
+        opened from an address are closed."""
+        if self._addr is None:
+            self.close()
+        else:
+            resource_pool.release(self._addr, self.resource._resource,
+                                  self.identity)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
 
     def print_error(self):
         ''' Print eventual errors occurred. '''
@@ -71,8 +513,465 @@ class _GenericDevice:
         ''' Reset instrument to factory default state. Does not clear volatile memory. '''
         self.resource.write('*RST')
         self.resource.query('*OPC?')
+        self.invalidate()
 
     def clear(self):
         ''' Clear event register, error queue -when power is cycled-. '''
         self.resource.write('*CLS')
         self.resource.query('*OPC?')
+
+    def configure(self, settings: dict) -> int:
+        """Write-through settings cache : sends, in a single message, only
+        the settings whose value differs from the one last sent or read.
+        Headers must be spelled the same way in every call (e.g. always
+        ':FREQuency:SPAN'), and values as the instrument returns them when
+        they are also read with query_setting (e.g. 'EXT', not 'EXTernal').
+
+        Args:
+            settings (dict): Values by command header
+
+        Returns:
+            int: number of commands sent
+        """
+        sent = 0
+        with self.batch():
+            for header, value in settings.items():
+                value = str(value)
+                if self.settings.get(header) == value:
+                    self.cache_hits += 1
+                    continue
+                self.cache_misses += 1
+                self.write(f'{header} {value}')
+                self.settings[header] = value
+                sent += 1
+        return sent
+
+    def write(self, message: str):
+        """Writes a message to the instrument, or adds it to the current
+        batch (see batch).
+
+        Args:
+            message (str): Program message
+        """
+        if self._batch is None:
+            self.resource.write(message)
+        else:
+            self._batch.append(message)
+
+    @contextmanager
+    def batch(self, opc: bool = False, check_errors: bool = False):
+        """Configuration transaction : the commands written with write (or
+        configure) in the with block are sent on exit as ;-joined program
+        messages, as few as the input buffer size allows. Queries are not
+        delayed, they must not depend on the commands of the batch. Nothing
+        is sent (and the settings cache is cleared) if the block raises an
+        exception. Nested batches are part of the outermost one.
+
+            with scope.batch(opc=True, check_errors=True):
+                scope.write(':CHAN1:SCAL 0.1')
+                scope.write(':CHAN1:OFFS 0')
+
+        Args:
+            opc (bool, optional): Wait for the commands to complete with
+                *OPC?. Defaults to False.
+            check_errors (bool, optional): Read the first error of the queue
+                with SYST:ERR? and print it. Defaults to False.
+                Both are sent with the last commands, in one round trip.
+        """
+        if self._batch is not None:
+            yield
+            return
+        self._batch = []
+        try:
+            yield
+        except BaseException:
+            self._batch = None
+            # The cache may hold settings which were not sent
+            self.invalidate()
+            raise
+        commands, self._batch = self._batch, None
+        if len(commands) == 0:
+            return
+        queries = []
+        if opc:
+            queries.append('*OPC?')
+        if check_errors:
+            queries.append(':SYSTem:ERRor?')
+        messages = self._program_messages(commands + queries)
+        for message in messages[:-1]:
+            self.resource.write(message)
+        if len(queries) == 0:
+            self.resource.write(messages[-1])
+            return
+        response = self.resource.query(messages[-1]).strip()
+        if check_errors:
+            error = response.split(';', 1)[-1] if opc else response
+            if int(error.split(',')[0]) != 0:
+                print(f'{self.short_name} | ERROR : {error}')
+
+    def _program_messages(self, units: list) -> list:
+        """Joins commands or queries with ';' into as few program messages
+        as the input buffer size allows."""
+        messages = ['']
+        for unit in units:
+            # The termination character counts in the buffer
+            if len(messages[-1]) > 0 and len(messages[-1]) + len(unit) + \
+                    2 > self.input_buffer_size:
+                messages.append(unit)
+            elif len(messages[-1]) > 0:
+                messages[-1] += ';' + unit
+            else:
+                messages[-1] = unit
+        return messages
+
+    def query_many(self, queries: list) -> list:
+        """Sends several queries as ;-joined program messages, as few as the
+        input buffer size allows, i.e. usually in a single round trip.
+
+            vpp, freq = scope.query_many([':MEAS:ITEM? VPP,CHAN1',
+                                          ':MEAS:ITEM? FREQ,CHAN1'])
+
+        Args:
+            queries (list): Queries, whose responses must not contain ';'
+
+        Returns:
+            list: response (str) of each query
+        """
+        responses = []
+        for message in self._program_messages(queries):
+            responses += self.resource.query(message).strip().split(';')
+        if len(responses) != len(queries):
+            print(f'{self.short_name} | ERROR : {len(queries)} queries '
+                  f'returned {len(responses)} responses')
+        return responses
+
+    def query_setting(self, header: str) -> str:
+        """Returns the value of a setting from the cache, querying the
+        instrument on a miss.
+
+        Args:
+            header (str): Command header, without the question mark
+
+        Returns:
+            str: value of the setting
+        """
+        if header in self.settings:
+            self.cache_hits += 1
+            return self.settings[header]
+        self.cache_misses += 1
+        value = self.resource.query(f'{header}?').strip()
+        self.settings[header] = value
+        return value
+
+    def invalidate(self, header: str = None):
+        """Forgets a cached setting, or all of them if header is None."""
+        if header is None:
+            self.settings.clear()
+        else:
+            self.settings.pop(header, None)
+
+    def sync_settings(self) -> bool:
+        """Brings the settings cache up to date with changes made from the
+        front panel (or by another client) since the last check, in one
+        round trip. Instruments with a user request bit (user_request_bit)
+        invalidate the whole cache when it is set in the event status
+        register (reading it clears it). The others, e.g. the Rigol
+        oscilloscopes and spectrum analyzers, query every cached setting
+        again and keep the values which differ from the cached ones.
+        Disabled when front_panel_check is False.
+
+        Returns:
+            bool: True if a cached setting was changed or invalidated
+        """
+        if not self.front_panel_check or len(self.settings) == 0:
+            return False
+        if self.user_request_bit:
+            if int(self.resource.query('*ESR?')) & 64:
+                self.invalidate()
+                return True
+            return False
+        headers = list(self.settings)
+        values = self.query_many([f'{header}?' for header in headers])
+        if len(values) != len(headers):
+            self.invalidate()
+            return True
+        changed = False
+        for header, value in zip(headers, values):
+            if not _same_setting(self.settings[header], value):
+                self.settings[header] = value
+                changed = True
+        return changed
+
+    def wait_until(self, condition, timeout: float = None,
+                   interval: float = 1e-3, max_interval: float = 0.1) -> bool:
+        """Polls a condition with adaptive backoff : the polling interval
+        starts small and doubles up to max_interval, so that short operations
+        are detected with low latency without flooding the bus during long
+        ones.
+
+        Args:
+            condition (callable): Function returning True when done
+            timeout (float, optional): Maximum waiting time in s.
+                Defaults to None (no limit).
+            interval (float, optional): First polling interval in s.
+                Defaults to 1e-3.
+            max_interval (float, optional): Maximum polling interval in s.
+                Defaults to 0.1.
+
+        Returns:
+            bool: True if the condition was met, False on timeout
+        """
+        t0 = perf_counter()
+        while not condition():
+            if timeout is not None and perf_counter() - t0 > timeout:
+                return False
+            sleep(interval)
+            interval = min(2*interval, max_interval)
+        return True
+
+    def _arm(self, command: str, barrier=None):
+        """Sends the query arming the instrument, whose response confirms that
+        it was processed, once all the parties of barrier (if any) are
+        waiting. A barrier with an armed method (see AsyncInterface.ArmBarrier)
+        is then notified from the calling thread.
+
+        Args:
+            command (str): Arming program message ending with a query, e.g.
+                ':SINGle;*OPC?'
+            barrier (optional): Barrier shared with the instruments to arm
+                together. Defaults to None.
+        """
+        if barrier is not None:
+            barrier.wait()
+        self.resource.query(command)
+        armed = getattr(barrier, 'armed', None)
+        if armed is not None:
+            armed()
+
+    def wait_for_completion(self, command: str = None, timeout: float = None,
+                            method: str = 'auto') -> bool:
+        """Sends an overlapped command (e.g. :INITiate:IMMediate) and waits for
+        the instrument to complete it.
+
+        Args:
+            command (str, optional): Command starting the operation.
+                Defaults to None (waits for the pending operations).
+            timeout (float, optional): Maximum waiting time in s.
+                Defaults to None (no limit).
+            method (str, optional): 'srq' waits for the service request raised
+                by the operation complete bit (backends supporting it, e.g.
+                GPIB), 'opc' blocks on *OPC? with the VISA timeout set to
+                timeout, 'poll' polls the operation complete bit of the event
+                status register with adaptive backoff, 'auto' uses 'srq' when
+                supported and 'opc' otherwise. Defaults to 'auto'.
+
+        Returns:
+            bool: True if the operation completed, False on timeout
+        """
+        prefix = f'{command};' if command else ''
+        if method == 'auto':
+            method = 'srq' if hasattr(self.resource, 'wait_for_srq') else 'opc'
+        if method == 'srq':
+            # Operation complete sets the event status bit of the status byte,
+            # which is enabled to request service
+            self.resource.write('*CLS;*ESE 1;*SRE 32')
+            self.resource.write(f'{prefix}*OPC')
+            try:
+                self.resource.wait_for_srq(
+                    None if timeout is None else int(timeout*1000))
+            except visa.errors.VisaIOError:
+                return False
+            # Clears the event status register
+            self.resource.query('*ESR?')
+            return True
+        elif method == 'opc':
+            previous_timeout = self.resource.timeout
+            self.resource.timeout = None if timeout is None else timeout*1000
+            try:
+                self.resource.query(f'{prefix}*OPC?')
+            except visa.errors.VisaIOError:
+                return False
+            finally:
+                self.resource.timeout = previous_timeout
+            return True
+        elif method == 'poll':
+            self.resource.write(f'*CLS;{prefix}*OPC')
+            return self.wait_until(
+                lambda: int(self.resource.query('*ESR?')) & 1, timeout)
+        else:
+            print("ERROR : Invalid method specified (auto, srq, opc or poll)")
+            return False
+
+
+class _SpectrumAnalyzer(_GenericDevice):
+    """Behaviour shared by the spectrum analyzer drivers (trace format,
+    sweep settings and single sweeps). Drivers set the pattern of the models
+    supporting binary traces and the trace query of their command set."""
+    # Models supporting binary (REAL,32) trace transfer, matched against the
+    # short name parsed from *IDN?
+    binary_trace_models = None
+    # Query returning the trace data
+    trace_query = ':TRACe:DATA? TRACE1'
+
+    def __init__(self, addr: str = None, py_backend: bool = None,
+                 binary: bool = None):
+        """
+        :param bool binary: Transfer traces in binary (REAL,32) format.
+            Defaults to None (chosen from the model, ASCII as fallback)
+        """
+        super().__init__(addr=addr, py_backend=py_backend)
+        if binary is None:
+            binary = self.binary_trace_models is not None and re.match(
+                self.binary_trace_models,
+                getattr(self, 'short_name', '')) is not None
+        self.binary = binary
+
+    def set_trace_format(self):
+        """Sets the trace transfer format : 32 bit floats in little endian
+        byte order (native order of the host, no conversion needed) if
+        binary transfer is enabled, comma separated ASCII otherwise.
+        """
+        if self.binary:
+            self.configure({':FORMat:TRACe:DATA': 'REAL,32',
+                            ':FORMat:BORDer': 'SWAPped'})
+        else:
+            self.configure({':FORMat:TRACe:DATA': 'ASCii'})
+
+    def _configure_sweep(self, settings: dict, swt: float) -> int:
+        """Sends the sweep settings which changed since the last call (see
+        configure). The sweep time is only cached when set manually, as the
+        automatic one depends on the other settings.
+
+        :param dict settings: values by command header
+        :param float swt: sweep time in s, or 'auto'
+        :return: number of commands sent
+        :rtype: int
+        """
+        if swt != 'auto':
+            settings[':SENSe:SWEep:TIME'] = swt  # in s.
+        else:
+            settings[':SENSe:SWEep:TIME:AUTO'] = 'ON'
+        settings[':DISPlay:WINdow:TRACe:Y:SCALe:SPACing'] = 'LOGarithmic'
+        sent = self.configure(settings)
+        if swt != 'auto':
+            # Setting the sweep time turns the automatic sweep time off
+            self.settings[':SENSe:SWEep:TIME:AUTO'] = 'OFF'
+        else:
+            self.invalidate(':SENSe:SWEep:TIME')
+        return sent
+
+    def _sweep_timeout(self, trigstate: str) -> float:
+        """Maximum time to wait for a single sweep : twice the sweep time
+        (plus 1 s of margin), or no limit when waiting for an external trigger.
+
+        :param str trigstate: Trigger source as returned by the instrument
+        :return: timeout in s
+        :rtype: float
+        """
+        if trigstate == 'EXT':
+            return None
+        return 2*float(self.query_setting(':SENSe:SWEep:TIME')) + 1
+
+    def _single_sweep(self, timeout: float = None, barrier=None):
+        """Initiates a single sweep, armed together with the other parties
+        of barrier if any, and waits for its completion.
+
+        :param float timeout: Maximum waiting time in s, see _sweep_timeout
+        :param barrier: Barrier shared with the instruments to arm together
+        """
+        command = ':INITiate:IMMediate'
+        if barrier is not None:
+            # The response confirms that the scan was initiated
+            self._arm(command + ';*STB?', barrier)
+            command = None
+            print(f'{self.short_name} | Waiting for trigger as of {time()} s')
+        # Initiate the scan and wait for its completion
+        if not self.wait_for_completion(command, timeout=timeout):
+            print(f'{self.short_name} | ERROR : Scan did not complete')
+
+    def _measure(self, settings: dict, swt: float, trig: bool,
+                 single: bool, barrier, name: str,
+                 opc: bool = False) -> np.ndarray:
+        """Sequence shared by zero_span and span : sends the settings which
+        changed since the last call and the trigger source, runs a single
+        sweep or keeps sweeping continuously, reads the trace, then puts the
+        trigger source and the sweep mode back in their initial state.
+
+        :param dict settings: frequency and bandwidth values by command header
+        :param float swt: sweep time in s, or 'auto'
+        :param bool trig: External trigger, None to keep the current source
+        :param bool single: Single sweep mode, continuous otherwise
+        :param barrier: Barrier shared with the instruments to arm together
+        :param str name: Name of the measurement in the messages
+        :param bool opc: Wait for the settings to complete with *OPC?
+        :return: trace data
+        :rtype: np.ndarray
+        """
+        # Only the settings which changed since the last call are sent, in
+        # one message
+        self.sync_settings()
+        with self.batch(opc=opc):
+            self._configure_sweep(settings, swt)
+            if trig is not None:
+                trigstate = self.query_setting(':TRIGger:SEQuence:SOURce')
+                istrigged = trigstate != 'IMM' # whether SA is initially triggered
+                # If trigger true and initial trigger type IMMediate, then set to EXTernal
+                if trig and not (istrigged):
+                    self.configure({':TRIGger:SEQuence:SOURce': 'EXT',
+                                    ':TRIGger:SEQuence:EXTernal:SLOPe': 'POSitive'})
+                # If trigger false and initial trigger type not IMMediate, set to IMMediate
+                elif not (trig) and istrigged:
+                    self.configure({':TRIGger:SEQuence:SOURce': 'IMM'})
+        set_trigstate = self.query_setting(':TRIGger:SEQuence:SOURce')
+
+        # Query current instrument sweep state
+        sweep_state = int(self.query_setting(':INITiate:CONTinuous'))
+        if not single:
+            if sweep_state == 0:
+                # Put into continous
+                self.configure({':INITiate:CONTinuous': 1})
+            triginfo_msg = ' with trigger' if set_trigstate == 'EXT' else ''
+            print(f'{self.short_name} | Getting {name} (continuous sweep mode' +
+                  triginfo_msg + ')')
+        else:
+            self.resource.write('*CLS') # Reset status registers, clear error queue
+            if sweep_state == 1:
+                # Put into single
+                self.configure({':INITiate:CONTinuous': 0})
+            elif trig:
+                # Must reset trigger just before initiating scan, otherwise
+                # it seems trigger success condition is stored, because scan
+                # starts immediately instead of waiting for next trigger.
+                # Sent even if cached, the cache keeps its value.
+                self.invalidate(':TRIGger:SEQuence:SOURce')
+                self.configure({':TRIGger:SEQuence:SOURce': 'EXT'})
+            triginfo_msg = ' on trigger' if set_trigstate == 'EXT' else ''
+            print(f'{self.short_name} | Getting {name} (single sweep' +
+                  triginfo_msg + ')')
+            timeout = self._sweep_timeout(set_trigstate)
+            self._single_sweep(timeout, barrier)
+        self.set_trace_format()
+        data = self.query_data()
+        # If SA was trigged before, put it back in the same state
+        if trig is not None:
+            if not (trig) and istrigged:
+                self.configure({':TRIGger:SEQuence:SOURce': trigstate})
+        # Put SA back into the state it started in
+        self.configure({':INITiate:CONTinuous': sweep_state})
+        return data
+
+    def query_data(self) -> np.ndarray:
+        """Lower level function to grab the data from the SpecAnalyzer
+        The trace format must have been set with set_trace_format.
+
+        :return: data
+        :rtype: np.ndarray
+
+        """
+        if self.binary:
+            return self.resource.query_binary_values(self.trace_query,
+                                                     datatype='f',
+                                                     is_big_endian=False,
+                                                     container=np.array)
+        rawdata = self.resource.query(self.trace_query)
+        return parse_ascii_block(rawdata)
@@ -0,0 +1,143 @@
+"""
+Synchronized acquisition on several instruments.
+
+The Orchestrator arms all the instruments of an acquisition plan at the
+same time, waits for their completion and reads their results back
+concurrently, and reports the timing of each instrument :
+
+    orchestrator = Orchestrator({'scope': scope, 'sa': sa})
+    shot = orchestrator.acquire({
+        'scope': ('get_waveform_raw', {'channels': [1, 2], 'single': True}),
+        'sa': ('zero_span', {'center': 1e6, 'single': True})})
+    times, data = shot.results['scope']
+    print(shot.arm_skew, shot.timing['sa'])
+"""
+import asyncio
+import inspect
+import os
+import sys
+import threading
+from collections import namedtuple
+from time import perf_counter
+
+# Directory containing GenericDevice must be in path
+# Add parent directory of current file to path
+parent_directory = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, parent_directory)
+from AsyncInterface import ArmBarrier, AsyncDevice
+
+# Result of Orchestrator.acquire
+Shot = namedtuple('Shot', ['results', 'timing', 'arm_skew', 'duration'])
+
+
+class _TimedBarrier(ArmBarrier):
+    """ArmBarrier recording when the arming command of each thread was
+    acknowledged by its instrument, so that the arm skew includes the
+    latency of the SCPI round trips."""
+    def __init__(self, parties: int, timeout: float = None):
+        super().__init__(parties, timeout=timeout)
+        self.acknowledged = {}
+
+    def armed(self):
+        self.acknowledged[threading.get_ident()] = perf_counter()
+
+
+class Orchestrator:
+    """Runs acquisition plans on a set of connected instruments.
+    Each instrument runs in its own thread : the single shot methods
+    accepting a barrier argument are armed together, then all the
+    instruments wait for completion and transfer their data in parallel,
+    so that the wall time of a shot is the one of the slowest instrument.
+    """
+    def __init__(self, instruments: dict, arm_timeout: float = 60):
+        """
+        :param dict instruments: Connected instruments (blocking or
+            AsyncDevice) by name
+        :param float arm_timeout: Maximum time in s the instruments wait for
+            each other before arming, defaults to 60
+        """
+        self.instruments = {}
+        for name, device in instruments.items():
+            if not isinstance(device, AsyncDevice):
+                device = AsyncDevice(device)
+            self.instruments[name] = device
+        self.arm_timeout = arm_timeout
+
+    def acquire(self, plan: dict) -> Shot:
+        """Runs one shot of an acquisition plan, see acquire_async.
+        Not to be called from a running event loop.
+        """
+        return asyncio.run(self.acquire_async(plan))
+
+    async def acquire_async(self, plan: dict) -> Shot:
+        """Runs one shot of an acquisition plan.
+        Instruments whose method accepts a barrier and is called with
+        single=True are armed together.
+
+        :param dict plan: (method name, keyword arguments) by instrument name
+        :return: Shot with the results by instrument name, the timing by
+            instrument name (start, armed and end times in s relative to the
+            start of the shot, armed being when the instrument acknowledged
+            its arming command, and duration), the arm skew in s (spread of
+            the arm times) and the total duration in s
+        :rtype: Shot
+        """
+        synchronized = []
+        for name, (method, kwargs) in plan.items():
+            device = self.instruments[name].device
+            parameters = inspect.signature(getattr(device, method)).parameters
+            if 'barrier' in parameters and kwargs.get('single', False):
+                synchronized.append(name)
+        barrier = None
+        if len(synchronized) > 1:
+            barrier = _TimedBarrier(len(synchronized),
+                                    timeout=self.arm_timeout)
+        threads = {}
+
+        def call(name, method, kwargs):
+            threads[name] = threading.get_ident()
+            start = perf_counter()
+            result = getattr(self.instruments[name].device, method)(**kwargs)
+            return result, start, perf_counter()
+
+        async def run(name, method, kwargs):
+            if barrier is not None and name in synchronized:
+                kwargs = dict(kwargs, barrier=barrier)
+            try:
+                return await self.instruments[name].run(call, name, method,
+                                                        kwargs)
+            except BaseException:
+                # Do not leave the other instruments waiting to arm
+                if barrier is not None:
+                    barrier.abort()
+                raise
+
+        t0 = perf_counter()
+        outputs = await asyncio.gather(*(run(name, method, kwargs)
+                                         for name, (method, kwargs)
+                                         in plan.items()))
+        duration = perf_counter() - t0
+        results = {}
+        timing = {}
+        armed = []
+        for name, (result, start, end) in zip(plan, outputs):
+            results[name] = result
+            arm = None
+            if barrier is not None and threads[name] in barrier.acknowledged:
+                arm = barrier.acknowledged[threads[name]] - t0
+                armed.append(arm)
+            timing[name] = {'start': start - t0, 'armed': arm,
+                            'end': end - t0, 'duration': end - start}
+        arm_skew = max(armed) - min(armed) if len(armed) > 1 else 0.0
+        if len(armed) > 1:
+            print(f"Orchestrator | Armed {', '.join(synchronized)} with " +
+                  f"{arm_skew*1e3:.3f} ms skew")
+        print(f"Orchestrator | Shot complete in {duration:.3f} s")
+        return Shot(results, timing, arm_skew, duration)
+
+    def close(self):
+        """Closes all the instruments."""
+        async def close_all():
+            await asyncio.gather(*(device.close() for device
+                                   in self.instruments.values()))
+        asyncio.run(close_all())
@@ -0,0 +1,333 @@
+"""
+Streaming reducers for deep memory captures.
+
+Reducers compute statistics of a waveform block by block as it is read
+from the oscilloscope, so that the full waveform never has to be held in
+memory. Most of them work directly on the raw codes, and only scale their
+result to volts. Their partial states can be merged, e.g. to accumulate
+several captures :
+
+    reductions = scope.get_waveform_raw(
+        [1, 2], single=True,
+        reducers={'stats': Statistics(), 'hist': Histogram(),
+                  'envelope': Envelope(1000), 'edges': Crossings(0.5),
+                  'psd': Spectrum(4096)})
+    print(reductions[1]['stats'].result()['rms'])
+    total = reductions[1]['edges']
+    total.merge(next_reductions[1]['edges'])
+"""
+import abc
+import copy
+
+import numpy as np
+
+
+class Reducer(abc.ABC):
+    """Base class of the reducers.
+    start is called with the preamble of the channel before the first block,
+    then update with each block in order. Reducers with codes = True receive
+    the raw codes, the others the voltages.
+    """
+    codes = False
+
+    def __init__(self):
+        self.scale = 1.0
+        self.offset = 0.0
+
+    def start(self, preamble):
+        """Keeps the scaling of the channel, volts = (code - offset)*scale.
+
+        :param preamble: _Preamble of the channel
+        """
+        self.scale = preamble.y_inc
+        self.offset = preamble.y_orig + preamble.y_ref
+
+    def to_volts(self, codes):
+        return (np.asarray(codes, dtype=np.float64) - self.offset)*self.scale
+
+    @abc.abstractmethod
+    def update(self, offset: int, block: np.ndarray):
+        """
+        :param int offset: Index of the first point of the block
+        :param np.ndarray block: Codes or voltages
+        """
+
+    @abc.abstractmethod
+    def merge(self, other):
+        """Adds the partial state of another reducer of the same kind.
+
+        :param Reducer other: Reducer fed with other blocks
+        :return: self
+        """
+
+    @abc.abstractmethod
+    def result(self):
+        """Result of the points fed so far."""
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+
+class Histogram(Reducer):
+    """Number of points of each code (np.bincount of the codes)."""
+    codes = True
+
+    def __init__(self):
+        super().__init__()
+        self.counts = None
+
+    def update(self, offset: int, block: np.ndarray):
+        # 256 codes in BYTE format, 65536 in WORD format
+        counts = np.bincount(block, minlength=np.iinfo(block.dtype).max + 1)
+        if self.counts is None:
+            self.counts = counts
+        else:
+            self.counts += counts
+
+    def merge(self, other):
+        if other.counts is not None:
+            if self.counts is None:
+                self.counts = other.counts.copy()
+            else:
+                self.counts += other.counts
+        return self
+
+    def result(self) -> tuple:
+        """
+        :return: voltage of each code, number of points
+        :rtype: tuple
+        """
+        return self.to_volts(np.arange(len(self.counts))), self.counts
+
+
+class Statistics(Histogram):
+    """Number of points, mean, RMS, standard deviation, minimum and maximum,
+    computed exactly from the histogram of the codes."""
+
+    def result(self) -> dict:
+        volts, counts = super().result()
+        points = counts.sum()
+        present = np.flatnonzero(counts)
+        mean = np.dot(counts, volts)/points
+        rms = np.sqrt(np.dot(counts, volts**2)/points)
+        return {'points': int(points), 'mean': mean, 'rms': rms,
+                'std': np.sqrt(max(0.0, rms**2 - mean**2)),
+                'min': volts[present[0]], 'max': volts[present[-1]]}
+
+
+class Mean(Histogram):
+    def result(self) -> float:
+        volts, counts = super().result()
+        return np.dot(counts, volts)/counts.sum()
+
+
+class RMS(Histogram):
+    def result(self) -> float:
+        volts, counts = super().result()
+        return np.sqrt(np.dot(counts, volts**2)/counts.sum())
+
+
+class Envelope(Reducer):
+    """Minimum and maximum of each group of points_per_bin consecutive
+    points, e.g. to plot a decimated view of a deep capture."""
+    codes = True
+
+    def __init__(self, points_per_bin: int = 1000):
+        """
+        :param int points_per_bin: Number of points per bin
+        """
+        super().__init__()
+        self.points_per_bin = int(points_per_bin)
+        self.mins = np.empty(0, dtype=np.int64)
+        self.maxs = np.empty(0, dtype=np.int64)
+
+    def _grow(self, bins: int):
+        if bins > len(self.mins):
+            extra = bins - len(self.mins)
+            self.mins = np.concatenate(
+                (self.mins, np.full(extra, np.iinfo(np.int64).max)))
+            self.maxs = np.concatenate(
+                (self.maxs, np.full(extra, np.iinfo(np.int64).min)))
+
+    def update(self, offset: int, block: np.ndarray):
+        size = self.points_per_bin
+        # Starts of the bins within the block, the first one may be partial
+        first = -offset % size
+        starts = np.arange(first, len(block), size)
+        if first != 0:
+            starts = np.concatenate(([0], starts))
+        bins = (offset + starts)//size
+        self._grow(bins[-1] + 1)
+        np.minimum.at(self.mins, bins, np.minimum.reduceat(block, starts))
+        np.maximum.at(self.maxs, bins, np.maximum.reduceat(block, starts))
+
+    def merge(self, other):
+        self._grow(len(other.mins))
+        bins = len(other.mins)
+        np.minimum(self.mins[:bins], other.mins, out=self.mins[:bins])
+        np.maximum(self.maxs[:bins], other.maxs, out=self.maxs[:bins])
+        return self
+
+    def result(self) -> tuple:
+        """
+        :return: minimum and maximum voltages of each bin
+        :rtype: tuple
+        """
+        return self.to_volts(self.mins), self.to_volts(self.maxs)
+
+
+class Crossings(Reducer):
+    """Number of crossings of a threshold, with hysteresis : a rising edge
+    goes above threshold + hysteresis/2 after being below
+    threshold - hysteresis/2. Blocks must be fed (and reducers merged) in
+    order."""
+    codes = True
+
+    def __init__(self, threshold: float = 0.0, hysteresis: float = 0.0,
+                 edge: str = 'rising'):
+        """
+        :param float threshold: Threshold in V
+        :param float hysteresis: Hysteresis in V
+        :param str edge: 'rising', 'falling' or 'both'
+        :raises ValueError: if edge is invalid
+        """
+        super().__init__()
+        if edge not in ('rising', 'falling', 'both'):
+            raise ValueError(f"Invalid edge {edge!r} (rising, falling or "
+                             "both)")
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.edge = edge
+        self.count = 0
+        # State (1 above, 0 below, -1 unknown) at the start and at the end of
+        # the points fed so far
+        self.first = -1
+        self.state = -1
+
+    def _edges(self, previous: np.ndarray, states: np.ndarray) -> int:
+        count = 0
+        if self.edge in ('rising', 'both'):
+            count += np.count_nonzero((previous == 0) & (states == 1))
+        if self.edge in ('falling', 'both'):
+            count += np.count_nonzero((previous == 1) & (states == 0))
+        return count
+
+    def update(self, offset: int, block: np.ndarray):
+        # Thresholds in codes
+        high = (self.threshold + self.hysteresis/2)/self.scale + self.offset
+        low = (self.threshold - self.hysteresis/2)/self.scale + self.offset
+        decided = np.full(len(block), -1, dtype=np.int8)
+        decided[block >= high] = 1
+        decided[block <= low] = 0
+        # Points between the thresholds keep the last decided state
+        index = np.where(decided >= 0, np.arange(len(block)), -1)
+        np.maximum.accumulate(index, out=index)
+        states = np.where(index >= 0, decided[index], self.state)
+        if len(states) == 0:
+            return
+        previous = np.concatenate(([self.state], states[:-1]))
+        self.count += self._edges(previous, states)
+        if self.first < 0:
+            known = np.flatnonzero(states >= 0)
+            if len(known) > 0:
+                self.first = states[known[0]]
+        self.state = states[-1]
+
+    def merge(self, other):
+        """Adds the crossings of the points following those of self."""
+        self.count += other.count + self._edges(np.array([self.state]),
+                                                np.array([other.first]))
+        if self.first < 0:
+            self.first = other.first
+        if other.state >= 0:
+            self.state = other.state
+        return self
+
+    def result(self) -> int:
+        return self.count
+
+
+class Spectrum(Reducer):
+    """Power spectral density in V²/Hz, averaged over consecutive segments
+    of segment points (Welch's method with a Hann window and no overlap).
+    Works on the voltages. The points left after the last complete segment
+    (of the capture, or of each merged reducer) are ignored."""
+
+    def __init__(self, segment: int = 4096):
+        """
+        :param int segment: Number of points per segment
+        """
+        super().__init__()
+        self.segment = int(segment)
+        # Periodic window, as used for spectral analysis
+        self.window = np.hanning(self.segment + 1)[:-1]
+        self.x_inc = 1.0
+        self.power = np.zeros(self.segment//2 + 1)
+        self.segments = 0
+        # Points of the incomplete segment at the end of the last block
+        self.pending = np.empty(0)
+
+    def start(self, preamble):
+        super().start(preamble)
+        self.x_inc = preamble.x_inc
+
+    def update(self, offset: int, block: np.ndarray):
+        if len(self.pending) > 0:
+            block = np.concatenate((self.pending, block))
+        segments = len(block)//self.segment
+        if segments > 0:
+            frames = block[:segments*self.segment].reshape(segments,
+                                                           self.segment)
+            self.power += (np.abs(np.fft.rfft(frames*self.window,
+                                              axis=1))**2).sum(axis=0)
+            self.segments += segments
+        self.pending = np.array(block[segments*self.segment:],
+                                dtype=np.float64)
+
+    def merge(self, other):
+        self.power += other.power
+        self.segments += other.segments
+        return self
+
+    def result(self) -> tuple:
+        """
+        :return: frequencies in Hz, power spectral density in V²/Hz (NaN
+            if not a single segment was complete)
+        :rtype: tuple
+        """
+        freqs = np.fft.rfftfreq(self.segment, self.x_inc)
+        if self.segments == 0:
+            return freqs, np.full(len(freqs), np.nan)
+        psd = self.power/self.segments*self.x_inc/np.sum(self.window**2)
+        # One-sided : the power of the negative frequencies is folded, except
+        # for the DC and Nyquist bins
+        psd[1:] *= 2
+        if self.segment % 2 == 0:
+            psd[-1] /= 2
+        return freqs, psd
+
+
+def feeder(reducers: dict, preamble, dtype=np.float64):
+    """Starts the reducers of a channel and returns the function feeding
+    them a block of codes, scaling it to volts once for the reducers which
+    need it (see Scope._read_memory).
+
+    :param dict reducers: Reducers by name
+    :param preamble: _Preamble of the channel
+    :param dtype: Floating point type of the voltages
+    :return: function called as feed(offset, block)
+    :rtype: callable
+    """
+    for reducer in reducers.values():
+        reducer.start(preamble)
+
+    def feed(offset: int, block: np.ndarray):
+        volts = None
+        for reducer in reducers.values():
+            if reducer.codes:
+                reducer.update(offset, block)
+            else:
+                if volts is None:
+                    volts = preamble.normalize(block, dtype=dtype)
+                reducer.update(offset, volts)
+    return feed
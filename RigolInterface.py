@@ -1,8 +1,15 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from time import sleep, time
+import pyvisa as visa
+from collections import namedtuple
+from time import time, perf_counter, sleep
+import hashlib
+import json
 import os
+import queue
+import re
 import sys
+import threading
 
 # Directory containing GenericDevice must be in path
 # Add parent directory of current file to path
@@ -10,7 +17,8 @@ parent_directory = os.path.dirname(os.path.realpath(__file__))
 sys.path.insert(0, parent_directory)
 # Add also directory two levels up
 sys.path.insert(0, os.path.dirname(parent_directory))
-from GenericDevice import _GenericDevice
+from GenericDevice import _GenericDevice, _SpectrumAnalyzer
+from Reducers import feeder
 
 plt.ioff()
 
@@ -69,27 +77,416 @@ class _Preamble:
         self.x_orig = float(elems[5])
         self.x_ref = float(elems[6])
         self.y_inc = float(elems[7])
-        self.y_orig = int(elems[8])
-        self.y_ref = int(elems[9])
+        self.y_orig = float(elems[8])
+        self.y_ref = float(elems[9])
 
-    def normalize(self, raw_y):
-        yvals = raw_y.astype(np.float64)
-        yvals -= (self.y_orig + self.y_ref)
+    def normalize(self, raw_y, out: np.ndarray = None, dtype=np.float64):
+        """Converts raw waveform codes to volts.
+
+        Args:
+            raw_y (np.ndarray): raw codes as returned by :WAV:DATA?
+            out (np.ndarray, optional): preallocated float array in which
+                the result is written. Defaults to None (a new array is
+                allocated).
+            dtype (optional): Floating point type of the new array.
+                Defaults to np.float64.
+
+        Returns:
+            np.ndarray: voltages
+        """
+        if out is None:
+            out = np.empty(len(raw_y), dtype=dtype)
+        # Offset of the same type as out, so that float32 is computed in
+        # float32
+        offset = out.dtype.type(self.y_orig + self.y_ref)
+        yvals = np.subtract(raw_y, offset, out=out)
         yvals *= self.y_inc
         return yvals
 
-    def x_values(self):
-        xvals = np.linspace(0, self.points-1, self.points)
+    def x_values(self, points: int = None, start: int = 0, step: int = 1):
+        """Times of the points start, start+step, ... of the waveform.
+
+        Args:
+            points (int, optional): Number of points. Defaults to None (the
+                number of points of the preamble).
+            start (int, optional): Index of the first point. Defaults to 0.
+            step (int, optional): Step between points. Defaults to 1.
+
+        Returns:
+            np.ndarray: times
+        """
+        if points is None:
+            points = self.points
+        xvals = np.arange(points, dtype=np.float64)
+        xvals *= step
+        xvals += start
         xvals *= self.x_inc
         xvals += self.x_ref
         # xvals += self.x_orig
         return xvals
 
+# Maximum number of points returned by a single :WAV:DATA? request when
+# reading the internal memory, per model family and waveform format.
+# Models are matched against the short name parsed from *IDN?.
+_MAX_BLOCK_POINTS = [
+    (r'(DS|MSO)1\d{3}Z', {'BYTE': 250000, 'WORD': 125000, 'ASC': 15625}),
+    (r'(DS|MSO)2\d{3}', {'BYTE': 250000, 'WORD': 125000, 'ASC': 15625}),
+    (r'(DS|MSO)5\d{3}', {'BYTE': 250000, 'WORD': 125000, 'ASC': 15625}),
+    # The MSO7000/DS7000 programming guide only states that the range depends
+    # on memory depth and format, larger blocks are accepted over TCPIP
+    (r'(DS|MSO)7\d{3}', {'BYTE': 1000000, 'WORD': 500000, 'ASC': 15625}),
+]
+_DEFAULT_BLOCK_POINTS = {'BYTE': 250000, 'WORD': 125000, 'ASC': 15625}
+# Data type of the points for the binary waveform formats
+_FORMAT_DTYPES = {'BYTE': np.uint8, 'WORD': np.uint16}
+# Statistics of the on-instrument measurements, by record field, as named
+# by :MEASure:STATistic:ITEM?
+_STATISTICS = {'current': 'CURRent', 'average': 'AVERages',
+               'maximum': 'MAXimum', 'minimum': 'MINimum',
+               'deviation': 'DEViation'}
+# Value returned for a measurement which cannot be made (e.g. the frequency
+# of a signal without edges)
+_INVALID_MEASUREMENT = 9.9e37
+
+
+def _readout_dtype(fmt: str, dtype) -> tuple:
+    """Checks the waveform format and returned data type of a readout.
+
+    Args:
+        fmt (str): Binary waveform format, 'BYTE' or 'WORD'
+        dtype: Floating point type of the voltages, or the type of the codes
+            of the format (np.uint8 for BYTE, np.uint16 for WORD) to get the
+            raw codes
+
+    Returns:
+        tuple: type of the codes, and whether the raw codes are returned.
+            None if the combination is not supported.
+    """
+    if fmt not in _FORMAT_DTYPES:
+        print("ERROR : Invalid format specified (BYTE or WORD)")
+        return None
+    codes_dtype = np.dtype(_FORMAT_DTYPES[fmt])
+    if np.dtype(dtype) == codes_dtype:
+        return codes_dtype, True
+    if np.dtype(dtype).kind != 'f':
+        print(f"ERROR : Invalid dtype specified (floating point or " +
+              f"{codes_dtype.name} for {fmt})")
+        return None
+    return codes_dtype, False
+
+# Frame yielded by Scope.stream
+Frame = namedtuple('Frame', ['index', 'timestamp', 'times', 'data',
+                             'dropped', 'duplicate'])
+# Result of Scope.record
+Record = namedtuple('Record', ['data', 'times', 'scale', 'offset', 'armed',
+                               'completed'])
+
+
+class Waveform:
+    """Waveforms of one or several channels sharing a time axis. The time
+    axis is only described by the time of the first point, the time
+    increment and the number of points, and built when accessed. Unpacks
+    like the Time, Data arrays returned by default, but with a single time
+    axis for all the channels :
+
+        waveform = scope.get_waveform_raw([1, 2], compact=True)
+        waveform.data  # Shape (channels, points)
+        times, data = waveform
+    """
+    def __init__(self, data: np.ndarray, x_orig: float, x_inc: float,
+                 channels: list, scale: np.ndarray = None,
+                 offset: np.ndarray = None):
+        """
+        :param np.ndarray data: Voltages, or raw codes if scale is given, of
+            shape (channels, points) or (points,) for a single channel
+        :param float x_orig: Time of the first point in s
+        :param float x_inc: Time between points in s
+        :param list channels: Channel numbers
+        :param np.ndarray scale: Volts per code of each channel, defaults to
+            None (data are voltages)
+        :param np.ndarray offset: Code of 0 V of each channel
+        """
+        self.data = data
+        self.x_orig = x_orig
+        self.x_inc = x_inc
+        self.channels = list(channels)
+        self.scale = scale
+        self.offset = offset
+
+    @classmethod
+    def from_preambles(cls, data: np.ndarray, preambles: list,
+                       channels: list, codes: bool = False):
+        """
+        :param np.ndarray data: Voltages or raw codes
+        :param list preambles: _Preamble of each channel
+        :param list channels: Channel numbers
+        :param bool codes: data are raw codes, the scaling of each channel is
+            kept
+        :return: the waveform
+        :rtype: Waveform
+        """
+        scale = offset = None
+        if codes:
+            scale = np.array([p.y_inc for p in preambles])
+            offset = np.array([p.y_orig + p.y_ref for p in preambles])
+        return cls(data, preambles[0].x_ref, preambles[0].x_inc, channels,
+                   scale, offset)
+
+    def volts(self, dtype=np.float64) -> np.ndarray:
+        """Voltages, (codes - offset)*scale for raw codes.
+
+        :param dtype: Floating point type of the voltages
+        :return: voltages
+        :rtype: np.ndarray
+        """
+        if self.scale is None:
+            return self.data.astype(dtype, copy=False)
+        scale = self.scale.astype(dtype)
+        offset = self.offset.astype(dtype)
+        if self.data.ndim > 1:
+            scale = scale[:, None]
+            offset = offset[:, None]
+        volts = np.subtract(self.data, offset, dtype=dtype)
+        volts *= scale
+        return volts
+
+    @property
+    def n(self) -> int:
+        return self.data.shape[-1]
+
+    @property
+    def times(self) -> np.ndarray:
+        times = np.arange(self.n, dtype=np.float64)
+        times *= self.x_inc
+        times += self.x_orig
+        return times
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __iter__(self):
+        return iter((self.times, self.data))
+
+
+class Capture:
+    """Raw codes of a deep memory capture stored in a memory-mapped .npy
+    file of shape (channels, points), together with the scaling parameters
+    of each channel (saved next to it as .json). Volts and times are only
+    computed on demand, for a slice of the capture, so that the capture
+    never has to fit in memory :
+
+        capture = scope.get_waveform_raw([1, 2], filename='shot.npy')
+        volts = capture.volts(1, 1000000, 2000000)  # Channel index, slice
+        times = capture.times(1000000, 2000000)
+        capture = Capture.load('shot.npy')  # Later on
+    """
+    def __init__(self, codes: np.ndarray, preambles: list, channels: list):
+        """
+        :param np.ndarray codes: Raw codes of shape (channels, points)
+        :param list preambles: _Preamble of each channel
+        :param list channels: Channel numbers
+        """
+        self.codes = codes
+        self.preambles = preambles
+        self.channels = list(channels)
+
+    @staticmethod
+    def metadata_file(filename: str) -> str:
+        return os.path.splitext(filename)[0] + '.json'
+
+    def save_metadata(self, filename: str):
+        """Writes the channels and scaling parameters next to the .npy file.
+
+        :param str filename: .npy file of the codes
+        """
+        with open(self.metadata_file(filename), 'w') as f:
+            json.dump({'channels': self.channels,
+                       'points': self.points,
+                       'preambles': [','.join(p.elems).strip()
+                                     for p in self.preambles]}, f)
+
+    @classmethod
+    def load(cls, filename: str):
+        """Opens a capture saved by Scope.get_waveform_raw, the codes are
+        memory-mapped read only.
+
+        :param str filename: .npy file of the codes
+        :return: the capture
+        :rtype: Capture
+        """
+        with open(cls.metadata_file(filename)) as f:
+            metadata = json.load(f)
+        codes = np.load(filename, mmap_mode='r')[:, :metadata['points']]
+        return cls(codes, [_Preamble(p) for p in metadata['preambles']],
+                   metadata['channels'])
+
+    @property
+    def points(self) -> int:
+        return self.codes.shape[1]
+
+    def __len__(self) -> int:
+        return self.points
+
+    def volts(self, index: int = 0, start: int = 0, stop: int = None,
+              step: int = 1, dtype=np.float64) -> np.ndarray:
+        """Voltages of a slice of one channel.
+
+        :param int index: Index of the channel in channels
+        :param int start: First point
+        :param int stop: Last point (excluded), defaults to None (end)
+        :param int step: Step between points
+        :param dtype: Floating point type of the voltages
+        :return: voltages
+        :rtype: np.ndarray
+        """
+        return self.preambles[index].normalize(
+            self.codes[index, start:stop:step], dtype=dtype)
+
+    def times(self, start: int = 0, stop: int = None,
+              step: int = 1) -> np.ndarray:
+        """Times of a slice of the capture, relative to the first point.
+
+        :param int start: First point
+        :param int stop: Last point (excluded), defaults to None (end)
+        :param int step: Step between points
+        :return: times in s
+        :rtype: np.ndarray
+        """
+        indices = range(*slice(start, stop, step).indices(self.points))
+        return self.preambles[0].x_values(len(indices), indices.start,
+                                          indices.step)
+
+    def __getitem__(self, key) -> np.ndarray:
+        """Voltages of capture[index] or capture[index, start:stop:step]."""
+        if isinstance(key, tuple):
+            index, points = key
+        else:
+            index, points = key, slice(None)
+        return self.volts(index, points.start or 0, points.stop,
+                          points.step or 1)
+
 class Scope(_GenericDevice):
+    # Throughput of the link in bytes/s assumed until a memory read measured
+    # it, see get_waveform_window
+    link_rate = 10e6
+
+    def __init__(self, addr: str = None, py_backend: bool = None):
+        super().__init__(addr=addr, py_backend=py_backend)
+        # Block sizes found by tune_block_size for this connection
+        self.block_points = {}
+        # (item, channel) of the measurements whose statistics are enabled
+        self._statistic_items = set()
+        # Maximum time in s for the trigger status to leave STOP after
+        # :SINGle (see _wait_for_stop), 0 if the firmware updates it before
+        # answering :SINGle;*OPC?
+        self.arm_timeout = 0.1
+
+    def invalidate(self, header: str = None):
+        """Forgets cached settings (see _GenericDevice.invalidate), and the
+        enabled measurement statistics when the whole cache is cleared."""
+        super().invalidate(header)
+        if header is None:
+            self._statistic_items.clear()
+
+    def max_block_points(self, fmt: str = 'BYTE') -> int:
+        """Maximum number of points to request per :WAV:DATA? query.
+        Uses the value found by tune_block_size for this connection if any,
+        otherwise the limit of the model (parsed from *IDN?).
+
+        Args:
+            fmt (str, optional): Waveform format. Defaults to 'BYTE'.
+
+        Returns:
+            int: block size in points
+        """
+        if fmt in self.block_points:
+            return self.block_points[fmt]
+        for pattern, limits in _MAX_BLOCK_POINTS:
+            if re.match(pattern, getattr(self, 'short_name', '')):
+                return limits[fmt]
+        return _DEFAULT_BLOCK_POINTS[fmt]
+
+    def tune_block_size(self, fmt: str = 'BYTE', candidates: list = None,
+                        channel: int = 1, points: int = None,
+                        repeats: int = 1) -> int:
+        """Measures the transfer rate of the internal memory readout for
+        several block sizes and remembers the fastest one for this connection.
+        The oscilloscope must be in STOP state with a waveform in memory.
+        Block sizes that time out (slow links) are discarded.
+
+        Args:
+            fmt (str, optional): Binary waveform format, 'BYTE' or 'WORD'.
+                Defaults to 'BYTE'.
+            candidates (list, optional): Block sizes in points to try.
+                Defaults to None (powers of two fractions of the model limit).
+            channel (int, optional): Channel used for the test. Defaults to 1.
+            points (int, optional): Number of points read per candidate.
+                Defaults to None (the largest candidate, limited by the memory
+                depth).
+            repeats (int, optional): Number of reads per candidate, the best
+                one is kept. Defaults to 1.
+
+        Returns:
+            int: best block size in points
+        """
+        self.block_points.pop(fmt, None)
+        limit = self.max_block_points(fmt)
+        if candidates is None:
+            candidates = [limit//2**k for k in range(5, -1, -1)]
+        candidates = sorted(c for c in candidates if 0 < c <= limit)
+        self.configure({':WAV:SOUR': f'CHAN{channel}', ':WAV:MODE': 'RAW',
+                        ':WAV:FORM': fmt})
+        # Points in memory, :ACQuire:MDEPth? may return AUTO
+        memory_depth = _Preamble(self.resource.query(':WAV:PRE?')).points
+        if points is None:
+            points = candidates[-1]
+        points = min(points, memory_depth)
+        buffer = np.empty(points, dtype=_FORMAT_DTYPES[fmt])
+        rates = {}
+        # Errors left by previous commands would reject the first candidate
+        self.write('*CLS')
+        for block_size in candidates:
+            duration = None
+            for _ in range(repeats):
+                t0 = perf_counter()
+                try:
+                    read = self._read_memory_into(buffer,
+                                                  block_size=block_size)
+                except visa.errors.VisaIOError:
+                    # Typically a timeout, the block is too large for the link
+                    self.resource.clear()
+                    duration = None
+                    break
+                elapsed = perf_counter() - t0
+                if duration is None or elapsed < duration:
+                    duration = elapsed
+            if duration is None:
+                print(f"{self.short_name} | Block size {block_size}: timeout")
+                continue
+            # Blocks larger than the instrument accepts are truncated and
+            # raise an error, read again as more, smaller blocks
+            error = self.resource.query(':SYSTem:ERRor?').strip()
+            if int(error.split(',')[0]) != 0 or read < points:
+                print(f"{self.short_name} | Block size {block_size}: " +
+                      f"rejected ({error}, {read}/{points} points)")
+                self.write('*CLS')
+                continue
+            rates[block_size] = read*buffer.itemsize/duration/1e6
+            print(f"{self.short_name} | Block size {block_size}: " +
+                  f"{rates[block_size]:.2f} MB/s")
+        if len(rates) == 0:
+            print("ERROR : No block size could be read without timeout")
+            return limit
+        best = max(rates, key=rates.get)
+        self.block_points[fmt] = best
+        return best
 
     def get_waveform_raw(self, channels: list = [1], memdepth: str | int = None,
                           single = False, plot: bool = False, ndivs: int = None, 
-                          barrier = None) -> np.ndarray:
+                          barrier = None, block_size: int = None,
+                          filename: str = None, compact: bool = False,
+                          fmt: str = 'BYTE', dtype=np.float64,
+                          reducers: dict = None) -> np.ndarray:
         """
         Gets the entire waveform data in the internal memory for a selection of channels
         (!) To retrieve long timescale waveforms, enable single trigger mode
@@ -104,9 +501,36 @@ class Scope(_GenericDevice):
                 ndivs is set by query to oscilloscope.
         :param <multiprocessing.Barrier> barrier (optional): Useful for
                 synchronizing multiple processes (measurements)
+        :param int block_size: Number of points per :WAV:DATA? request.
+                Defaults to None (see max_block_points).
+        :param str filename: .npy file in which the raw codes are written as
+                they arrive, instead of holding volts in memory. Defaults to
+                None.
+        :param bool compact: Return a Waveform, whose time axis is only
+                built when accessed, instead of Time, Data. Defaults to False.
+        :param str fmt: Waveform format, 'BYTE' or 'WORD' (models with more
+                than 8 bits). Defaults to 'BYTE'.
+        :param dtype: Floating point type of the voltages (e.g. np.float32),
+                or the type of the codes of fmt (np.uint8 for BYTE, np.uint16
+                for WORD) to get a Waveform of the raw codes and their
+                scaling. Defaults to np.float64.
+        :param dict reducers: Reducers by name (see Reducers), fed with each
+                block as it arrives instead of keeping the waveform. Each
+                channel gets its own copy. Defaults to None.
         :returns: Data, Time np.ndarrays containing the traces of shape
-            (channels, nbr of points) if len(channels)>1
+            (channels, nbr of points) if len(channels)>1, a Waveform if
+            compact or raw codes, a Capture if filename is specified, or
+            the reducers by name of each channel if reducers are specified.
+            The number of round trips used is stored in the
+            last_round_trips attribute.
         """
+        readout = _readout_dtype(fmt, dtype)
+        if readout is None:
+            return None
+        codes_dtype, raw = readout
+        if reducers is not None and filename is not None:
+            print("ERROR : Specify either filename or reducers")
+            return None
         no_channels = len(channels)
         if len(channels) > 4:
             print("ERROR : Invalid channel list provided" +
@@ -131,8 +555,7 @@ class Scope(_GenericDevice):
                 message+= f' Channel {chan}'
         print(message)
 
-        Data = []
-        Time = []
+        round_trips = self.resource.round_trips
         trig_status = self.resource.query(':TRIGger:STATus?')
 
         # Set memory depth if specified
@@ -169,96 +592,406 @@ class Scope(_GenericDevice):
 
         # Measure waveform, afterwards scope must be in STOP state to read from internal memory
         if single:
+            # *OPC? returns once :SINGle is processed, i.e. the scope is armed
+            self._arm(":SINGle;*OPC?", barrier)
             if barrier is not None:
-                barrier.wait()
-                self.resource.write(":SINGle")
                 print(f'{self.short_name} | Waiting for trigger as of {time()} s')
-            else:
-                self.resource.write(":SINGle")
-            if trig_status.replace('\n','') == "STOP":
-                # Wait for trig status to change from "STOP" before while loop
-                sleep(1)
-            while self.resource.query(':TRIGger:STATus?').replace('\n','') != 'STOP':
-                sleep(0.1)
+            self._wait_for_stop()
             print(f"{self.short_name} | Waveform complete as of {time()} s")
         else:
             self.resource.write(":STOP")
             
         # Transfer data from scope
-        for chan in channels:
-            self.resource.write(f":WAV:SOUR CHAN{chan}")
-            # Y origin for wav data
-            YORigin = self.resource.query_ascii_values(":WAV:YOR?")[0]
-            # Y REF for wav data
-            YREFerence = self.resource.query_ascii_values(":WAV:YREF?")[0]
-            # Y INC for wav data
-            YINCrement = self.resource.query_ascii_values(":WAV:YINC?")[0]
-            # X REF for wav data
-            XREFerence = self.resource.query_ascii_values(":WAV:XREF?")[0]
-            # X INC for wav data
-            XINCrement = self.resource.query_ascii_values(":WAV:XINC?")[0]
-            # Set the waveform reading mode to RAW.
-            self.resource.write(":WAV:MODE RAW")
-            # Set return format to Byte.
-            self.resource.write(":WAV:FORM BYTE")
-            # Set waveform read start to 0.
-            self.resource.write(":WAV:STAR 1")
-            if (memory_depth > 250000):
-                # Set waveform read stop to 250000.
-                self.resource.write(":WAV:STOP 250000")
+        # Every :WAV:DATA? block is scaled (or copied) into its slice of the
+        # result by a worker thread while the next block is transferred, see
+        # _read_memory, so that no intermediate Python list or full size
+        # buffer of codes is ever built.
+        if block_size is None:
+            block_size = self.max_block_points(fmt)
+        data_size = memory_depth
+        transfers = []
+        if filename is not None:
+            # Codes go straight from the blocks to the file, volts are
+            # computed on demand by the Capture
+            codes = np.lib.format.open_memmap(
+                filename, mode='w+', dtype=codes_dtype,
+                shape=(no_channels, memory_depth))
+            preambles = []
+            for n, chan in enumerate(channels):
+                self.configure({':WAV:SOUR': f'CHAN{chan}',
+                                ':WAV:MODE': 'RAW', ':WAV:FORM': fmt})
+                preambles.append(_Preamble(self.resource.query(":WAV:PRE?")))
+                points = self._read_memory_into(codes[n],
+                                                block_size=block_size)
+                transfers.append(self.last_transfer)
+                data_size = min(data_size, points)
+            self._report_transfers(transfers)
+            codes.flush()
+            capture = Capture(codes[:, :data_size], preambles, channels)
+            capture.save_metadata(filename)
+            if plot:
+                fig, ax = plt.subplots()
+                times_rescaled, tUnit = set_time_unit(capture.times())
+                [ax.plot(times_rescaled, capture.volts(n),
+                         label = f"Channel {chan}")
+                 for n, chan in enumerate(channels)]
+                ax.set_ylabel("Voltage (V)")
+                ax.set_xlabel("Time (" + tUnit + ")")
+                ax.set_xlim(times_rescaled[0], times_rescaled[-1])
+                ax.legend()
+                plt.show()
+            self.resource.write(":RUN")
+            self.last_round_trips = self.resource.round_trips - round_trips
+            return capture
+        if reducers is not None:
+            # Only the state of the reducers is kept
+            reductions = {}
+            for chan in channels:
+                self.configure({':WAV:SOUR': f'CHAN{chan}',
+                                ':WAV:MODE': 'RAW', ':WAV:FORM': fmt})
+                preamble = _Preamble(self.resource.query(":WAV:PRE?"))
+                reductions[chan] = {name: reducer.copy()
+                                    for name, reducer in reducers.items()}
+                feed = feeder(reductions[chan], preamble,
+                              np.float64 if raw else dtype)
+                self._read_memory(memory_depth, codes_dtype, feed,
+                                  block_size=block_size)
+                transfers.append(self.last_transfer)
+            self._report_transfers(transfers)
+            self.resource.write(":RUN")
+            self.last_round_trips = self.resource.round_trips - round_trips
+            return reductions
+        if raw:
+            # The codes are read directly into the result
+            Data = np.empty((no_channels, memory_depth), dtype=codes_dtype)
+        else:
+            Data = np.empty((no_channels, memory_depth), dtype=dtype)
+        preambles = []
+        for n, chan in enumerate(channels):
+            # Source, RAW mode and format are set in a single message
+            # (only the source when unchanged) and all the scaling parameters
+            # are read with one query
+            self.configure({':WAV:SOUR': f'CHAN{chan}', ':WAV:MODE': 'RAW',
+                            ':WAV:FORM': fmt})
+            preamble = _Preamble(self.resource.query(":WAV:PRE?"))
+            preambles.append(preamble)
+            if raw:
+                points = self._read_memory_into(Data[n],
+                                                block_size=block_size)
             else:
-                self.resource.write(f":WAV:STOP {int(memory_depth)}")
-            # Read data from the resource, excluding the first 9 bytes
-            # (TMC header).
-            rawdata = self.resource.query_binary_values(":WAV:DATA?",
-                                                        datatype='B')
-            sys.stdout.write(f"\rReading {len(rawdata)}/{memory_depth}")
-            # Check if memory depth is bigger than the first data extraction.
-            if (memory_depth > 250000):
-                # Find the maximum number of loops required to loop through all
-                # memory.
-                loopmax = int(np.ceil(memory_depth/250000))
-                for loopcount in range(1, loopmax):
-                    # Calculate the next start of the waveform in the internal
-                    # memory.
-                    start = (loopcount*250000)+1
-                    self.resource.write(f":WAV:STAR {start}")
-                    # Calculate the next stop of the waveform in the internal
-                    # memory
-                    stop = (loopcount+1)*250000
-                    sys.stdout.write(f"\rReading {stop}/{memory_depth}")
-                    self.resource.write(f":WAV:STOP {stop}")
-                    # Extent the rawdata variables with the new values.
-                    rawdata.extend(self.resource.query_binary_values(":WAV:DATA?",
-                                   datatype='B'))
-            data = (np.asarray(rawdata) - YORigin - YREFerence) * YINCrement
-            Data.append(data)
-            # Calculate data size for generating time axis
-            data_size = len(data)
-            # Create time axis
-            times = np.linspace(XREFerence, XINCrement*data_size, data_size)
-            Time.append(times)
+                def scale(offset, block, preamble=preamble, out=Data[n]):
+                    # Scale to volts in place
+                    preamble.normalize(block,
+                                       out=out[offset:offset + len(block)])
+                points = self._read_memory(memory_depth, codes_dtype, scale,
+                                           block_size=block_size)
+            transfers.append(self.last_transfer)
+            data_size = min(data_size, points)
+        self._report_transfers(transfers)
+        Data = Data[:, :data_size]
         if plot: 
             # Assumes waveforms all have same time axis
             fig, ax = plt.subplots()
-            times_rescaled, tUnit = set_time_unit(Time[0])
-            [ax.plot(times_rescaled, Data[n], label = f"Channel {chan}") for n, chan in enumerate(channels)]
+            times_rescaled, tUnit = set_time_unit(preamble.x_values(data_size))
+            volts = Data
+            if raw:
+                volts = Waveform.from_preambles(Data, preambles, channels,
+                                                codes=True).volts()
+            [ax.plot(times_rescaled, volts[n], label = f"Channel {chan}") for n, chan in enumerate(channels)]
             ax.set_ylabel("Voltage (V)")
             ax.set_xlabel("Time (" + tUnit + ")")
             ax.set_xlim(times_rescaled[0], times_rescaled[-1])
             ax.legend()
             plt.show()
         self.resource.write(":RUN")
-        Data = np.asarray(Data)
-        Time = np.asarray(Time)
+        self.last_round_trips = self.resource.round_trips - round_trips
+        if len(channels) == 1:
+            Data = Data[0, :]
+        if compact or raw:
+            return Waveform.from_preambles(Data, preambles, channels,
+                                           codes=raw)
+        # Create time axis
+        Time = np.asarray([preamble.x_values(data_size)]*no_channels)
+        if len(channels) == 1:
+            Time = Time[0, :]
+        return Time, Data
+
+    def _read_memory_into(self, out: np.ndarray, start: int = 1,
+                          block_size: int = 250000) -> int:
+        """Reads the internal memory of the current waveform source in blocks
+        and writes each :WAV:DATA? block directly into its slice of out.
+        The waveform mode and format must already be set.
+
+        Args:
+            out (np.ndarray): Preallocated buffer, its length sets the number
+                of points to read. Use np.uint8 for the BYTE format and
+                np.uint16 for the WORD format.
+            start (int, optional): First memory point (starting from 1).
+                Defaults to 1.
+            block_size (int, optional): Maximum number of points per
+                :WAV:DATA? request. Defaults to 250000.
+
+        Returns:
+            int: Number of points actually read
+        """
+        def copy(offset, block):
+            out[offset:offset + len(block)] = block
+        return self._read_memory(len(out), out.dtype, copy, start=start,
+                                 block_size=block_size)
+
+    def _read_memory(self, points: int, dtype, process, start: int = 1,
+                     block_size: int = 250000) -> int:
+        """Reads the internal memory of the current waveform source in
+        blocks. Each :WAV:DATA? block is handed to a worker thread, which
+        calls process on it while the request for the next block is already
+        on the wire, so that the link is not idle while the host decodes.
+        The waveform mode and format must already be set. The timing of the
+        read is stored in the last_transfer attribute (see
+        _report_transfers).
+
+        Args:
+            points (int): Number of points to read
+            dtype: Type of the codes, np.uint8 for the BYTE format and
+                np.uint16 for the WORD format
+            process (callable): Called as process(offset, block) with the
+                index of the first point of the block and its codes
+            start (int, optional): First memory point (starting from 1).
+                Defaults to 1.
+            block_size (int, optional): Maximum number of points per
+                :WAV:DATA? request. Defaults to 250000.
+
+        Returns:
+            int: Number of points actually read
+        """
+        # One block is decoded while the next one is transferred, and at
+        # most one more waits in between
+        blocks = queue.Queue(maxsize=1)
+        decoding = [0.0]
+        errors = []
+
+        def worker():
+            while True:
+                item = blocks.get()
+                if item is None:
+                    return
+                if errors:
+                    continue
+                t = perf_counter()
+                try:
+                    process(*item)
+                except Exception as e:
+                    errors.append(e)
+                decoding[0] += perf_counter() - t
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        read = 0
+        requests = 0
+        transfer = 0.0
+        t0 = perf_counter()
+        try:
+            while read < points and not errors:
+                stop = min(read + block_size, points)
+                t = perf_counter()
+                # Window and data request are sent as one program message
+                block = self.resource.query_binary_values(
+                    f":WAV:STAR {start + read};:WAV:STOP {start + stop - 1};" +
+                    ":WAV:DATA?", datatype=np.dtype(dtype).char,
+                    container=np.array)
+                transfer += perf_counter() - t
+                requests += 1
+                size = min(len(block), points - read)
+                if size == 0:
+                    break
+                blocks.put((read, block[:size]))
+                read += size
+        finally:
+            blocks.put(None)
+            thread.join()
+        if errors:
+            raise errors[0]
+        duration = perf_counter() - t0
+        if read*np.dtype(dtype).itemsize >= 1e6 and transfer > 0:
+            self.link_rate = read*np.dtype(dtype).itemsize/transfer
+        self.last_transfer = {
+            'points': read, 'bytes': read*np.dtype(dtype).itemsize,
+            'blocks': requests, 'duration': duration, 'transfer': transfer,
+            'decoding': decoding[0],
+            'overlap': max(0.0, transfer + decoding[0] - duration)}
+        return read
+
+    def _report_transfers(self, transfers: list):
+        """Sums the timing of several _read_memory calls into the
+        last_transfer attribute and prints the throughput and the fraction of
+        the decoding which overlapped with the transfers.
+
+        Args:
+            transfers (list): last_transfer of each call
+        """
+        total = {key: sum(t[key] for t in transfers) for key in transfers[0]}
+        self.last_transfer = total
+        rate = total['bytes']/total['duration']/1e6 if total['duration'] else 0
+        overlapped = 1.0
+        if total['decoding'] > 0:
+            overlapped = min(1.0, total['overlap']/total['decoding'])
+        print(f"{self.short_name} | Read {total['points']} points in " +
+              f"{total['duration']:.3f} s ({rate:.1f} MB/s, " +
+              f"{overlapped:.0%} of decoding overlapped with transfers)")
+
+    def get_waveform_window(self, channels: list = [1], t_start: float = None,
+                            t_stop: float = None, stride: int = 1,
+                            points: int = None, single: bool = False,
+                            barrier = None, block_size: int = None,
+                            compact: bool = False, fmt: str = 'BYTE',
+                            dtype=np.float64) -> np.ndarray:
+        """Reads a time window of the internal memory, optionally keeping
+        one point out of stride. Only the memory points spanning the window
+        are requested (:WAV:STARt/:WAV:STOP), so that reading an edge around
+        the trigger transfers kilobytes instead of the whole memory.
+        The RAW mode has no hardware decimation : strided points are picked
+        from the blocks of the range spanning them as they arrive, or read
+        one by one when the round trips this takes (timed on the preamble
+        query) cost less than transferring the range (at link_rate).
+
+        Args:
+            channels (list, optional): List of channels. Defaults to [1].
+            t_start (float, optional): Start of the window in s, relative to
+                the trigger. Defaults to None (start of the memory).
+            t_stop (float, optional): End of the window in s, relative to
+                the trigger. Defaults to None (end of the memory).
+            stride (int, optional): Step between the points read. Defaults
+                to 1.
+            points (int, optional): Number of points to read in the window,
+                sets the stride. Defaults to None (see stride).
+            single (bool, optional): Use single trigger mode. Defaults to
+                False.
+            barrier (<multiprocessing.Barrier>, optional): Useful for
+                synchronizing multiple processes (measurements)
+            block_size (int, optional): Number of points per :WAV:DATA?
+                request. Defaults to None (see max_block_points).
+            compact (bool, optional): Return a Waveform, whose time axis is
+                only built when accessed. Defaults to False.
+            fmt (str, optional): Waveform format, 'BYTE' or 'WORD'. Defaults
+                to 'BYTE'.
+            dtype (optional): Floating point type of the voltages, or the
+                type of the codes of fmt to get a Waveform of the raw codes.
+                Defaults to np.float64.
+
+        Returns:
+            np.ndarray: Data, Time (times relative to the trigger), or a
+                Waveform if compact or raw codes. The number of round trips
+                used is stored in the last_round_trips attribute.
+        """
+        readout = _readout_dtype(fmt, dtype)
+        if readout is None:
+            return None
+        codes_dtype, raw = readout
+        if len(channels) > 4 or any(chan > 4 for chan in channels):
+            print("ERROR : Invalid channel list provided" +
+                  " (Channels are 1,2,3,4)")
+            return None
+        round_trips = self.resource.round_trips
+        # Measure waveform, afterwards scope must be in STOP state to read from internal memory
+        if single:
+            # *OPC? returns once :SINGle is processed, i.e. the scope is armed
+            self._arm(":SINGle;*OPC?", barrier)
+            self._wait_for_stop()
+            print(f"{self.short_name} | Waveform complete as of {time()} s")
+        else:
+            self.resource.write(":STOP")
+        if block_size is None:
+            block_size = self.max_block_points(fmt)
+        Data = None
+        preambles = []
+        transfers = []
+        for n, chan in enumerate(channels):
+            self.configure({':WAV:SOUR': f'CHAN{chan}', ':WAV:MODE': 'RAW',
+                            ':WAV:FORM': fmt})
+            t0 = perf_counter()
+            preamble = _Preamble(self.resource.query(":WAV:PRE?"))
+            round_trip = perf_counter() - t0
+            preambles.append(preamble)
+            if Data is None:
+                # Memory indices (from 0) of the window, time of point i is
+                # x_orig + (i - x_ref)*x_inc
+                first, last = 0, preamble.points - 1
+                if t_start is not None:
+                    first = max(first, int(np.ceil(
+                        (t_start - preamble.x_orig)/preamble.x_inc
+                        + preamble.x_ref - 1e-9)))
+                if t_stop is not None:
+                    last = min(last, int(np.floor(
+                        (t_stop - preamble.x_orig)/preamble.x_inc
+                        + preamble.x_ref + 1e-9)))
+                if first > last:
+                    print("ERROR : The window does not contain any point")
+                    self.resource.write(":RUN")
+                    return None
+                if points is not None:
+                    stride = max(1, int(np.ceil((last - first + 1)/points)))
+                count = (last - first)//stride + 1
+                Data = np.empty((len(channels), count),
+                                dtype=codes_dtype if raw else dtype)
+                print(f"{self.short_name} | Reading {count} points out of " +
+                      f"{last - first + 1} from point {first + 1}")
+
+            def store(index, block, preamble=preamble, out=Data[n]):
+                if raw:
+                    out[index:index + len(block)] = block
+                else:
+                    preamble.normalize(block,
+                                       out=out[index:index + len(block)])
+
+            def pick(offset, block, store=store):
+                # Points of the block which are multiples of stride from the
+                # start of the window
+                skip = -offset % stride
+                store((offset + skip)//stride, block[skip::stride])
+
+            span = (count - 1)*stride + 1
+            range_cost = (np.ceil(span/block_size)*round_trip +
+                          span*codes_dtype.itemsize/self.link_rate)
+            if stride > 1 and count*round_trip < range_cost:
+                t0 = perf_counter()
+                for k in range(count):
+                    index = first + k*stride + 1
+                    block = self.resource.query_binary_values(
+                        f":WAV:STAR {index};:WAV:STOP {index};:WAV:DATA?",
+                        datatype=codes_dtype.char, container=np.array)
+                    store(k, block[:1])
+                duration = perf_counter() - t0
+                self.last_transfer = {
+                    'points': count, 'bytes': count*codes_dtype.itemsize,
+                    'blocks': count, 'duration': duration,
+                    'transfer': duration,
+                    'decoding': 0.0, 'overlap': 0.0}
+            else:
+                # Minimal range holding the points of the window
+                self._read_memory(span, codes_dtype, pick, start=first + 1,
+                                  block_size=block_size)
+            transfers.append(self.last_transfer)
+        self._report_transfers(transfers)
+        self.resource.write(":RUN")
+        self.last_round_trips = self.resource.round_trips - round_trips
+        x_orig = preamble.x_orig + (first - preamble.x_ref)*preamble.x_inc
         if len(channels) == 1:
             Data = Data[0, :]
+        waveform = Waveform.from_preambles(Data, preambles, channels,
+                                           codes=raw)
+        waveform.x_orig = x_orig
+        waveform.x_inc = preamble.x_inc*stride
+        if compact or raw:
+            return waveform
+        Time = np.asarray([waveform.times]*len(channels))
+        if len(channels) == 1:
             Time = Time[0, :]
         return Time, Data
 
     def get_waveform(self, channels: list = [1], memdepth: str | int = None,
                      single = False, plot: bool = False,
-                     ndivs: int = None, barrier = None) -> np.ndarray:
+                     ndivs: int = None, barrier = None,
+                     compact: bool = False, fmt: str = 'BYTE',
+                     dtype=np.float64) -> np.ndarray:
         """Retrieves the displayed waveform.
         Gets the waveform data in the internal memory for the time interval displayed on screen.
         From the displayed time scale and the sampling rate, will compute how many
@@ -282,9 +1015,22 @@ class Scope(_GenericDevice):
                 ndivs is set by query to oscilloscope.
             barrier (<multiprocessing.Barrier>, optional): Useful for
                 synchronizing multiple processes (measurements)
+            compact (bool, optional): Return a Waveform, whose time axis is
+                only built when accessed. Defaults to False.
+            fmt (str, optional): Waveform format, 'BYTE' or 'WORD'. Defaults
+                to 'BYTE'.
+            dtype (optional): Floating point type of the voltages, or the
+                type of the codes of fmt to get a Waveform of the raw codes.
+                Defaults to np.float64.
         Returns:
-            np.ndarray: Data, Time
+            np.ndarray: Data, Time, or a Waveform if compact or raw codes.
+                The number of round trips used is stored in the
+                last_round_trips attribute.
         """
+        readout = _readout_dtype(fmt, dtype)
+        if readout is None:
+            return None
+        codes_dtype, raw = readout
         no_channels = len(channels)
         if len(channels) > 4:
             print("ERROR : Invalid channel list provided" +
@@ -309,8 +1055,8 @@ class Scope(_GenericDevice):
                 message+= f' Channel {chan}'
         print(message)
 
+        round_trips = self.resource.round_trips
         Data = []
-        Time = []
         trig_status = self.resource.query(':TRIGger:STATus?')
 
         # Set memory depth if specified
@@ -352,7 +1098,7 @@ class Scope(_GenericDevice):
         # Exit before measurement if data transfer from scope will be unsuccessful
         x_inc = 1/sample_rate
         screen_points = np.floor(time_scale/x_inc)*ndivs
-        if screen_points > 250000:
+        if screen_points > _DEFAULT_BLOCK_POINTS[fmt]:
             sys.exit("ERROR: The number of waveform data points exceeds the" +
                   " maximum number which can be read from the oscilloscope at" + 
                   " a single time (see manual).\nEither reduce memory depth" +
@@ -360,98 +1106,419 @@ class Scope(_GenericDevice):
 
         # Measure waveform, afterwards scope must be in STOP state to read from internal memory
         if single:
+            # *OPC? returns once :SINGle is processed, i.e. the scope is armed
+            self._arm(":SINGle;*OPC?", barrier)
             if barrier is not None:
-                barrier.wait()
-                self.resource.write(":SINGle")
                 print(f'{self.short_name} | Waiting for trigger as of {time()} s')
-            else:
-                self.resource.write(":SINGle")
-            if trig_status == "STOP\n":
-                # Wait for trig status to change from "STOP" before while loop
-                sleep(1)
-            while self.resource.query(':TRIGger:STATus?').replace('\n','') != 'STOP':
-                sleep(0.1)
+            self._wait_for_stop()
             print(f"{self.short_name} | Waveform complete as of {time()} s")
         else:
             self.resource.write(":STOP")
          
         # Transfer data from scope
+        preambles = []
         for chan in channels:
-            self.resource.write(f':WAV:SOUR CHAN{chan}')
-            self.resource.write(':WAV:MODE RAW')
-            self.resource.write(':WAV:FORM BYTE')
-            self.resource.query('*OPC?')
-            preamble = _Preamble(self.resource.query(':WAV:PRE?'))
             # we look for the middle of the memory and take what's displayed
             # on the screen
-            self.resource.write(
-                f"WAV:STAR {memory_depth//2 - screen_points//2+1}")
-            self.resource.write(
-                f"WAV:STOP {memory_depth//2 + screen_points//2}")
+            self.configure({':WAV:SOUR': f'CHAN{chan}', ':WAV:MODE': 'RAW',
+                            ':WAV:FORM': fmt})
+            preamble = _Preamble(self.resource.query(
+                f':WAV:STAR {memory_depth//2 - screen_points//2+1};' +
+                f':WAV:STOP {memory_depth//2 + screen_points//2};:WAV:PRE?'))
+            preambles.append(preamble)
             print(f'{self.short_name} | Transferring {int(screen_points)} data points from Channel {chan}')
-            data = self.resource.query_binary_values(':WAV:DATA?', datatype='B',
+            data = self.resource.query_binary_values(':WAV:DATA?',
+                                                     datatype=codes_dtype.char,
                                                      container=np.array,
-                                                     delay=0.5,
                                                      data_points=screen_points)
-            data = preamble.normalize(data)
-            times = np.arange(0, np.round(len(data)*preamble.x_inc, 9), preamble.x_inc)
+            if not raw:
+                data = preamble.normalize(data, dtype=dtype)
             Data.append(data)
-            Time.append(times)
         if plot: 
             # Assumes waveforms all have same time axis
             fig, ax = plt.subplots()
-            times_rescaled, tUnit = set_time_unit(Time[0])
-            [ax.plot(times_rescaled, Data[n], label = f"Channel {chan}") for n, chan in enumerate(channels)]
+            times_rescaled, tUnit = set_time_unit(
+                preamble.x_values(len(Data[0])))
+            volts = Data
+            if raw:
+                volts = [p.normalize(data) for p, data in zip(preambles, Data)]
+            [ax.plot(times_rescaled, volts[n], label = f"Channel {chan}") for n, chan in enumerate(channels)]
             ax.set_ylabel("Voltage (V)")
             ax.set_xlabel("Time (" + tUnit + ")")
             ax.set_xlim(times_rescaled[0], times_rescaled[-1])
             ax.legend()
             plt.show()
         self.resource.write(":RUN")
-        return np.asarray(Time), np.asarray(Data)
+        self.last_round_trips = self.resource.round_trips - round_trips
+        return self._waveform_result(Data, preambles, channels,
+                                     compact or raw, raw)
     
-    def get_waveform_screen(self, channels: list = [1], plot: bool = False) -> np.ndarray:
+    def get_waveform_screen(self, channels: list = [1], plot: bool = False,
+                            compact: bool = False, fmt: str = 'BYTE',
+                            dtype=np.float64) -> np.ndarray:
         """Gets the waveform data currently displayed on the screen.
         Unlike reading waveform data from the internal memory, the oscilloscope does not need to be put into STOP state.
 
         Args:
             channels (list, optional): List of channels. Defaults to [1].
             plot (bool, optional): Whether to plot the result. Defaults to False.
+            compact (bool, optional): Return a Waveform, whose time axis is
+                only built when accessed. Defaults to False.
+            fmt (str, optional): Waveform format, 'BYTE' or 'WORD'. Defaults
+                to 'BYTE'.
+            dtype (optional): Floating point type of the voltages, or the
+                type of the codes of fmt to get a Waveform of the raw codes.
+                Defaults to np.float64.
 
         Returns:
-            np.ndarray: Data, Time
+            np.ndarray: Data, Time, or a Waveform if compact or raw codes.
+                The number of round trips used is stored in the
+                last_round_trips attribute.
         """
+        readout = _readout_dtype(fmt, dtype)
+        if readout is None:
+            return None
+        codes_dtype, raw = readout
         Data = []
-        Time = []
+        preambles = []
+        round_trips = self.resource.round_trips
         for chan in channels:
-            # Set the channel source of waveform data
-            self.resource.write(f':WAVeform:SOURce CHANnel{chan}')
-            # Set the waveform data reading mode to NORMal
-            self.resource.write(':WAVeform:MODE NORMal')
-            # Set the return format of waveform data to BYTE
-            self.resource.write(':WAVeform:FORMat BYTE')
+            # Set the channel source of waveform data, the waveform data
+            # reading mode to NORMal and the return format in a single
+            # message (only the settings which changed)
+            self.configure({':WAV:SOUR': f'CHAN{chan}', ':WAV:MODE': 'NORM',
+                            ':WAV:FORM': fmt})
             # Query and return ten different waveform parameters, see manual
             # Required to convert retrieved waveform data into time and volts below
             preamble = _Preamble(self.resource.query(':WAVeform:PREamble?'))
+            preambles.append(preamble)
             # Obtain data from the buffer
-            data = self.resource.query_binary_values(':WAVeform:DATA?', datatype='B',
-                                            container=np.array,
-                                            delay=0.5)
-            data = preamble.normalize(data)
-            times = np.arange(0, np.round(len(data)*preamble.x_inc, 9), preamble.x_inc)
+            data = self.resource.query_binary_values(':WAVeform:DATA?',
+                                            datatype=codes_dtype.char,
+                                            container=np.array)
+            if not raw:
+                data = preamble.normalize(data, dtype=dtype)
             Data.append(data)
-            Time.append(times)
         if plot:
             # Assumes waveforms all have same time axis
             fig, ax = plt.subplots()
-            times_rescaled, tUnit = set_time_unit(Time[0])
-            [ax.plot(times_rescaled, Data[n], label = f"Channel {chan}") for n, chan in enumerate(channels)]
+            times_rescaled, tUnit = set_time_unit(
+                preamble.x_values(len(Data[0])))
+            volts = Data
+            if raw:
+                volts = [p.normalize(data) for p, data in zip(preambles, Data)]
+            [ax.plot(times_rescaled, volts[n], label = f"Channel {chan}") for n, chan in enumerate(channels)]
             ax.set_ylabel("Voltage (V)")
             ax.set_xlabel("Time (" + tUnit + ")")
             ax.set_xlim(times_rescaled[0], times_rescaled[-1])
             ax.legend()
             plt.show()
-        return np.asarray(Time), np.asarray(Data)
+        self.last_round_trips = self.resource.round_trips - round_trips
+        return self._waveform_result(Data, preambles, channels,
+                                     compact or raw, raw)
+
+    @staticmethod
+    def _waveform_result(Data: list, preambles: list, channels: list,
+                         compact: bool, codes: bool = False):
+        """Time, Data arrays, or a Waveform if compact, from the voltages
+        (or raw codes) of each channel."""
+        Data = np.asarray(Data)
+        if compact:
+            return Waveform.from_preambles(Data, preambles, channels,
+                                           codes=codes)
+        times = preambles[0].x_values(Data.shape[1])
+        return np.asarray([times]*len(Data)), Data
+
+    def stream(self, channels: list = [1], mode: str = 'screen',
+               max_frames: int = None, ring_size: int = 4,
+               period: float = None, fmt: str = 'BYTE', dtype=np.float64,
+               stop_timeout: float = 0.1):
+        """Continuously acquires waveforms and yields them as they arrive.
+        A background thread transfers the next frame while the caller
+        processes the current one. Frames are written into a ring of
+        preallocated arrays so that memory stays bounded however long the
+        run is : the arrays of a frame are only valid until the next
+        iteration, copy them to keep them.
+        Vertical and horizontal settings must not be changed while streaming
+        since the scaling parameters are only read once. The instrument can
+        still be used from other threads : the transfer of a frame holds
+        resource.lock, so that other transactions run between frames.
+        Closing the generator stops the reader thread within about
+        stop_timeout, even while waiting for a trigger in memory mode.
+
+        Args:
+            channels (list, optional): List of channels. Defaults to [1].
+            mode (str, optional): 'screen' reads the displayed waveform
+                without stopping the oscilloscope, 'memory' reads the whole
+                internal memory after each single trigger. Defaults to
+                'screen'.
+            max_frames (int, optional): Number of frames after which the
+                stream ends. Defaults to None (endless).
+            ring_size (int, optional): Number of preallocated frames, at least
+                3. Defaults to 4.
+            period (float, optional): Expected time between frames (e.g.
+                trigger period) in s, used to count dropped frames.
+                Defaults to None (dropped frames are not counted).
+            fmt (str, optional): Waveform format, 'BYTE' or 'WORD'. Defaults
+                to 'BYTE'.
+            dtype (optional): Floating point type of the voltages. Defaults
+                to np.float64.
+            stop_timeout (float, optional): Interval in s at which the reader
+                checks for the generator being closed while waiting for a
+                trigger. Defaults to 0.1.
+
+        Yields:
+            Frame: index, timestamp (time() at the end of the transfer),
+                times, data of shape (channels, points), dropped (number of
+                frames missed since the previous one) and duplicate (data
+                identical to the previous frame, i.e. screen not refreshed)
+        """
+        if mode not in ('screen', 'memory'):
+            print("ERROR : Invalid mode specified (screen or memory)")
+            return
+        if ring_size < 3:
+            print("ERROR : ring_size must be at least 3")
+            return
+        readout = _readout_dtype(fmt, dtype)
+        if readout is None:
+            return
+        codes_dtype, raw = readout
+        if raw:
+            print("ERROR : Frames are voltages, dtype must be floating point")
+            return
+        if mode == 'screen':
+            wav_mode = 'NORM'
+        else:
+            # The internal memory can only be read in STOP state
+            self.resource.write(':STOP')
+            wav_mode = 'RAW'
+        preambles = []
+        with self.resource.lock:
+            for chan in channels:
+                self.configure({':WAV:SOUR': f'CHAN{chan}',
+                                ':WAV:MODE': wav_mode, ':WAV:FORM': fmt})
+                preambles.append(_Preamble(self.resource.query(':WAV:PRE?')))
+        points = preambles[0].points
+        times = preambles[0].x_values(points)
+        block_size = self.max_block_points(fmt)
+        ring = np.empty((ring_size, len(channels), points), dtype=dtype)
+        # Codes of the current and of the previous frame, alternately, so
+        # that duplicates are detected without copying a frame
+        buffers = np.zeros((2, len(channels), points), dtype=codes_dtype)
+        # At most ring_size-2 frames wait in the queue, one is being read and
+        # one is held by the caller, so a slot is never overwritten while in
+        # use
+        frames = queue.Queue(maxsize=ring_size-2)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    frames.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def reader():
+            try:
+                index = 0
+                last = None
+                while not stop.is_set() and (max_frames is None
+                                             or index < max_frames):
+                    slot = index % ring_size
+                    codes = buffers[index % 2]
+                    previous = buffers[(index + 1) % 2]
+                    if mode == 'memory':
+                        self.resource.query(':SINGle;*OPC?')
+                        # Short waits, to notice that the generator was closed
+                        arm_timeout = None
+                        while not self._wait_for_stop(
+                                timeout=stop_timeout, arm_timeout=arm_timeout):
+                            arm_timeout = 0
+                            if stop.is_set():
+                                return
+                    with self.resource.lock:
+                        for n, chan in enumerate(channels):
+                            if len(channels) > 1:
+                                # Not through configure, which would join a
+                                # batch opened by another thread
+                                self.resource.write(f':WAV:SOUR CHAN{chan}')
+                                self.settings[':WAV:SOUR'] = f'CHAN{chan}'
+                            if mode == 'memory':
+                                self._read_memory_into(codes[n],
+                                                       block_size=block_size)
+                            else:
+                                block = self.resource.query_binary_values(
+                                    ':WAVeform:DATA?',
+                                    datatype=codes_dtype.char,
+                                    container=np.array)
+                                size = min(len(block), points)
+                                codes[n, :size] = block[:size]
+                                if size < points:
+                                    # As if only the start was refreshed
+                                    codes[n, size:] = previous[n, size:]
+                            preambles[n].normalize(codes[n],
+                                                   out=ring[slot, n])
+                    timestamp = time()
+                    duplicate = index > 0 and np.array_equal(codes, previous)
+                    dropped = 0
+                    if period is not None and last is not None:
+                        dropped = max(0, round((timestamp-last)/period) - 1)
+                    last = timestamp
+                    put(Frame(index, timestamp, times, ring[slot], dropped,
+                              duplicate))
+                    index += 1
+            except Exception as e:
+                put(e)
+            finally:
+                put(None)
+
+        thread = threading.Thread(target=reader, daemon=True)
+        thread.start()
+        try:
+            while True:
+                frame = frames.get()
+                if frame is None:
+                    break
+                if isinstance(frame, Exception):
+                    raise frame
+                yield frame
+        finally:
+            stop.set()
+            # Returns within stop_timeout plus the transfer in progress
+            thread.join()
+            if mode == 'memory':
+                self.resource.write(':RUN')
+
+    def record(self, channels: list = [1], frames: int = 100,
+               timeout: float = None, block_size: int = None,
+               fmt: str = 'BYTE', dtype=np.float64) -> Record:
+        """Acquires frames consecutive triggers with the waveform recording
+        function (MSO7000/DS7000 :RECord commands) : the oscilloscope is
+        armed once and records at the hardware trigger rate, then all the
+        frames are read back from the internal memory into one preallocated
+        array.
+        The programming guide has no query for the time tag of each frame,
+        only the times at which the recording was started and found complete
+        are returned.
+
+        Args:
+            channels (list, optional): List of channels. Defaults to [1].
+            frames (int, optional): Number of frames to record. Defaults to
+                100.
+            timeout (float, optional): Maximum recording time in s. Defaults
+                to None (no limit).
+            block_size (int, optional): Number of points per :WAV:DATA?
+                request. Defaults to None (see max_block_points).
+            fmt (str, optional): Waveform format, 'BYTE' or 'WORD'. Defaults
+                to 'BYTE'.
+            dtype (optional): Floating point type of the voltages, or the
+                type of the codes of fmt to get the raw codes. Defaults to
+                np.float64.
+
+        Returns:
+            Record: data of shape (frames, channels, points), or (frames,
+                points) for a single channel, times of the points of a frame
+                relative to the trigger, scale and offset of each channel
+                (volts = (code - offset)*scale) for raw codes (None
+                otherwise), armed and completed (time() of the start and of
+                the end of the recording). None if the recording timed out.
+                The number of round trips used is stored in the
+                last_round_trips attribute.
+        """
+        readout = _readout_dtype(fmt, dtype)
+        if readout is None:
+            return None
+        codes_dtype, raw = readout
+        round_trips = self.resource.round_trips
+        self.configure({':RECord:ENABle': 'ON', ':RECord:FRAMes': int(frames)})
+        # The current frame is set by the recording
+        self.invalidate(':RECord:CURRent')
+        armed = time()
+        self.write(':RECord:STARt ON')
+        print(f"{self.short_name} | Recording {frames} frames as of {armed} s")
+
+        def recorded():
+            return self.resource.query(':RECord:STARt?').strip() in ('0',
+                                                                      'OFF')
+        if not self.wait_until(recorded, timeout=timeout):
+            print(f"{self.short_name} | ERROR : Recording timed out")
+            self.write(':RECord:STARt OFF')
+            self.configure({':RECord:ENABle': 'OFF'})
+            return None
+        completed = time()
+        print(f"{self.short_name} | Recording complete as of {completed} s " +
+              f"({frames/(completed - armed):.1f} frames/s)")
+
+        if block_size is None:
+            block_size = self.max_block_points(fmt)
+        preambles = []
+        for chan in channels:
+            self.configure({':WAV:SOUR': f'CHAN{chan}', ':WAV:MODE': 'RAW',
+                            ':WAV:FORM': fmt})
+            preambles.append(_Preamble(self.resource.query(":WAV:PRE?")))
+        points = preambles[0].points
+        data = np.empty((frames, len(channels), points),
+                        dtype=codes_dtype if raw else dtype)
+        transfers = []
+        for k in range(frames):
+            for n, chan in enumerate(channels):
+                # Only the settings which changed, in one message
+                self.configure({':RECord:CURRent': k + 1,
+                                ':WAV:SOUR': f'CHAN{chan}'})
+                if raw:
+                    self._read_memory_into(data[k, n], block_size=block_size)
+                else:
+                    def scale(offset, block, preamble=preambles[n],
+                              out=data[k, n]):
+                        preamble.normalize(block,
+                                           out=out[offset:offset + len(block)])
+                    self._read_memory(points, codes_dtype, scale,
+                                      block_size=block_size)
+                transfers.append(self.last_transfer)
+        self._report_transfers(transfers)
+        self.configure({':RECord:ENABle': 'OFF'})
+        self.resource.write(":RUN")
+        self.last_round_trips = self.resource.round_trips - round_trips
+        preamble = preambles[0]
+        times = preamble.x_orig + (np.arange(points) - preamble.x_ref) * \
+            preamble.x_inc
+        scale = offset = None
+        if raw:
+            waveform = Waveform.from_preambles(data, preambles, channels,
+                                               codes=True)
+            scale, offset = waveform.scale, waveform.offset
+        if len(channels) == 1:
+            data = data[:, 0, :]
+        return Record(data, times, scale, offset, armed, completed)
+
+    def _wait_for_stop(self, timeout: float = None,
+                       arm_timeout: float = None) -> bool:
+        """Waits for a single acquisition to complete, i.e. for the trigger
+        status to come back to STOP, polling with adaptive backoff.
+        The programming guide does not state that the trigger status has
+        left STOP once :SINGle is processed, so it is first given at most
+        arm_timeout to do so : otherwise the STOP state of the previous
+        acquisition would be taken for the completion of the new one. The
+        wait ends as soon as any other status is read.
+
+        Args:
+            timeout (float, optional): Maximum waiting time in s.
+                Defaults to None (no limit).
+            arm_timeout (float, optional): Maximum time in s to wait for the
+                trigger status to leave STOP first, 0 to skip this wait.
+                Defaults to None (the arm_timeout attribute, 0.1 s).
+
+        Returns:
+            bool: True if the acquisition completed, False on timeout
+        """
+        def stopped():
+            return self.resource.query(':TRIGger:STATus?').strip() == 'STOP'
+        if arm_timeout is None:
+            arm_timeout = self.arm_timeout
+        if arm_timeout > 0:
+            self.wait_until(lambda: not stopped(), timeout=arm_timeout)
+        return self.wait_until(stopped, timeout=timeout)
 
     def set_xref(self, ref: float):
         """
@@ -491,12 +1558,136 @@ class Scope(_GenericDevice):
             return self.resource.query_ascii_values(f":CHAN{chan}:SCAL?")[0]
 
 
-    def measurement(self, channels: list = [1],
-                    res: list = None):
-        if list is not (None) and len(list) == 2:
-            self.xres = self.set_xres(res[0])
-            self.yres = self.set_yres(res[1])
-        Data, Time = self.get_waveform(channels=channels)
+    def _measurement_queries(self, items: list, channels: list,
+                             statistics: bool) -> list:
+        """Queries of measure, by channel, then item, then statistic."""
+        if statistics:
+            return [f':MEASure:STATistic:ITEM? {kind},{item},CHANnel{chan}'
+                    for chan in channels for item in items
+                    for kind in _STATISTICS.values()]
+        return [f':MEASure:ITEM? {item},CHANnel{chan}'
+                for chan in channels for item in items]
+
+    def _enable_statistics(self, items: list, channels: list):
+        """Turns on the statistics of the measurements which were not enabled
+        yet, in one program message."""
+        new = [(item, chan) for chan in channels for item in items
+               if (item, chan) not in self._statistic_items]
+        if len(new) == 0:
+            return
+        with self.batch():
+            self.configure({':MEASure:STATistic:DISPlay': 'ON'})
+            for item, chan in new:
+                self.write(f':MEASure:STATistic:ITEM {item},CHANnel{chan}')
+        self._statistic_items.update(new)
+
+    @staticmethod
+    def _measurement_record(responses: list, items: list, channels: list,
+                            statistics: bool) -> np.ndarray:
+        """Structured array of the responses of _measurement_queries."""
+        values = np.full(len(responses), np.nan)
+        for index, response in enumerate(responses):
+            try:
+                value = float(response)
+            except ValueError:
+                continue
+            if abs(value) < _INVALID_MEASUREMENT:
+                values[index] = value
+        values = values.reshape(len(channels), len(items), -1)
+        if statistics:
+            field = [(name, np.float64) for name in _STATISTICS]
+        else:
+            field = np.float64
+        record = np.zeros(len(channels), dtype=[('channel', np.int32)] +
+                          [(item, field) for item in items])
+        record['channel'] = channels
+        for index, item in enumerate(items):
+            if statistics:
+                for kind, name in enumerate(_STATISTICS):
+                    record[item][name] = values[:, index, kind]
+            else:
+                record[item] = values[:, index, 0]
+        return record
+
+    def measurement(self, channels: list = [1], items: list = ['VPP'],
+                    statistics: bool = False) -> np.ndarray:
+        """Reads measurements made by the oscilloscope itself (:MEASure
+        commands) instead of transferring the waveforms : all the items of
+        all the channels are queried in a single program message, i.e. one
+        round trip of a few bytes per item.
+
+            m = scope.measurement([1, 2], ['VPP', 'FREQuency'])
+            print(m['VPP'][m['channel'] == 2])
+
+        Args:
+            channels (list, optional): List of channels. Defaults to [1].
+            items (list, optional): Measurement items, e.g. 'VPP', 'VRMS',
+                'FREQuency', 'PERiod', 'RTIMe', 'PDUTy' (see :MEASure:ITEM
+                in the programming guide). Defaults to ['VPP'].
+            statistics (bool, optional): Read the statistics of each item
+                (current, average, maximum, minimum and standard deviation
+                since they were enabled or reset_statistics) instead of its
+                current value. They are enabled on the first call.
+                Defaults to False.
+
+        Returns:
+            np.ndarray: structured array with one record per channel, with a
+                channel field and a field per item, itself a record of the
+                statistics if statistics is True. Invalid measurements are
+                NaN.
+        """
+        if statistics:
+            self._enable_statistics(items, channels)
+        responses = self.query_many(
+            self._measurement_queries(items, channels, statistics))
+        return self._measurement_record(responses, items, channels,
+                                        statistics)
+
+    def reset_statistics(self):
+        """Clears the statistics of the measurements."""
+        self.write(':MEASure:STATistic:RESet')
+
+    def poll_measurements(self, channels: list = [1], items: list = ['VPP'],
+                          statistics: bool = False, period: float = None,
+                          count: int = None):
+        """Generator of measurements (see measurement) read in a loop, one
+        round trip per reading, e.g. to monitor a signal at hundreds of
+        readings per second with negligible bus traffic. Statistics are
+        enabled once, before the first reading.
+
+            for timestamp, m in scope.poll_measurements([1], ['VRMS'],
+                                                        period=0.01):
+                ...
+
+        Args:
+            channels (list, optional): List of channels. Defaults to [1].
+            items (list, optional): Measurement items. Defaults to ['VPP'].
+            statistics (bool, optional): Read the statistics of each item.
+                Defaults to False.
+            period (float, optional): Time between two readings in s.
+                Defaults to None (as fast as possible).
+            count (int, optional): Number of readings. Defaults to None
+                (until the generator is closed).
+
+        Yields:
+            tuple: time() of the reading, measurements
+        """
+        if statistics:
+            self._enable_statistics(items, channels)
+        queries = self._measurement_queries(items, channels, statistics)
+        readings = 0
+        next_reading = perf_counter()
+        while count is None or readings < count:
+            if period is not None:
+                delay = next_reading - perf_counter()
+                if delay > 0:
+                    sleep(delay)
+                next_reading += period
+            timestamp = time()
+            responses = self.query_many(queries)
+            readings += 1
+            yield timestamp, self._measurement_record(responses, items,
+                                                      channels, statistics)
 
     def get_screenshot(self, filename: str = None, format: str = 'png'):
         """
@@ -530,16 +1721,17 @@ class Scope(_GenericDevice):
 
     def close(self):
         self.resource.write(":RUN")
-        self.resource.close()
-        self.rm.close()
+        super().close()
 
 
-class SpectrumAnalyzer(_GenericDevice):
+class SpectrumAnalyzer(_SpectrumAnalyzer):
+    binary_trace_models = r'DSA[78]\d{2}'
+    trace_query = ':TRACe? TRACE1'
 
     def zero_span(self, center: float = 1e6, rbw: int = 100,
                   vbw: int = 30, swt: float = 'auto', 
                   trig: bool = None, single = False,
-                  plot: bool = False):
+                  plot: bool = False, barrier = None):
         """Zero span measurement.
 
         (!) For long sweep times, use single sweep mode
@@ -552,82 +1744,19 @@ class SpectrumAnalyzer(_GenericDevice):
         :param bool single: Set True for single sweep mode,
             defaults to False for continuous sweep mode
         :param bool plot: option to plot
+        :param barrier: <multiprocessing.Barrier> instance,
+           useful for synchronizing multiple processes (measurements)
         :return: data, time for data and time
         :rtype: np.ndarray
 
         """
-        self.resource.write(':FREQuency:SPAN 0')
-        self.resource.write(f':FREQuency:CENTer {center}')
-        self.resource.write(f':BANDwidth:RESolution {int(rbw)}')
-        self.resource.write(f':BANDwidth:VIDeo {int(vbw)}')
-        if swt != 'auto':
-            self.resource.write(f':SENSe:SWEep:TIME {swt}')  # in s.
-        else:
-            self.resource.write(':SENSe:SWEep:TIME:AUTO ON')
-        self.resource.write(
-            ':DISPlay:WINdow:TRACe:Y:SCALe:SPACing LOGarithmic')
-        
-        if trig is not None:
-            trigstate = self.resource.query(':TRIGger:SEQuence:SOURce?').replace('\n','')
-            istrigged = trigstate != 'IMM' # whether SA is initially triggered
-            # If trigger true and initial trigger type IMMediate, then set to EXTernal
-            if trig and not (istrigged): 
-                self.resource.write(':TRIGger:SEQuence:SOURce EXTernal')
-                self.resource.write(
-                    ':TRIGger:SEQuence:EXTernal:SLOPe POSitive')
-            # If trigger false and initial trigger type not IMMediate, set to IMMediate
-            elif not (trig) and istrigged:
-                self.resource.write(':TRIGger:SEQuence:SOURce IMMediate')
-        set_trigstate = self.resource.query(':TRIGger:SEQuence:SOURce?').replace('\n','')
-
-        # Query current instrument sweep state
-        sweep_state = int(self.resource.query(':INITiate:CONTinuous?'))
-        if single == False:
-            if sweep_state == 1: 
-                # Already in continuous
-                pass
-            elif sweep_state == 0:
-                # Put into continous
-                self.resource.write(':INITiate:CONTinuous 1')
-            triginfo_msg = ' with trigger' if set_trigstate == 'EXT' else ''
-            print(f'{self.short_name} | Getting zero span scan (continuous sweep mode' +
-                  triginfo_msg + ')')
-        elif single == True:
-            # In following conditional blocks, *OPC command (operation complete)
-            # is sent subsequent to command intializing scan so that operation 
-            # complete status can be polled (must wait for scan completion).
-            self.resource.write('*CLS') # Reset status registers, clear error queue
-            if sweep_state == 1:
-                # Put into single
-                self.resource.write(':INITiate:CONTinuous 0')
-                self.resource.write(':INITiate:IMMediate; *OPC')
-            elif sweep_state == 0:
-                if trig is None or trig == False:
-                    self.resource.write(':INITiate:IMMediate; *OPC')
-                elif trig == True:
-                    # Must reset trigger just before initiating scan, otherwise
-                    # it seems trigger success condition is stored, because scan
-                    # starts immediately instead of waiting for next trigger
-                    self.resource.write(':TRIGger:SEQuence:SOURce EXTernal')
-                    self.resource.write(':INITiate:IMMediate; *OPC')
-            triginfo_msg = ' on trigger' if set_trigstate == 'EXT' else ''
-            print(f'{self.short_name} | Getting zero span scan (single sweep' +
-                  triginfo_msg + ')')
-            # Poll the operation complete status in the event status 
-            # register (ESR). (Once all commands before *OPC have been executed, 
-            # the operation complete bit in the ESR is set to 1)
-            while int(self.resource.query('*ESR?')) != 1:
-                sleep(0.1)
-        self.resource.write(':FORMat:TRACe:DATA ASCii')
-        data = self.query_data()
-         # If SA was trigged before, put it back in the same state
-        if trig is not None:
-            if not (trig) and istrigged:
-                self.resource.write(f":TRIGger:SEQuence:SOURce {trigstate}")
-        # Put SA back into the state it started in
-        if sweep_state != int(self.resource.query(':INITiate:CONTinuous?')):
-            self.resource.write(f':INITiate:CONTinuous {int(sweep_state)}')
-        sweeptime = float(self.resource.query(':SWEep:TIME?'))
+        data = self._measure({':FREQuency:SPAN': 0,
+                              ':FREQuency:CENTer': center,
+                              ':BANDwidth:RESolution': int(rbw),
+                              ':BANDwidth:VIDeo': int(vbw)},
+                             swt, trig, single, barrier,
+                             'zero span scan')
+        sweeptime = float(self.query_setting(':SENSe:SWEep:TIME'))
         times = np.linspace(0, sweeptime, len(data))
         if plot:
             fig, ax = plt.subplots()
@@ -640,7 +1769,7 @@ class SpectrumAnalyzer(_GenericDevice):
 
     def span(self, center: float = 22.5e6, span: float = 45e6, rbw: int = 100,
              vbw: int = 30, swt: float = 'auto', trig: bool = None, single = False,
-             plot: bool = False):
+             plot: bool = False, barrier = None):
         """Configure and execute measurement of noise power spectrum
         (!) For long sweep times, use single sweep mode
 
@@ -653,83 +1782,19 @@ class SpectrumAnalyzer(_GenericDevice):
         :param bool single: Set True for single sweep mode,
             defaults to False for continuous sweep mode
         :param bool plot: option to plot
+        :param barrier: <multiprocessing.Barrier> instance,
+           useful for synchronizing multiple processes (measurements)
         :return: data, freqs for data and frequencies
         :rtype: np.ndarray
 
         """
-        self.resource.write(f':FREQuency:SPAN {span}')
-        self.resource.write(f':FREQuency:CENTer {center}')
-        self.resource.write(f':BANDwidth:RESolution {int(rbw)}')
-        self.resource.write(f':BANDwidth:VIDeo {int(vbw)}')
-        if swt != 'auto':
-            self.resource.write(f':SENSe:SWEep:TIME {swt}')  # in s.
-        else:
-            self.resource.write(':SENSe:SWEep:TIME:AUTO ON')
-        self.resource.write(
-            ':DISPlay:WINdow:TRACe:Y:SCALe:SPACing LOGarithmic')
-        self.resource.query('*OPC?')
-
-        if trig is not None:
-            trigstate = self.resource.query(':TRIGger:SEQuence:SOURce?').replace('\n','')
-            istrigged = trigstate != 'IMM' # whether SA is initially triggered
-            # If trigger true and initial trigger type IMMediate, then set to EXTernal
-            if trig and not (istrigged): 
-                self.resource.write(':TRIGger:SEQuence:SOURce EXTernal')
-                self.resource.write(
-                    ':TRIGger:SEQuence:EXTernal:SLOPe POSitive')
-            # If trigger false and initial trigger type not IMMediate, set to IMMediate
-            elif not (trig) and istrigged:
-                self.resource.write(':TRIGger:SEQuence:SOURce IMMediate')
-        self.resource.query('*OPC?')
-        set_trigstate = self.resource.query(':TRIGger:SEQuence:SOURce?').replace('\n','')
-    
-        # Query current instrument sweep state
-        sweep_state = int(self.resource.query(':INITiate:CONTinuous?'))
-        if single == False:
-            if sweep_state == 1: 
-                # Already in continuous
-                pass
-            elif sweep_state == 0:
-                # Put into continous
-                self.resource.write(':INITiate:CONTinuous 1')
-            triginfo_msg = ' with trigger' if set_trigstate == 'EXT' else ''
-            print(f'{self.short_name} | Getting power spectrum (continuous sweep mode' +
-                  triginfo_msg + ')')
-        elif single == True:
-            # In following conditional blocks, *OPC command (operation complete)
-            # is sent subsequent to command intializing scan so that operation 
-            # complete status can be polled (must wait for scan completion).
-            self.resource.write('*CLS') # Reset status registers, clear error queue
-            if sweep_state == 1:
-                # Put into single
-                self.resource.write(':INITiate:CONTinuous 0')
-                self.resource.write(':INITiate:IMMediate; *OPC')
-            elif sweep_state == 0:
-                if trig is None or trig == False:
-                    self.resource.write(':INITiate:IMMediate; *OPC')
-                elif trig == True:
-                    # Must reset trigger just before initiating scan, otherwise
-                    # it seems trigger success condition is stored, because scan
-                    # starts immediately instead of waiting for next trigger
-                    self.resource.write(':TRIGger:SEQuence:SOURce EXTernal')
-                    self.resource.write(':INITiate:IMMediate; *OPC')
-            triginfo_msg = ' on trigger' if set_trigstate == 'EXT' else ''
-            print(f'{self.short_name} | Getting power spectrum (single sweep' +
-                  triginfo_msg + ')')
-            # Poll the operation complete status in the event status 
-            # register (ESR). (Once all commands before *OPC have been executed, 
-            # the operation complete bit in the ESR is set to 1)
-            while int(self.resource.query('*ESR?')) != 1:
-                sleep(0.1)
-        self.resource.write(':FORMat:TRACe:DATA ASCii')
-        data = self.query_data()
-        # If SA was trigged before, put it back in the same state
-        if trig is not None:
-            if not (trig) and istrigged:
-                self.resource.write(f":TRIGger:SEQuence:SOURce {trigstate}")
-        # Put SA back into the state it started in
-        if sweep_state != int(self.resource.query(':INITiate:CONTinuous?')):
-            self.resource.write(f':INITiate:CONTinuous {int(sweep_state)}')
+        # The settings are followed by *OPC? in the same message
+        data = self._measure({':FREQuency:SPAN': span,
+                              ':FREQuency:CENTer': center,
+                              ':BANDwidth:RESolution': int(rbw),
+                              ':BANDwidth:VIDeo': int(vbw)},
+                             swt, trig, single, barrier,
+                             'power spectrum', opc=True)
         freqs = np.linspace(center-span//2, center+span//2, len(data))
         if plot:
             fig, ax = plt.subplots()
@@ -740,20 +1805,24 @@ class SpectrumAnalyzer(_GenericDevice):
             plt.show()
         return data, freqs
 
-    def query_data(self):
-        """Lower level function to grab the data from the SpecAnalyzer
-
-        :return: data
-        :rtype: list
-
-        """
-        rawdata = self.resource.query(':TRACe? TRACE1')
-        data = rawdata.split(', ')[1:]
-        data = [float(i) for i in data]
-        return np.asarray(data)
-
-
 class ArbitraryFG(_GenericDevice):
+    # Arbitrary waveform download (:DATA:DAC16) limits : 14 bit codes, 8 to
+    # 16384 points per packet
+    _DAC_MAX_CODE = 0x3FFF
+    _DAC_MIN_POINTS = 8
+    _DAC_PACKET_POINTS = 16384
+
+    def __init__(self, addr: str = None, py_backend: bool = None):
+        super().__init__(addr=addr, py_backend=py_backend)
+        # Hash of the waveform in the volatile memory, by output
+        self._waveform_hashes = {}
+
+    def invalidate(self, header: str = None):
+        """Forgets cached settings (see _GenericDevice.invalidate), and the
+        uploaded waveforms when the whole cache is cleared."""
+        super().invalidate(header)
+        if header is None:
+            self._waveform_hashes.clear()
 
     def get_waveform(self, output: int = 1, amp_unit: int = False) -> list:
         """
@@ -800,7 +1869,7 @@ class ArbitraryFG(_GenericDevice):
         :param int output: Output channel
         :return: None
         """
-        self.resource.write(f"OUTPut{output} ON")
+        self.write(f"OUTPut{output} ON")
 
     def turn_off(self, output: int = 1):
         """
@@ -808,7 +1877,7 @@ class ArbitraryFG(_GenericDevice):
         :param int output: Output channel
         :return: None
         """
-        self.resource.write(f"OUTPut{output} OFF")
+        self.write(f"OUTPut{output} OFF")
 
     def set_impedance(self, output: int = 1, load: str = 'INF'):
         """
@@ -854,9 +1923,12 @@ class ArbitraryFG(_GenericDevice):
         if output not in [1, 2]:
             print("ERROR : Invalid output specified")
             return None
-        self.resource.write(f":SOURce{output}:FUNCtion DC")
-        self.resource.write(f":SOURce{output}:APPLy:USER 1, 1, {offset}, 0")
-        self.turn_on(output)
+        # The DC waveform replaces the uploaded one as arbitrary waveform
+        self._waveform_hashes.pop(output, None)
+        with self.batch():
+            self.write(f":SOURce{output}:FUNCtion DC")
+            self.write(f":SOURce{output}:APPLy:USER 1, 1, {offset}, 0")
+            self.turn_on(output)
 
     def sine(self, output: int = 1, freq: float = 100.0, ampl: float = 2.0,
              offset: float = 0.0, phase: float = 0.0):
@@ -872,9 +1944,10 @@ class ArbitraryFG(_GenericDevice):
         if output not in [1, 2]:
             print("ERROR : Invalid output specified")
             return None
-        self.resource.write(f":SOURce{output}:APPLy:SINusoid {freq}, {ampl}, " +
-                            f"{offset}, {phase}")
-        self.turn_on(output)
+        with self.batch():
+            self.write(f":SOURce{output}:APPLy:SINusoid {freq}, {ampl}, " +
+                       f"{offset}, {phase}")
+            self.turn_on(output)
 
     def square(self, output: int = 1, freq: float = 100.0, ampl: float = 2.0,
                offset: float = 0.0, phase: float = 0.0, duty: float = 50.0):
@@ -891,10 +1964,12 @@ class ArbitraryFG(_GenericDevice):
         if output not in [1, 2]:
             print("ERROR : Invalid output specified")
             return None
-        self.resource.write(f":SOURce{output}:APPLy:SQUare {freq}, {ampl}, " +
-                            f"{offset}, {phase}")
-        self.resource.write(f":SOURce{output}:FUNCtion:SQUare:DCYCle {duty}")
-        self.turn_on(output)
+        # Sent as a single message
+        with self.batch():
+            self.write(f":SOURce{output}:APPLy:SQUare {freq}, {ampl}, " +
+                       f"{offset}, {phase}")
+            self.write(f":SOURce{output}:FUNCtion:SQUare:DCYCle {duty}")
+            self.turn_on(output)
 
     def ramp(self, output: int = 1, freq: float = 100.0, ampl: float = 2.0,
              offset: float = 0.0, phase: float = 0.0, symm: float = 50.0):
@@ -911,10 +1986,12 @@ class ArbitraryFG(_GenericDevice):
         if output not in [1, 2]:
             print("ERROR : Invalid output specified")
             return None
-        self.resource.write(f":SOURce{output}:APPLy:RAMP {freq}, {ampl}, " +
-                            f"{offset}, {phase}")
-        self.resource.write(f":SOURce{output}:FUNCtion:RAMP:SYMMetry {symm}")
-        self.turn_on(output)
+        # Sent as a single message
+        with self.batch():
+            self.write(f":SOURce{output}:APPLy:RAMP {freq}, {ampl}, " +
+                       f"{offset}, {phase}")
+            self.write(f":SOURce{output}:FUNCtion:RAMP:SYMMetry {symm}")
+            self.turn_on(output)
 
     def pulse(self, output: int = 1, freq: float = 100.0, ampl: float = 2.0,
               offset: float = 0.0, phase: float = 0.0, duty: float = 50.0,
@@ -934,14 +2011,14 @@ class ArbitraryFG(_GenericDevice):
         if output not in [1, 2]:
             print("ERROR : Invalid output specified")
             return None
-        self.resource.write(f":SOURce{output}:APPLy:PULSe {freq}, {ampl}, " +
-                            f"{offset}, {phase}")
-        self.resource.write(f":SOURce{output}:FUNCtion:PULSe:DCYCLe {duty}")
-        self.resource.write(
-            f":SOURce{output}:FUNCtion:TRANsition:LEADing {rise}")
-        self.resource.write(
-            f":SOURce{output}:FUNCtion:TRANsition:TRAiling {fall}")
-        self.turn_on(output)
+        # Sent as a single message
+        with self.batch():
+            self.write(f":SOURce{output}:APPLy:PULSe {freq}, {ampl}, " +
+                       f"{offset}, {phase}")
+            self.write(f":SOURce{output}:FUNCtion:PULSe:DCYCLe {duty}")
+            self.write(f":SOURce{output}:FUNCtion:TRANsition:LEADing {rise}")
+            self.write(f":SOURce{output}:FUNCtion:TRANsition:TRAiling {fall}")
+            self.turn_on(output)
 
     def noise(self, output: int = 1, ampl: float = 5.0, offset: float = 0.0):
         """
@@ -951,8 +2028,9 @@ class ArbitraryFG(_GenericDevice):
         :param float offset: Voltage offset in Volts
         :return: None
         """
-        self.resource.write(f":SOURce{output}:APPLy:NOISe {ampl}, {offset}")
-        self.turn_on(output)
+        with self.batch():
+            self.write(f":SOURce{output}:APPLy:NOISe {ampl}, {offset}")
+            self.turn_on(output)
 
     def arbitrary(self, output: int = 1, freq: float = 100, ampl: float = 5.0,
                   offset: float = 0.0, phase: float = 0.0,
@@ -1003,10 +2081,211 @@ class ArbitraryFG(_GenericDevice):
         if function not in funcnames:
             print("ERROR : Unknwown function specified")
             pass
-        self.resource.write(f":SOURce{output}:FUNCtion {function}")
-        self.resource.write(f":SOURce{output}:APPLy:USER {freq}, {ampl}, " +
-                            f"{offset}, {phase}")
-        self.turn_on(output)
+        self._waveform_hashes.pop(output, None)
+        with self.batch():
+            self.write(f":SOURce{output}:FUNCtion {function}")
+            self.write(f":SOURce{output}:APPLy:USER {freq}, {ampl}, " +
+                       f"{offset}, {phase}")
+            self.turn_on(output)
+
+    def upload_waveform(self, waveform: np.ndarray, output: int = 1,
+                        freq: float = 100.0, ampl: float = 2.0,
+                        offset: float = 0.0, phase: float = 0.0,
+                        normalize: bool = True, force: bool = False) -> bool:
+        """Uploads an arbitrary waveform (one period) to the volatile memory
+        of an output in binary DAC format and outputs it. The points are
+        quantized to 14 bit codes and sent in packets of at most 16384
+        points (DG2000 :DATA:DAC16). The upload is skipped when the same
+        waveform is already loaded on this output.
+
+        Args:
+            waveform (np.ndarray): Waveform points, at least 8
+            output (int, optional): Output channel. Defaults to 1.
+            freq (float, optional): Frequency of the waveform in Hz.
+                Defaults to 100.0.
+            ampl (float, optional): Peak to peak amplitude in Volts, spanned
+                by the full code range. Defaults to 2.0.
+            offset (float, optional): Voltage offset in Volts.
+                Defaults to 0.0.
+            phase (float, optional): Signal phase in degree. Defaults to 0.0.
+            normalize (bool, optional): Scale the waveform from its minimum
+                to its maximum onto the full code range. Otherwise the values
+                must lie in [-1, 1]. Defaults to True.
+            force (bool, optional): Upload even if the waveform is already
+                loaded. Defaults to False.
+
+        Returns:
+            bool: True if the waveform was uploaded, False if it was already
+                loaded or invalid
+        """
+        if output not in [1, 2]:
+            print("ERROR : Invalid output specified")
+            return False
+        waveform = np.asarray(waveform, dtype=np.float64).ravel()
+        if len(waveform) < self._DAC_MIN_POINTS:
+            print(f"ERROR : The waveform must have at least " +
+                  f"{self._DAC_MIN_POINTS} points")
+            return False
+        if normalize:
+            low, high = waveform.min(), waveform.max()
+            if high > low:
+                waveform = 2*(waveform - low)/(high - low) - 1
+            else:
+                waveform = np.zeros_like(waveform)
+        # [-1, 1] onto [0, 0x3FFF]
+        codes = np.rint((np.clip(waveform, -1, 1) + 1)*self._DAC_MAX_CODE/2)
+        codes = codes.astype('<u2')
+        digest = hashlib.sha1(codes.tobytes()).hexdigest()
+        uploaded = force or self._waveform_hashes.get(output) != digest
+        if uploaded:
+            # Packets of equal size, all within the instrument limits
+            packets = np.array_split(
+                codes, -(-len(codes)//self._DAC_PACKET_POINTS))
+            t0 = perf_counter()
+            for n, packet in enumerate(packets):
+                flag = 'END' if n == len(packets) - 1 else 'CON'
+                self.resource.write_binary_values(
+                    f":SOURce{output}:TRACe:DATA:DAC16 VOLATILE,{flag},",
+                    packet, datatype='H', is_big_endian=False)
+            self._waveform_hashes[output] = digest
+            print(f"{self.short_name} | Uploaded {len(codes)} points in " +
+                  f"{perf_counter()-t0:.3f} s")
+        with self.batch(opc=True):
+            self.write(f":SOURce{output}:APPLy:USER {freq}, {ampl}, " +
+                       f"{offset}, {phase}")
+            self.turn_on(output)
+        return uploaded
+
+    def sweep(self, output: int = 1, start: float = 100.0, stop: float = 1e3,
+              sweep_time: float = 1.0, spacing: str = 'LIN', steps: int = 2,
+              trigger: str = 'INT'):
+        """Frequency sweep generated by the instrument on the current waveform
+        of an output (Sine, Square, Ramp or Arbitrary). Only the settings
+        which changed since the last call are sent, in a single message.
+        :param int output: Output channel
+        :param float start: Start frequency in Hz
+        :param float stop: Stop frequency in Hz
+        :param float sweep_time: Sweep time in s (1 ms to 500 s)
+        :param str spacing: 'LIN' (linear), 'LOG' (logarithmic) or 'STE'
+            (steps)
+        :param int steps: Number of frequencies of a step sweep (2 to 1024)
+        :param str trigger: 'INT' (continuous), 'EXT' (external) or 'MAN'
+            (see trigger_sweep)
+        :return: None
+        """
+        if output not in [1, 2]:
+            print("ERROR : Invalid output specified")
+            return None
+        if spacing not in ['LIN', 'LOG', 'STE']:
+            print("ERROR : Invalid spacing specified (LIN, LOG or STE)")
+            return None
+        settings = {f':SOURce{output}:FREQuency:STARt': start,
+                    f':SOURce{output}:FREQuency:STOP': stop,
+                    f':SOURce{output}:SWEep:SPACing': spacing}
+        if spacing == 'STE':
+            settings[f':SOURce{output}:SWEep:STEP'] = int(steps)
+        settings[f':SOURce{output}:SWEep:TIME'] = sweep_time
+        settings[f':SOURce{output}:SWEep:TRIGger:SOURce'] = trigger
+        settings[f':SOURce{output}:SWEep:STATe'] = 'ON'
+        with self.batch(opc=True, check_errors=True):
+            self.configure(settings)
+
+    def trigger_sweep(self, output: int = 1):
+        """
+        Starts one sweep of an output with manual trigger
+        :param int output: Output channel
+        :return: None
+        """
+        self.write(f":SOURce{output}:SWEep:TRIGger:IMMediate")
+
+    def sweep_off(self, output: int = 1):
+        """
+        Disables the frequency sweep of an output
+        :param int output: Output channel
+        :return: None
+        """
+        self.configure({f':SOURce{output}:SWEep:STATe': 'OFF'})
+
+    def scan(self, freqs: np.ndarray, output: int = 1, dwell: float = 0.0,
+             callback=None, confirm: bool = False,
+             native: bool = True) -> dict:
+        """Steps the frequency of an output through freqs, leaving the
+        waveform, amplitude and output state as set beforehand (e.g. with
+        sine).
+        Equally spaced frequencies with a dwell time and no callback are
+        generated by a step sweep of the instrument (see sweep), triggered
+        once. Otherwise only the :FREQuency command is sent at each step.
+
+        Args:
+            freqs (np.ndarray): Frequencies in Hz
+            output (int, optional): Output channel. Defaults to 1.
+            dwell (float, optional): Time in s spent at each frequency.
+                Defaults to 0.0 (as fast as possible).
+            callback (callable, optional): Called as callback(index, freq)
+                once each frequency is set, e.g. to measure. Defaults to None.
+            confirm (bool, optional): Wait for each step to be applied
+                (*OPC?, one round trip per step). Defaults to False.
+            native (bool, optional): Use the step sweep of the instrument
+                when possible. Defaults to True.
+
+        Returns:
+            dict: step timing, also stored in last_scan_timing : mode
+                ('native' or 'stepped'), steps, duration (s), steps per s,
+                median and maximum time to send a step (s), None in native
+                mode
+        """
+        if output not in [1, 2]:
+            print("ERROR : Invalid output specified")
+            return None
+        freqs = np.asarray(freqs, dtype=np.float64)
+        n = len(freqs)
+        linear = n >= 2 and freqs[1] != freqs[0] and np.allclose(
+            np.diff(freqs), freqs[1] - freqs[0], rtol=1e-6, atol=0)
+        t0 = perf_counter()
+        if native and callback is None and linear and n <= 1024 and \
+                1e-3 <= dwell*n <= 500:
+            mode = 'native'
+            self.sweep(output, freqs[0], freqs[-1], dwell*n, 'STE', n, 'MAN')
+            # The response to *OPC? tells when the sweep was triggered, the
+            # last dwell is counted from there
+            self.resource.query(
+                f":SOURce{output}:SWEep:TRIGger:IMMediate;*OPC?")
+            triggered = perf_counter()
+            # The instrument steps on its own, the steps cannot be timed
+            step_times = None
+            sleep(max(0.0, triggered + dwell*n - perf_counter()))
+            # Stay on the last frequency, as in the stepped mode
+            with self.batch():
+                self.sweep_off(output)
+                self.write(f":SOURce{output}:FREQuency {freqs[-1]}")
+        else:
+            mode = 'stepped'
+            step_times = np.empty(n)
+            for i, freq in enumerate(freqs):
+                t = perf_counter()
+                if confirm:
+                    self.resource.query(
+                        f":SOURce{output}:FREQuency {freq};*OPC?")
+                else:
+                    self.resource.write(f":SOURce{output}:FREQuency {freq}")
+                step_times[i] = perf_counter() - t
+                if callback is not None:
+                    callback(i, freq)
+                if dwell > 0:
+                    # Steps scheduled from the start, so that delays do not
+                    # accumulate
+                    sleep(max(0.0, t0 + (i+1)*dwell - perf_counter()))
+        duration = perf_counter() - t0
+        self.last_scan_timing = {
+            'mode': mode, 'steps': n, 'duration': duration,
+            'steps_per_s': n/duration if duration > 0 else float('inf'),
+            'step_median': None, 'step_max': None}
+        if step_times is not None and n > 0:
+            self.last_scan_timing['step_median'] = float(np.median(step_times))
+            self.last_scan_timing['step_max'] = float(np.max(step_times))
+        print(f"{self.short_name} | Scanned {n} frequencies ({mode}) in " +
+              f"{duration:.3f} s")
+        return self.last_scan_timing
 
     def align_phase(self, output: int = 1):
         """Reconfigures output of specified channel to align phase with other output channel.
@@ -0,0 +1,917 @@
+"""
+Simulated SCPI instruments, for testing and benchmarking without hardware.
+
+SimulatedResource stands in for a PyVisa resource and answers the SCPI
+commands used by this package for :
+    - the MSO7000/DS7000 oscilloscopes (e.g. model 'DS7014')
+    - the DSA800 and Agilent spectrum analyzers (e.g. 'DSA815', 'N9010A')
+    - the DG2000/DG4000 arbitrary function generators (e.g. 'DG2102')
+The latency of each bus transaction and the bandwidth of the link are
+configurable, so that performance can be measured on any machine.
+
+Instruments connect to a simulated device with an address of the form
+'SIM::<model>[::<serial>]::INSTR', or with a configured resource :
+
+    scope = Scope('SIM::DS7014::INSTR')
+    scope = Scope(SimulatedResource('DS7014', latency=1e-3, bandwidth=10e6,
+                                    memory_depth=10_000_000))
+"""
+import re
+import threading
+from time import perf_counter, sleep
+
+import numpy as np
+import pyvisa as visa
+from pyvisa import util
+
+
+def _short_form(mnemonic: str) -> str:
+    """Short form of a SCPI mnemonic (e.g. WAVeform -> WAV, CHANnel1 ->
+    CHAN1) : first four letters, or three if the fourth one is a vowel.
+    Numeric suffixes are kept."""
+    match = re.fullmatch(r'([A-Z*?]+)(\d*)', mnemonic.upper())
+    if match is None:
+        return mnemonic.upper()
+    letters, suffix = match.groups()
+    if len(letters) > 4:
+        letters = letters[:3] if letters[3] in 'AEIOU' else letters[:4]
+    return letters + suffix
+
+
+def _normalize(header: str) -> str:
+    """Normalized form of a command header : short form of every node,
+    without the leading colon (e.g. :WAVeform:STARt -> WAV:STAR)."""
+    header = header.strip().lstrip(':')
+    if header.startswith('*'):
+        return header.upper()
+    return ':'.join(_short_form(node) for node in header.split(':'))
+
+
+def _timeout_error():
+    return visa.errors.VisaIOError(visa.constants.StatusCode.error_timeout)
+
+
+class _SimInstrument:
+    """Common IEEE 488.2 behaviour of the simulated instruments : settings
+    storage, status registers, error queue and overlapped operations."""
+    manufacturer = 'RIGOL TECHNOLOGIES'
+    # Headers of optional nodes removed before dispatch (e.g. [:SENSe])
+    optional_nodes = ()
+    # Default settings, by normalized header
+    defaults = {}
+    # Front panel use sets the user request bit of the event status register
+    # (the Rigol programming guides state that it always reads 0)
+    user_request_bit = False
+
+    def __init__(self, model: str, serial: str):
+        self.model = model
+        self.serial = serial
+        self.reset()
+
+    def reset(self):
+        self.settings = dict(self.defaults)
+        self.errors = []
+        self.esr = 0
+        self.ese = 0
+        self.sre = 0
+        # End of the pending overlapped operation (perf_counter time)
+        self.pending_until = 0.0
+        # *OPC sent, the operation complete bit is set once done
+        self.opc_armed = False
+        # *OPC? received, the response is delayed until this time
+        self.blocked_until = 0.0
+
+    def front_panel(self, command: str):
+        """Executes a command as if from the front panel, which sets the user
+        request bit of the event status register if the instrument has one
+        (see user_request_bit)."""
+        header, _, args = command.partition(' ')
+        self.execute(_normalize(header), args.strip(), False, perf_counter())
+        if self.user_request_bit:
+            self.esr |= 64
+
+    def push_error(self, code: int, message: str):
+        self.errors.append(f'{code},"{message}"')
+
+    def update(self, now: float):
+        """Updates the status registers at time now."""
+        if self.opc_armed and now >= self.pending_until:
+            self.esr |= 1
+            self.opc_armed = False
+
+    def execute(self, header: str, args: str, query: bool, now: float):
+        """Executes one command. Returns the response (str or bytes) for
+        queries, None otherwise."""
+        for node in self.optional_nodes:
+            if header.startswith(node + ':'):
+                header = header[len(node) + 1:]
+        handler = getattr(self, 'cmd_' + re.sub(r'\W', '_', header)
+                          + ('_q' if query else ''), None)
+        if handler is not None:
+            return handler(args, now)
+        if query:
+            if header in self.settings:
+                return self.settings[header]
+            self.push_error(-113, 'Undefined header')
+            return None
+        self.settings[header] = _normalize(args) if re.fullmatch(
+            r'[A-Za-z]+\d*', args) else args
+        return None
+
+    def cmd__IDN_q(self, args, now):
+        return f'{self.manufacturer},{self.model},{self.serial},00.01.01'
+
+    def cmd__RST(self, args, now):
+        self.reset()
+
+    def cmd__CLS(self, args, now):
+        self.esr = 0
+        self.errors = []
+
+    def cmd__OPC(self, args, now):
+        self.opc_armed = True
+        self.update(now)
+
+    def cmd__OPC_q(self, args, now):
+        self.blocked_until = max(self.blocked_until, self.pending_until)
+        return '1'
+
+    def cmd__WAI(self, args, now):
+        self.blocked_until = max(self.blocked_until, self.pending_until)
+
+    def cmd__ESR_q(self, args, now):
+        esr, self.esr = self.esr, 0
+        return str(esr)
+
+    def cmd__ESE(self, args, now):
+        self.ese = int(args)
+
+    def cmd__SRE(self, args, now):
+        self.sre = int(args)
+
+    def cmd__STB_q(self, args, now):
+        return str(self.stb())
+
+    def stb(self) -> int:
+        stb = 32 if self.esr & self.ese else 0
+        if len(self.errors) > 0:
+            stb |= 4
+        if stb & self.sre:
+            stb |= 64
+        return stb
+
+    def cmd_SYST_ERR_q(self, args, now):
+        if len(self.errors) == 0:
+            return '0,"No error"'
+        return self.errors.pop(0)
+
+
+class _SimScope(_SimInstrument):
+    """MSO7000/DS7000 oscilloscope. Channel n shows a sine wave of n kHz
+    with a few codes of deterministic noise, which changes with every new
+    acquisition (frame)."""
+
+    def __init__(self, model: str, serial: str,
+                 memory_depth: int = 1000000, sample_rate: float = 1e9,
+                 trigger_delay: float = 1e-3, frame_period: float = 0.02,
+                 max_block_points: dict = None):
+        """
+        :param int memory_depth: Number of points in the internal memory
+        :param float sample_rate: Sample rate in Sa/s
+        :param float trigger_delay: Time between :SINGle and the trigger
+        :param float frame_period: Time between two screen refreshes in RUN
+        :param dict max_block_points: Maximum number of points per
+            :WAV:DATA? query by format
+        """
+        self.memory_depth = memory_depth
+        self.sample_rate = sample_rate
+        self.trigger_delay = trigger_delay
+        self.frame_period = frame_period
+        if max_block_points is None:
+            max_block_points = {'BYTE': 1000000, 'WORD': 500000,
+                                'ASC': 15625}
+        self.max_block_points = max_block_points
+        super().__init__(model, serial)
+
+    def reset(self):
+        super().reset()
+        self.status = 'AUTO'
+        self.running_since = perf_counter()
+        self.frame = 0
+        # Trigger and completion times of the pending single acquisition
+        self.trigger_at = None
+        self.complete_at = None
+        self.source = 1
+        self.mode = 'NORM'
+        self.format = 'BYTE'
+        self.start = 1
+        self.stop = 1000
+        self.scales = {chan: 1.0 for chan in range(1, 5)}
+        # Waveform recording : frame before the first recorded one, and end
+        # of the recording in progress
+        self.record_base = 0
+        self.record_until = None
+        # Measurement statistics by (item, channel) : frame of the last
+        # value counted, count, sum, sum of squares, minimum, maximum
+        self.statistics = {}
+
+    def update(self, now: float):
+        super().update(now)
+        if self.record_until is not None:
+            if now >= self.record_until:
+                self.status = 'STOP'
+                self.record_until = None
+            return
+        if self.status == 'AUTO':
+            self.frame = int((now - self.running_since)/self.frame_period)
+        elif self.complete_at is not None:
+            if now >= self.complete_at:
+                self.status = 'STOP'
+                self.frame += 1
+                self.trigger_at = self.complete_at = None
+            elif now >= self.trigger_at:
+                self.status = 'TD'
+
+    def codes(self, chan: int, index: np.ndarray) -> np.ndarray:
+        """Raw 8 bit codes of a channel at memory indices (from 0)."""
+        t = index/self.sample_rate
+        y_inc = self.scales[chan]/25
+        volts = 2*self.scales[chan]*np.sin(2*np.pi*1e3*chan*t +
+                                           0.1*self.frame)
+        noise = ((index.astype(np.uint64)*np.uint64(2654435761) +
+                  np.uint64(97*self.frame + 13*chan)) >> np.uint64(13)) \
+            % np.uint64(5)
+        codes = np.rint(128 + volts/y_inc) + noise.astype(np.float64) - 2
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def preamble(self) -> tuple:
+        """points, x increment, x origin, y increment, y origin, y reference
+        of the current waveform source and mode."""
+        duration = self.memory_depth/self.sample_rate
+        y_inc = self.scales[self.source]/25
+        if self.mode == 'RAW':
+            return (self.memory_depth, 1/self.sample_rate, -duration/2,
+                    y_inc, 0, 128)
+        return 1000, duration/1000, -duration/2, y_inc, 0, 128
+
+    def cmd_RUN(self, args, now):
+        self.status = 'AUTO'
+        self.running_since = now - self.frame*self.frame_period
+        self.complete_at = None
+
+    def cmd_STOP(self, args, now):
+        self.status = 'STOP'
+        self.complete_at = None
+
+    def cmd_SING(self, args, now):
+        self.status = 'WAIT'
+        self.trigger_at = now + self.trigger_delay
+        self.complete_at = self.trigger_at + \
+            self.memory_depth/self.sample_rate
+
+    def cmd_TRIG_STAT_q(self, args, now):
+        return self.status
+
+    def cmd_REC_STAR(self, args, now):
+        if _normalize(args) in ('ON', '1'):
+            # One frame per trigger, at the trigger period, then STOP
+            frames = int(self.settings.get('REC:FRAM', 1000))
+            self.status = 'WAIT'
+            self.record_base = self.frame
+            self.frame += frames
+            self.record_until = now + frames*(
+                self.trigger_delay + self.memory_depth/self.sample_rate)
+        else:
+            self.record_until = None
+            self.status = 'STOP'
+
+    def cmd_REC_STAR_q(self, args, now):
+        return '0' if self.record_until is None else '1'
+
+    def cmd_REC_CURR(self, args, now):
+        self.frame = self.record_base + int(args)
+        self.settings['REC:CURR'] = args
+
+    def cmd_ACQ_MDEP_q(self, args, now):
+        return str(self.memory_depth)
+
+    def cmd_ACQ_MDEP(self, args, now):
+        if args.strip().upper() != 'AUTO':
+            self.memory_depth = int(float(args))
+
+    def cmd_ACQ_SRAT_q(self, args, now):
+        return f'{self.sample_rate:E}'
+
+    def cmd_TIM_SCAL_q(self, args, now):
+        return f'{self.memory_depth/self.sample_rate/10:E}'
+
+    def cmd_SYST_GAM_q(self, args, now):
+        return '10'
+
+    def cmd_WAV_SOUR(self, args, now):
+        self.source = int(re.search(r'\d+', args).group())
+
+    def cmd_WAV_SOUR_q(self, args, now):
+        return f'CHAN{self.source}'
+
+    def cmd_WAV_MODE(self, args, now):
+        self.mode = _normalize(args)
+
+    def cmd_WAV_FORM(self, args, now):
+        self.format = _normalize(args)
+
+    def cmd_WAV_STAR(self, args, now):
+        self.start = int(float(args))
+
+    def cmd_WAV_STOP(self, args, now):
+        self.stop = int(float(args))
+
+    def cmd_WAV_POIN(self, args, now):
+        self.stop = self.start + int(float(args)) - 1
+
+    def cmd_WAV_PRE_q(self, args, now):
+        points, x_inc, x_orig, y_inc, y_orig, y_ref = self.preamble()
+        formats = {'BYTE': 0, 'WORD': 1, 'ASC': 2}
+        modes = {'NORM': 0, 'MAX': 1, 'RAW': 2}
+        return (f'{formats[self.format]},{modes[self.mode]},{points},1,' +
+                f'{x_inc:E},{x_orig:E},0,{y_inc:E},{y_orig},{y_ref}')
+
+    def cmd_WAV_XINC_q(self, args, now):
+        return f'{self.preamble()[1]:E}'
+
+    def cmd_WAV_XOR_q(self, args, now):
+        return f'{self.preamble()[2]:E}'
+
+    def cmd_WAV_XREF_q(self, args, now):
+        return '0'
+
+    def cmd_WAV_YINC_q(self, args, now):
+        return f'{self.preamble()[3]:E}'
+
+    def cmd_WAV_YOR_q(self, args, now):
+        return str(self.preamble()[4])
+
+    def cmd_WAV_YREF_q(self, args, now):
+        return str(self.preamble()[5])
+
+    def cmd_WAV_DATA_q(self, args, now):
+        points = self.preamble()[0]
+        start = max(self.start, 1)
+        stop = min(self.stop, points)
+        if self.mode == 'RAW' and self.status != 'STOP':
+            self.push_error(-221, 'Settings conflict')
+        if stop - start + 1 > self.max_block_points[self.format]:
+            self.push_error(-222, 'Data out of range')
+            stop = start + self.max_block_points[self.format] - 1
+        index = np.arange(start - 1, stop, dtype=np.int64)
+        if self.mode != 'RAW':
+            # Screen waveform, decimated internal memory
+            index = index*(self.memory_depth//1000)
+        codes = self.codes(self.source, index)
+        if self.format == 'ASC':
+            y_inc, y_orig, y_ref = self.preamble()[3:]
+            volts = (codes - y_orig - y_ref)*y_inc
+            return ','.join(f'{v:E}' for v in volts)
+        if self.format == 'WORD':
+            codes = codes.astype('<u2')
+        return bytes(util.to_ieee_block(codes, codes.dtype.char, False))
+
+    def cmd_CHAN1_SCAL(self, args, now):
+        self.scales[1] = float(args)
+
+    def cmd_CHAN2_SCAL(self, args, now):
+        self.scales[2] = float(args)
+
+    def cmd_CHAN3_SCAL(self, args, now):
+        self.scales[3] = float(args)
+
+    def cmd_CHAN4_SCAL(self, args, now):
+        self.scales[4] = float(args)
+
+    def cmd_CHAN1_SCAL_q(self, args, now):
+        return f'{self.scales[1]:E}'
+
+    def cmd_CHAN2_SCAL_q(self, args, now):
+        return f'{self.scales[2]:E}'
+
+    def cmd_CHAN3_SCAL_q(self, args, now):
+        return f'{self.scales[3]:E}'
+
+    def cmd_CHAN4_SCAL_q(self, args, now):
+        return f'{self.scales[4]:E}'
+
+    def measure(self, item: str, chan: int) -> float:
+        """Value of a measurement item (short form) on the screen waveform
+        of a channel, 9.9E37 (invalid) for the unsupported items."""
+        index = np.arange(1000, dtype=np.int64)*(self.memory_depth//1000)
+        volts = (self.codes(chan, index).astype(np.float64) - 128) * \
+            self.scales[chan]/25
+        values = {'VMAX': volts.max, 'VMIN': volts.min,
+                  'VPP': lambda: volts.max() - volts.min(),
+                  'VAVG': volts.mean,
+                  'VRMS': lambda: np.sqrt(np.mean(volts**2)),
+                  'FREQ': lambda: 1e3*chan, 'PER': lambda: 1e-3/chan}
+        return float(values[item]()) if item in values else 9.9e37
+
+    def _measure_args(self, args: str) -> tuple:
+        """Item (short form) and channel of measurement arguments, e.g.
+        VPP,CHANnel1."""
+        item, source = args.split(',')[-2:]
+        return _short_form(item.strip()), int(re.search(r'\d+', source).group())
+
+    def cmd_MEAS_ITEM_q(self, args, now):
+        return f'{self.measure(*self._measure_args(args)):E}'
+
+    def cmd_MEAS_STAT_ITEM(self, args, now):
+        self.statistics.setdefault(self._measure_args(args),
+                                   [-1, 0, 0.0, 0.0, np.inf, -np.inf])
+
+    def cmd_MEAS_STAT_ITEM_q(self, args, now):
+        key = self._measure_args(args)
+        value = self.measure(*key)
+        stats = self.statistics.setdefault(key,
+                                           [-1, 0, 0.0, 0.0, np.inf, -np.inf])
+        # Every acquisition counts once
+        if stats[0] != self.frame:
+            stats[:] = [self.frame, stats[1] + 1, stats[2] + value,
+                        stats[3] + value**2, min(stats[4], value),
+                        max(stats[5], value)]
+        _, count, total, squares, low, high = stats
+        average = total/count
+        results = {'CURR': value, 'AVER': average, 'MAX': high, 'MIN': low,
+                   'DEV': np.sqrt(max(0.0, squares/count - average**2))}
+        return f'{results[_short_form(args.split(",")[0].strip())]:E}'
+
+    def cmd_MEAS_STAT_RES(self, args, now):
+        self.statistics.clear()
+
+
+class _SimSpectrumAnalyzer(_SimInstrument):
+    """DSA800 or Agilent spectrum analyzer. The trace is a noise floor
+    with a peak at signal_frequency, renewed at every sweep."""
+    optional_nodes = ('SENS',)
+    defaults = {'TRIG:SEQ:SOUR': 'IMM', 'TRIG:SEQ:EXT:SLOP': 'POS',
+                'DISP:WIND:TRAC:Y:SCAL:SPAC': 'LOG'}
+
+    def __init__(self, model: str, serial: str, trace_points: int = None,
+                 sweep_time: float = 0.01, trigger_delay: float = 1e-3,
+                 signal_frequency: float = 1e6):
+        """
+        :param int trace_points: Number of points per trace (defaults to 601
+            for the DSA800, 1001 otherwise)
+        :param float sweep_time: Sweep time when set to auto, in s
+        :param float trigger_delay: Time between the start of a sweep and the
+            external trigger, in s
+        :param float signal_frequency: Frequency of the simulated signal
+        """
+        self.rigol = model.startswith('DSA')
+        if not self.rigol:
+            self.manufacturer = 'Agilent Technologies'
+            self.user_request_bit = True
+        if trace_points is None:
+            trace_points = 601 if self.rigol else 1001
+        self.trace_points = trace_points
+        self.auto_sweep_time = sweep_time
+        self.trigger_delay = trigger_delay
+        self.signal_frequency = signal_frequency
+        super().__init__(model, serial)
+
+    def reset(self):
+        super().reset()
+        self.center = 1.5e9 if self.rigol else 13.25e9
+        self.span = 3e9 if self.rigol else 26.5e9
+        self.rbw = 1e6
+        self.sweep_time = None
+        self.continuous = 1
+        self.sweeps = 0
+        self.format = 'ASC'
+        self.big_endian = True
+        self.marker = self.center
+
+    def cmd_FREQ_SPAN(self, args, now):
+        self.span = float(args)
+
+    def cmd_FREQ_SPAN_q(self, args, now):
+        return f'{self.span:E}'
+
+    def cmd_FREQ_CENT(self, args, now):
+        self.center = float(args)
+
+    def cmd_FREQ_CENT_q(self, args, now):
+        return f'{self.center:E}'
+
+    def cmd_BAND_RES(self, args, now):
+        self.rbw = float(args)
+
+    def cmd_BAND_RES_q(self, args, now):
+        return f'{self.rbw:E}'
+
+    def cmd_SWE_TIME(self, args, now):
+        self.sweep_time = float(args)
+
+    def cmd_SWE_TIME_AUTO(self, args, now):
+        if _normalize(args) in ('ON', '1'):
+            self.sweep_time = None
+
+    def cmd_SWE_TIME_AUTO_q(self, args, now):
+        return '1' if self.sweep_time is None else '0'
+
+    def cmd_SWE_TIME_q(self, args, now):
+        sweep_time = self.sweep_time
+        if sweep_time is None:
+            sweep_time = self.auto_sweep_time
+        return f'{sweep_time:E}'
+
+    def cmd_INIT_CONT(self, args, now):
+        self.continuous = 1 if _normalize(args) in ('ON', '1') else 0
+
+    def cmd_INIT_CONT_q(self, args, now):
+        return str(self.continuous)
+
+    def cmd_INIT_IMM(self, args, now):
+        sweep_time = float(self.cmd_SWE_TIME_q(args, now))
+        if self.settings['TRIG:SEQ:SOUR'] == 'EXT':
+            sweep_time += self.trigger_delay
+        self.pending_until = now + sweep_time
+        self.sweeps += 1
+
+    def cmd_FORM_TRAC_DATA(self, args, now):
+        self.format = 'REAL' if 'REAL' in args.upper() else 'ASC'
+
+    def cmd_FORM(self, args, now):
+        self.cmd_FORM_TRAC_DATA(args, now)
+
+    def cmd_FORM_TRAC_DATA_q(self, args, now):
+        return 'REAL,32' if self.format == 'REAL' else 'ASCII'
+
+    def cmd_FORM_BORD(self, args, now):
+        self.big_endian = _normalize(args) == 'NORM'
+
+    def cmd_FORM_BORD_q(self, args, now):
+        return 'NORM' if self.big_endian else 'SWAP'
+
+    def trace(self) -> np.ndarray:
+        freqs = np.linspace(self.center - self.span/2,
+                            self.center + self.span/2, self.trace_points)
+        rng = np.random.default_rng(self.sweeps)
+        peak = 60/(1 + ((freqs - self.signal_frequency)/self.rbw)**2)
+        return -90 + rng.normal(0, 1, self.trace_points) + peak
+
+    def cmd_TRAC_DATA_q(self, args, now):
+        if now < self.pending_until:
+            # Trace of the previous sweep
+            self.sweeps -= 1
+            trace = self.trace()
+            self.sweeps += 1
+        else:
+            trace = self.trace()
+        if self.format == 'REAL':
+            return bytes(util.to_ieee_block(trace.astype(np.float32), 'f',
+                                            self.big_endian))
+        if self.rigol:
+            values = ', '.join(f'{v:.6e}' for v in trace)
+            return f'#9{len(values):09d} {values}'
+        return ','.join(f'{v:.6e}' for v in trace)
+
+    def cmd_TRAC_q(self, args, now):
+        return self.cmd_TRAC_DATA_q(args, now)
+
+    def cmd_CALC_MARK1_MAX(self, args, now):
+        trace = self.trace()
+        self.marker = self.center - self.span/2 + \
+            np.argmax(trace)*self.span/(self.trace_points - 1)
+
+    def cmd_CALC_MARK1_X_q(self, args, now):
+        return f'{self.marker:E}'
+
+
+class _SimArbitraryFG(_SimInstrument):
+    """DG2000/DG4000 arbitrary function generator with two outputs."""
+    functions = {'SIN': 'SIN', 'SQU': 'SQU', 'RAMP': 'RAMP', 'PULS': 'PULSE',
+                 'NOIS': 'NOISE', 'DC': 'DC', 'USER': 'USER'}
+
+    def reset(self):
+        super().reset()
+        self.outputs = {}
+        for output in (1, 2):
+            self.outputs[output] = {'function': 'SIN', 'freq': 1e3,
+                                    'ampl': 5.0, 'offset': 0.0,
+                                    'phase': 0.0, 'state': 'OFF',
+                                    'impedance': 9.9e37, 'unit': 'VPP',
+                                    'arb': None, 'arb_packets': []}
+
+    def execute(self, header: str, args: str, query: bool, now: float):
+        # [:SOURce[<n>]] and [<n>] are optional and default to channel 1
+        match = re.match(r'(SOUR|OUTP)(\d?)(?::|$)', header)
+        if match is None:
+            if header.startswith('*') or header.startswith('SYST'):
+                return super().execute(header, args, query, now)
+            node, output, rest = 'SOUR', 1, header
+        else:
+            node, output = match.group(1), int(match.group(2) or 1)
+            rest = header[match.end():]
+        handler = getattr(self, f'{node.lower()}_' + re.sub(r'\W', '_', rest)
+                          + ('_q' if query else ''), None)
+        if handler is not None:
+            return handler(self.outputs[output], args)
+        return super().execute(f'{node}{output}:{rest}', args, query, now)
+
+    def sour_APPL_q(self, output, args):
+        if output['function'] == 'NOISE':
+            return (f'"NOISE,DEF,{output["ampl"]:E},{output["offset"]:E},' +
+                    'DEF"')
+        return (f'"{output["function"]},{output["freq"]:E},' +
+                f'{output["ampl"]:E},{output["offset"]:E},' +
+                f'{output["phase"]:E}"')
+
+    def apply(self, output, function, args):
+        values = [float(v) for v in args.split(',') if v.strip() != '']
+        output['function'] = function
+        keys = ('ampl', 'offset') if function == 'NOISE' else \
+            ('freq', 'ampl', 'offset', 'phase')
+        output.update(zip(keys, values))
+
+    def sour_APPL_SIN(self, output, args):
+        self.apply(output, 'SIN', args)
+
+    def sour_APPL_SQU(self, output, args):
+        self.apply(output, 'SQU', args)
+
+    def sour_APPL_RAMP(self, output, args):
+        self.apply(output, 'RAMP', args)
+
+    def sour_APPL_PULS(self, output, args):
+        self.apply(output, 'PULSE', args)
+
+    def sour_APPL_NOIS(self, output, args):
+        self.apply(output, 'NOISE', args)
+
+    def sour_APPL_USER(self, output, args):
+        self.apply(output, 'USER', args)
+
+    def sour_TRAC_DATA_DAC16(self, output, args):
+        """Arbitrary waveform download, in packets of 8 to 16384 14 bit
+        codes. The output switches to the arbitrary waveform on the last
+        packet."""
+        params, block = args
+        flag = _normalize(params.split(',')[1])
+        codes = util.from_ieee_block(block, 'H', False, np.array)
+        if not 8 <= len(codes) <= 16384 or codes.max() > 0x3FFF:
+            self.push_error(-222, 'Data out of range')
+            output['arb_packets'] = []
+            return
+        output['arb_packets'].append(codes)
+        if flag == 'END':
+            output['arb'] = np.concatenate(output['arb_packets'])
+            output['arb_packets'] = []
+            output['function'] = 'USER'
+
+    def sour_FUNC(self, output, args):
+        function = _normalize(args)
+        output['function'] = self.functions.get(function, 'USER')
+
+    def sour_FREQ(self, output, args):
+        output['freq'] = float(args)
+
+    def sour_FREQ_q(self, output, args):
+        return f'{output["freq"]:E}'
+
+    def sour_VOLT_UNIT(self, output, args):
+        output['unit'] = _normalize(args)
+
+    def sour_VOLT_UNIT_q(self, output, args):
+        return output['unit']
+
+    def outp_(self, output, args):
+        output['state'] = 'ON' if _normalize(args) in ('ON', '1') else 'OFF'
+
+    def outp__q(self, output, args):
+        return output['state']
+
+    def outp_IMP(self, output, args):
+        load = _normalize(args)
+        output['impedance'] = 9.9e37 if load.startswith('INF') \
+            else float(args)
+
+    def outp_IMP_q(self, output, args):
+        return f'{output["impedance"]:E}'
+
+
+# Simulated instrument class by model name
+_MODELS = [
+    (r'(DS|MSO)\d{4}', _SimScope),
+    (r'DSA\d{3}|E44\d{2}[AB]|N9\d{3}[AB]', _SimSpectrumAnalyzer),
+    (r'DG\d{4}', _SimArbitraryFG),
+]
+
+
+class SimulatedResource:
+    """Stand-in for a PyVisa message based resource connected to a simulated
+    instrument. Each write and each read costs latency plus the transfer
+    time of the message at the link bandwidth.
+    """
+    def __init__(self, model: str = 'DS7014', serial: str = None,
+                 latency: float = 0.0, bandwidth: float = None, **options):
+        """
+        :param str model: Model name, see module documentation
+        :param str serial: Serial number, defaults to one derived from model
+        :param float latency: Time of one bus transaction in s, defaults to 0
+        :param float bandwidth: Link bandwidth in bytes/s, defaults to None
+            (infinite)
+        :param options: Options of the simulated instrument (e.g.
+            memory_depth for oscilloscopes, see the _Sim* classes)
+        """
+        for pattern, instrument in _MODELS:
+            if re.fullmatch(pattern, model):
+                break
+        else:
+            raise ValueError(f"No simulated instrument for model {model}")
+        if serial is None:
+            serial = f'{model}SIM0001'
+        self.instrument = instrument(model, serial, **options)
+        self.resource_name = f'SIM::{model}::{serial}::INSTR'
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.timeout = 25000
+        self.read_termination = '\n'
+        self._output = bytearray()
+        self._lock = threading.Lock()
+        # Statistics of the link
+        self.messages_written = 0
+        self.responses_read = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    @classmethod
+    def from_address(cls, addr: str):
+        """Opens a simulated resource from an address of the form
+        SIM::<model>[::<serial>]::INSTR"""
+        fields = addr.split('::')
+        serial = fields[2] if len(fields) > 3 else None
+        return cls(fields[1], serial=serial)
+
+    def _transfer(self, nbytes: int):
+        duration = self.latency
+        if self.bandwidth is not None:
+            duration += nbytes/self.bandwidth
+        if self.timeout is not None and duration > self.timeout/1000:
+            sleep(self.timeout/1000)
+            raise _timeout_error()
+        if duration > 0:
+            sleep(duration)
+
+    def write(self, message: str, termination: str = None,
+              encoding: str = None) -> int:
+        return self.write_raw(message.encode('latin-1'))
+
+    def write_raw(self, message: bytes) -> int:
+        with self._lock:
+            self._transfer(len(message) + 1)
+            self.messages_written += 1
+            self.bytes_written += len(message) + 1
+            self._execute(message)
+        return len(message)
+
+    def _execute(self, message: bytes):
+        responses = []
+        now = perf_counter()
+        self.instrument.update(now)
+        for command in self._split(message):
+            if isinstance(command, tuple):
+                # Command with a binary block argument, passed with the
+                # preceding parameters
+                header, block = command
+                header, _, args = header.partition(' ')
+                self.instrument.execute(_normalize(header),
+                                        (args.strip(), block), False, now)
+                continue
+            command = command.strip()
+            if command == '':
+                continue
+            header, _, args = command.partition(' ')
+            query = header.endswith('?')
+            header = _normalize(header.rstrip('?'))
+            response = self.instrument.execute(header, args.strip(), query,
+                                               now)
+            self.instrument.update(now)
+            if query and response is not None:
+                if isinstance(response, str):
+                    response = response.encode('latin-1')
+                responses.append(response)
+        if len(responses) > 0:
+            self._output += b';'.join(responses) + b'\n'
+
+    @staticmethod
+    def _split(message: bytes) -> list:
+        """Splits a program message in commands, keeping binary blocks
+        (#<N><length><data>) in one piece."""
+        commands = []
+        start = 0
+        i = 0
+        while i < len(message):
+            char = message[i:i+1]
+            if char == b'#' and i + 1 < len(message) and \
+                    message[i+1:i+2].isdigit() and message[i+1:i+2] != b'0':
+                digits = int(message[i+1:i+2])
+                length = int(message[i+2:i+2+digits])
+                end = i + 2 + digits + length
+                header = message[start:i].decode('latin-1').strip()
+                commands.append((header.rstrip(',').strip(),
+                                 bytes(message[i:end])))
+                i = start = end + 1
+                continue
+            if char == b';':
+                commands.append(message[start:i].decode('latin-1'))
+                start = i + 1
+            i += 1
+        commands.append(message[start:].decode('latin-1'))
+        return commands
+
+    def read_raw(self, size: int = None) -> bytes:
+        with self._lock:
+            now = perf_counter()
+            wait = self.instrument.blocked_until - now
+            if wait > 0:
+                # Response delayed by *OPC? until the operation completes
+                if self.timeout is not None and wait > self.timeout/1000:
+                    sleep(self.timeout/1000)
+                    raise _timeout_error()
+                sleep(wait)
+            if len(self._output) == 0:
+                if self.timeout is not None:
+                    sleep(self.timeout/1000)
+                raise _timeout_error()
+            if size is None:
+                size = len(self._output)
+            data = bytes(self._output[:size])
+            del self._output[:size]
+            self._transfer(len(data))
+            self.responses_read += 1
+            self.bytes_read += len(data)
+        return data
+
+    def read_bytes(self, count: int, chunk_size: int = None,
+                   break_on_termchar: bool = False) -> bytes:
+        return self.read_raw(count)
+
+    def read(self, termination: str = None, encoding: str = None) -> str:
+        return self.read_raw().decode('latin-1')
+
+    def query(self, message: str, delay: float = None) -> str:
+        self.write(message)
+        return self.read()
+
+    def read_ascii_values(self, converter='f', separator=',',
+                          container=list):
+        return util.from_ascii_block(self.read(), converter, separator,
+                                     container)
+
+    def query_ascii_values(self, message: str, converter='f', separator=',',
+                           container=list, delay: float = None):
+        self.write(message)
+        return self.read_ascii_values(converter, separator, container)
+
+    def read_binary_values(self, datatype='f', is_big_endian=False,
+                           container=list, header_fmt='ieee',
+                           expect_termination=True, data_points=0,
+                           chunk_size=None):
+        return util.from_ieee_block(self.read_raw(), datatype, is_big_endian,
+                                    container)
+
+    def query_binary_values(self, message: str, datatype='f',
+                            is_big_endian=False, container=list,
+                            delay: float = None, header_fmt='ieee',
+                            expect_termination=True, data_points=0,
+                            chunk_size=None):
+        self.write(message)
+        return self.read_binary_values(datatype, is_big_endian, container)
+
+    def write_ascii_values(self, message: str, values, converter='f',
+                           separator=',', termination=None, encoding=None):
+        if np.isscalar(values):
+            values = [values]
+        return self.write(message + ' ' +
+                          util.to_ascii_block(values, converter, separator))
+
+    def write_binary_values(self, message: str, values, datatype='f',
+                            is_big_endian=False, termination=None,
+                            encoding=None, header_fmt='ieee'):
+        block = util.to_ieee_block(values, datatype, is_big_endian)
+        return self.write_raw(message.encode('latin-1') + bytes(block))
+
+    def read_stb(self) -> int:
+        with self._lock:
+            self._transfer(1)
+            self.instrument.update(perf_counter())
+            return self.instrument.stb()
+
+    @property
+    def stb(self) -> int:
+        return self.read_stb()
+
+    def clear(self):
+        with self._lock:
+            self._output.clear()
+
+    def close(self):
+        pass
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Acquisition throughput and latency benchmark.
+
+Runs the main acquisition paths against simulated instruments (see
+SimulatedDevice), so that it works without hardware :
+    - Scope.get_waveform, get_waveform_raw, get_waveform_window,
+      get_waveform_screen and measurement for several memory depths and
+      channel counts
+    - SpectrumAnalyzer.span and zero_span (Rigol and Agilent, binary and
+      ASCII traces)
+    - ArbitraryFG configuration calls and frequency scans
+and reports for each case the points/s, MB/s, round trips per call and
+p50/p99 latency. It also checks that the block size found by
+Scope.tune_block_size is accepted by the instrument and then used.
+Results are stored as JSON and can be compared to a previous run to
+detect regressions :
+
+    python benchmarks/acquisition.py --output baseline.json
+    python benchmarks/acquisition.py --baseline baseline.json
+
+The link latency and bandwidth are those of the simulated resource, the
+defaults roughly match a USB connection.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from SimulatedDevice import SimulatedResource
+from RigolInterface import Scope, SpectrumAnalyzer, ArbitraryFG
+from Agilent import SpectrumAnalyzer as AgilentSpectrumAnalyzer
+
+# Maximum number of points get_waveform reads in one block
+SCREEN_POINTS_LIMIT = 250000
+
+
+def measure(device, function, repeats: int, points: int = 0) -> dict:
+    """Calls function repeats times (after one warm-up call) and returns
+    the statistics of the calls. The instruments messages are discarded.
+
+    :param device: Instrument called by function
+    :param callable function: Function to benchmark
+    :param int repeats: Number of timed calls
+    :param int points: Number of data points returned by one call
+    :return: statistics of the calls
+    :rtype: dict
+    """
+    resource = device.resource
+    with contextlib.redirect_stdout(io.StringIO()):
+        function()
+        durations = np.empty(repeats)
+        round_trips = resource.round_trips
+        writes = resource.writes
+        bytes_read = resource.bytes_read
+        for i in range(repeats):
+            t0 = perf_counter()
+            function()
+            durations[i] = perf_counter() - t0
+    p50, p99 = np.percentile(durations, [50, 99])
+    mean = durations.mean()
+    return {'points': points,
+            'p50_ms': p50*1e3,
+            'p99_ms': p99*1e3,
+            'points_per_s': points/mean,
+            'MB_per_s': (resource.bytes_read - bytes_read)/repeats/mean/1e6,
+            'round_trips': (resource.round_trips - round_trips)/repeats,
+            'writes': (resource.writes - writes)/repeats}
+
+
+def benchmark_scope(args) -> dict:
+    results = {}
+    for depth in args.depths:
+        scope = Scope(SimulatedResource('DS7014', latency=args.latency,
+                                        bandwidth=args.bandwidth,
+                                        memory_depth=depth))
+        for nch in args.channels:
+            channels = list(range(1, nch + 1))
+            results[f'scope.get_waveform_raw[{depth},{nch}ch]'] = measure(
+                scope, lambda: scope.get_waveform_raw(channels, single=True),
+                args.repeats, depth*nch)
+            if depth <= SCREEN_POINTS_LIMIT:
+                results[f'scope.get_waveform[{depth},{nch}ch]'] = measure(
+                    scope, lambda: scope.get_waveform(channels, single=True),
+                    args.repeats, depth*nch)
+            # 2 us around the trigger at 1 GSa/s
+            results[f'scope.get_waveform_window[{depth},{nch}ch]'] = \
+                measure(scope, lambda: scope.get_waveform_window(
+                    channels, t_start=-1e-6, t_stop=1e-6), args.repeats,
+                    2001*nch)
+            results[f'scope.get_waveform_screen[{depth},{nch}ch]'] = \
+                measure(scope, lambda: scope.get_waveform_screen(channels),
+                        args.repeats, 1000*nch)
+            # 4 on-instrument measurements per channel, one point each
+            results[f'scope.measurement[{depth},{nch}ch]'] = \
+                measure(scope, lambda: scope.measurement(
+                    channels, ['VPP', 'VRMS', 'FREQuency', 'PERiod']),
+                    args.repeats, 4*nch)
+        scope.close()
+    return results
+
+
+def benchmark_spectrum_analyzers(args) -> dict:
+    results = {}
+    for model, cls in (('DSA815', SpectrumAnalyzer),
+                       ('N9010A', AgilentSpectrumAnalyzer)):
+        for binary in (True, False):
+            resource = SimulatedResource(model, latency=args.latency,
+                                         bandwidth=args.bandwidth,
+                                         sweep_time=args.sweep_time)
+            sa = cls(resource, binary=binary)
+            points = resource.instrument.trace_points
+            fmt = 'REAL,32' if binary else 'ASCII'
+            results[f'{model}.span[{fmt}]'] = measure(
+                sa, lambda: sa.span(center=1e6, span=1e6, single=True),
+                args.repeats, points)
+            results[f'{model}.zero_span[{fmt}]'] = measure(
+                sa, lambda: sa.zero_span(center=1e6, single=True),
+                args.repeats, points)
+            sa.close()
+    return results
+
+
+def benchmark_function_generator(args) -> dict:
+    fg = ArbitraryFG(SimulatedResource('DG2102', latency=args.latency,
+                                       bandwidth=args.bandwidth))
+    calls = {'sine': lambda: fg.sine(1, 1e3, 2.0, 0.0),
+             'square': lambda: fg.square(1, 1e3, 2.0, 0.0, 50),
+             'pulse': lambda: fg.pulse(1, 1e3, 2.0, 0.0, 20),
+             'get_waveform': lambda: fg.get_waveform(1)}
+    results = {f'DG2102.{name}': measure(fg, call, args.repeats)
+               for name, call in calls.items()}
+    freqs = np.linspace(1e3, 1e4, 100)
+    results['DG2102.scan[100]'] = measure(fg, lambda: fg.scan(freqs),
+                                          args.repeats, len(freqs))
+    fg.close()
+    return results
+
+
+def check_block_size(args) -> int:
+    """Tunes the block size of a simulated scope which accepts smaller
+    blocks than the limit of its model, and checks that the tuned size is
+    accepted by the instrument and used by get_waveform_raw. Prints the
+    checks and returns the number of failed ones."""
+    depth = 1000000
+    accepted = {'BYTE': 200000, 'WORD': 100000, 'ASC': 15625}
+    with contextlib.redirect_stdout(io.StringIO()):
+        scope = Scope(SimulatedResource('DS7014', latency=args.latency,
+                                        bandwidth=args.bandwidth,
+                                        memory_depth=depth,
+                                        max_block_points=accepted))
+        scope.get_waveform_raw([1], single=True)
+        scope.write(':STOP')
+        best = scope.tune_block_size()
+        scope.get_waveform_raw([1], single=True)
+        blocks = scope.last_transfer['blocks']
+        error = scope.resource.query(':SYSTem:ERRor?').strip()
+        scope.close()
+    checks = {
+        f"tuned block size {best} accepted (<= {accepted['BYTE']})":
+            best <= accepted['BYTE'],
+        f"get_waveform_raw read {depth} points in {blocks} blocks":
+            blocks == -(-depth//best),
+        f"no instrument error ({error})": int(error.split(',')[0]) == 0}
+    print()
+    for name, passed in checks.items():
+        print(f"{'ok' if passed else 'FAILED':<7} {name}")
+    return list(checks.values()).count(False)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    """Prints the p50 latency ratios to a baseline and returns the number of
+    regressions (cases slower than the baseline by more than tolerance)."""
+    regressions = 0
+    print(f"\n{'case':<42} {'p50 ratio':>10}")
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        ratio = stats['p50_ms']/baseline[name]['p50_ms']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = ' REGRESSION'
+            regressions += 1
+        print(f"{name:<42} {ratio:>10.2f}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--depths', type=int, nargs='+',
+                        default=[100000, 1000000],
+                        help='scope memory depths (points)')
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 2],
+                        help='scope channel counts')
+    parser.add_argument('--repeats', type=int, default=10,
+                        help='timed calls per case')
+    parser.add_argument('--latency', type=float, default=5e-4,
+                        help='simulated latency per transaction (s)')
+    parser.add_argument('--bandwidth', type=float, default=30e6,
+                        help='simulated link bandwidth (bytes/s)')
+    parser.add_argument('--sweep-time', type=float, default=0.01,
+                        help='simulated spectrum analyzer sweep time (s)')
+    parser.add_argument('--output', help='JSON file to store the results')
+    parser.add_argument('--baseline', help='JSON results to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative p50 slowdown reported as regression')
+    args = parser.parse_args()
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Connection messages
+        results.update(benchmark_scope(args))
+        results.update(benchmark_spectrum_analyzers(args))
+        results.update(benchmark_function_generator(args))
+
+    print(f"{'case':<42} {'p50 (ms)':>9} {'p99 (ms)':>9} {'Mpts/s':>8} " +
+          f"{'MB/s':>7} {'trips':>6}")
+    for name, stats in results.items():
+        print(f"{name:<42} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} " +
+              f"{stats['points_per_s']/1e6:>8.2f} {stats['MB_per_s']:>7.2f} " +
+              f"{stats['round_trips']:>6.1f}")
+
+    if args.output is not None:
+        report = {'date': datetime.now().isoformat(timespec='seconds'),
+                  'python': platform.python_version(),
+                  'numpy': np.__version__,
+                  'settings': vars(args),
+                  'results': results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    failures = check_block_size(args)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        failures += compare(results, baseline, args.tolerance)
+    if failures > 0:
+        sys.exit(1)
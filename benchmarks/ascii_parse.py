@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of the ASCII trace decoding of the spectrum analyzers :
+previous list comprehension implementations of RigolInterface and Agilent
+against the shared vectorized parse_ascii_block.
+"""
+
+import os
+import sys
+from timeit import repeat
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from GenericDevice import parse_ascii_block
+
+
+def rigol_list(rawdata: str) -> np.ndarray:
+    # Also drops the first value, which shares its token with the header
+    data = rawdata.split(', ')[1:]
+    data = [float(i) for i in data]
+    return np.asarray(data)
+
+
+def agilent_list(rawdata: str) -> np.ndarray:
+    data = rawdata.split(',')[:]
+    data = [float(i) for i in data]
+    return np.asarray(data)
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    number = 20
+    print(f"{'points':>8} {'response':>10} {'decoder':>18} {'time (us)':>10}")
+    for points in (601, 40001):
+        values = ', '.join(f'{v:.6e}' for v in rng.normal(-80, 5, points))
+        responses = {'Rigol': f'#9{len(values):09d} {values}\n',
+                     'Agilent': values.replace(' ', '') + '\n'}
+        for response, decoder in (('Rigol', rigol_list),
+                                  ('Agilent', agilent_list)):
+            rawdata = responses[response]
+            assert len(parse_ascii_block(rawdata)) == points
+            for name, decode in ((decoder.__name__, decoder),
+                                 ('parse_ascii_block', parse_ascii_block)):
+                t = min(repeat(lambda: decode(rawdata), number=number,
+                               repeat=5))/number
+                print(f"{points:>8} {response:>10} {name:>18} {t*1e6:>10.1f}")
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the ASCII and binary (REAL,32) spectrum analyzer trace formats :
+number of bytes transferred and decoding time, for 601 points (DSA800)
+and 40001 points (maximum of the Agilent X-Series) traces.
+Runs offline on synthetic traces formatted as the instruments send them,
+decoded with the functions used by the spectrum analyzer classes.
+"""
+
+import os
+import sys
+from timeit import repeat
+
+import numpy as np
+from pyvisa import util
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from GenericDevice import parse_ascii_block
+
+
+def ascii_block(trace: np.ndarray) -> str:
+    """Formats a trace as an ASCII response (comma separated values)"""
+    return ', '.join(f'{v:.6e}' for v in trace) + '\n'
+
+
+def binary_block(trace: np.ndarray) -> bytes:
+    """Formats a trace as a REAL,32 response (IEEE 488.2 block, little
+    endian)"""
+    return bytes(util.to_ieee_block(trace.astype(np.float32), 'f', False)) + \
+        b'\n'
+
+
+def decode_binary(rawdata: bytes) -> np.ndarray:
+    return util.from_ieee_block(rawdata, 'f', False, np.array)
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    number = 100
+    print(f"{'points':>8} {'format':>8} {'bytes':>10} {'decode (us)':>12}")
+    for points in (601, 40001):
+        trace = rng.normal(-80, 5, points)
+        for name, encode, decode in (('ASCII', ascii_block, parse_ascii_block),
+                                     ('REAL,32', binary_block, decode_binary)):
+            rawdata = encode(trace)
+            assert np.allclose(decode(rawdata), trace, rtol=1e-6)
+            t = min(repeat(lambda: decode(rawdata), number=number,
+                           repeat=5))/number
+            print(f"{points:>8} {name:>8} {len(rawdata):>10} {t*1e6:>12.1f}")
@@ -16,9 +16,10 @@ rigol = Scope("TCPIP::169.254.63.138::INSTR")
 # ts = np.zeros(N_repet)
 # for _ in range(N_repet):
 #     t0 = time.perf_counter()
-#     times, channel = rigol.get_waveform_better(channel=1, plot=False)
+#     times, channel = rigol.get_waveform_raw(channels=[1], plot=False)
 #     ts[_] = time.perf_counter()-t0
 # print(f"Avg time per read {np.mean(ts)*1e3} +/- {np.std(ts)*1e3} ms")
+# See benchmarks/acquisition.py for throughput and latency measurements
 data = rigol.get_waveform([1, 2], plot=True, ndivs=14)
 rigol.close()
 
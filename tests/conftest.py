@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# The modules of the interface are at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SimulatedDevice import SimulatedResource  # noqa: E402
+
+
+@pytest.fixture
+def scope():
+    from RigolInterface import Scope
+    scope = Scope(SimulatedResource('DS7014', memory_depth=10000))
+    yield scope
+    scope.close()
+
+
+@pytest.fixture
+def fg():
+    from RigolInterface import ArbitraryFG
+    fg = ArbitraryFG(SimulatedResource('DG2102'))
+    yield fg
+    fg.close()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from Reducers import Envelope, Statistics
+
+
+@pytest.mark.parametrize('mode', ['screen', 'memory'])
+def test_stream(scope, mode):
+    frames = []
+    for frame in scope.stream([1, 2], mode=mode, max_frames=5):
+        frames.append(frame._replace(data=frame.data.copy()))
+    assert [frame.index for frame in frames] == list(range(5))
+    assert all(frame.data.shape == (2, len(frame.times))
+               for frame in frames)
+    if mode == 'memory':
+        # A new acquisition for each frame
+        assert not any(frame.duplicate for frame in frames)
+        assert not np.array_equal(frames[0].data, frames[1].data)
+    assert scope.resource.query(':SYSTem:ERRor?').startswith('0,')
+
+
+def test_stream_stops_when_closed(scope):
+    stream = scope.stream([1], mode='memory')
+    next(stream)
+    stream.close()
+    assert scope.resource.query(':SYSTem:ERRor?').startswith('0,')
+
+
+def test_record(scope):
+    record = scope.record([1, 2], frames=10)
+    assert record.data.shape == (10, 2, len(record.times))
+    assert record.data.dtype == np.float64
+    assert record.completed >= record.armed
+    assert not np.array_equal(record.data[0], record.data[1])
+    raw = scope.record([1], frames=3, dtype=np.uint8)
+    assert raw.data.shape == (3, len(raw.times))
+    assert raw.data.dtype == np.uint8
+    assert raw.scale is not None and raw.offset is not None
+    assert scope.resource.query(':SYSTem:ERRor?').startswith('0,')
+
+
+def test_readout_into_reducers(scope):
+    scope.resource.write(':STOP')
+    _, data = scope.get_waveform_raw([1])
+    reducers = {'stats': Statistics(), 'envelope': Envelope(100)}
+    reduced = scope.get_waveform_raw([1], reducers=reducers)
+    stats = reduced[1]['stats'].result()
+    assert np.isclose(stats['mean'], data.mean())
+    assert np.isclose(stats['std'], data.std())
+    mins, maxs = reduced[1]['envelope'].result()
+    assert np.allclose(mins, data.reshape(-1, 100).min(axis=1))
+    assert np.allclose(maxs, data.reshape(-1, 100).max(axis=1))
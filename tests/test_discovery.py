@@ -0,0 +1,32 @@
+from time import time
+
+import GenericDevice
+from SimulatedDevice import SimulatedResource
+
+
+class ResourceManager:
+    def list_resources(self):
+        return ('SIM::DSA815::INSTR',)
+
+    def open_resource(self, addr, open_timeout=None):
+        return SimulatedResource.from_address(addr)
+
+
+def entry(model, age):
+    return {'identity': model, 'manufacturer': '', 'model': model,
+            'serial': '', 'time': time() - age}
+
+
+def test_discover_merges_into_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(GenericDevice, 'IDN_CACHE_FILE',
+                        str(tmp_path / 'instruments.json'))
+    monkeypatch.setattr(GenericDevice, 'get_resource_manager',
+                        lambda py_backend=None: ResourceManager())
+    GenericDevice._write_idn_cache({
+        'USB0::FRESH::INSTR': entry('DS7014', 10),
+        'USB0::STALE::INSTR': entry('DG2102', 2*GenericDevice.IDN_CACHE_TTL)})
+    found = GenericDevice.discover(refresh=True)
+    assert list(found) == ['SIM::DSA815::INSTR']
+    assert sorted(GenericDevice._read_idn_cache()) == ['SIM::DSA815::INSTR',
+                                                       'USB0::FRESH::INSTR']
+    GenericDevice.resource_pool.clear()
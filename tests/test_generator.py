@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def test_upload_waveform_is_skipped_when_loaded(fg):
+    waveform = np.sin(np.linspace(0, 2*np.pi, 1000, endpoint=False))
+    assert fg.upload_waveform(waveform, output=1)
+    arb = fg.resource.instrument.outputs[1]['arb']
+    assert len(arb) == 1000
+    assert arb.min() == 0 and arb.max() == 0x3FFF
+    writes = fg.resource.writes
+    assert not fg.upload_waveform(waveform, output=1)
+    assert fg.resource.writes == writes
+    assert fg.upload_waveform(waveform, output=1, force=True)
+    assert fg.upload_waveform(waveform, output=2)
+    assert fg.resource.query(':SYSTem:ERRor?').startswith('0,')
+
+
+def test_upload_waveform_in_packets(fg):
+    waveform = np.random.default_rng(0).uniform(-1, 1, 40000)
+    writes = fg.resource.writes
+    assert fg.upload_waveform(waveform, normalize=False)
+    assert fg.resource.writes - writes == 3
+    expected = np.rint((waveform + 1)*0x3FFF/2)
+    assert np.array_equal(fg.resource.instrument.outputs[1]['arb'], expected)
+
+
+def test_upload_waveform_after_other_function(fg):
+    waveform = np.linspace(-1, 1, 100)
+    assert fg.upload_waveform(waveform)
+    fg.dc_offset(1, 1.0)
+    assert fg.upload_waveform(waveform)
+    # The uploaded waveform stays in memory and is selected again
+    fg.sine(1, 1e3, 2, 0)
+    assert not fg.upload_waveform(waveform)
+    assert fg.resource.instrument.outputs[1]['function'] == 'USER'
+
+
+def test_upload_waveform_rejects_short_waveforms(fg, capsys):
+    assert not fg.upload_waveform(np.zeros(4))
+    assert 'ERROR' in capsys.readouterr().out
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from Reducers import (RMS, Crossings, Envelope, Histogram, Mean, Spectrum,
+                      Statistics, feeder)
+
+
+class Preamble:
+    x_inc = 1e-6
+    y_inc = 0.01
+    y_orig = 0
+    y_ref = 128
+
+
+@pytest.fixture
+def codes():
+    t = np.arange(100000)
+    wave = 128 + 100*np.sin(2*np.pi*t/1000)
+    noise = np.random.default_rng(0).normal(0, 2, len(t))
+    return np.clip(np.rint(wave + noise), 0, 255).astype(np.uint8)
+
+
+def volts(codes):
+    return (codes.astype(np.float64) - Preamble.y_ref)*Preamble.y_inc
+
+
+def reduce(reducer, codes, split=None):
+    reducer.start(Preamble)
+    if split is None:
+        reducer.update(0, codes)
+        return reducer
+    other = reducer.copy()
+    reducer.update(0, codes[:split])
+    other.update(split, codes[split:])
+    return reducer.merge(other)
+
+
+def test_statistics(codes):
+    v = volts(codes)
+    stats = reduce(Statistics(), codes).result()
+    assert np.isclose(stats['mean'], v.mean())
+    assert np.isclose(stats['std'], v.std())
+    assert np.isclose(stats['rms'], np.sqrt((v**2).mean()))
+    assert stats['min'] == v.min() and stats['max'] == v.max()
+    assert np.isclose(reduce(Mean(), codes).result(), v.mean())
+    assert np.isclose(reduce(RMS(), codes).result(), np.sqrt((v**2).mean()))
+    values, counts = reduce(Histogram(), codes).result()
+    assert counts.sum() == len(codes)
+
+
+@pytest.mark.parametrize('reducer', [Statistics(), Envelope(1000),
+                                     Crossings(0.0, 0.2, 'both'),
+                                     Spectrum(4096)])
+def test_merge_matches_single_pass(codes, reducer):
+    full = reduce(reducer.copy(), codes).result()
+    # Spectrum ignores the incomplete segment of each part, split on one
+    merged = reduce(reducer.copy(), codes, split=3*4096).result()
+    if isinstance(full, dict):
+        assert all(np.isclose(full[k], merged[k]) for k in full)
+    elif isinstance(full, tuple):
+        assert all(np.allclose(a, b) for a, b in zip(full, merged))
+    else:
+        assert full == merged
+
+
+def test_envelope(codes):
+    v = volts(codes)
+    mins, maxs = reduce(Envelope(1000), codes).result()
+    assert np.allclose(mins, v.reshape(-1, 1000).min(axis=1))
+    assert np.allclose(maxs, v.reshape(-1, 1000).max(axis=1))
+
+
+@pytest.mark.parametrize('edge, expected', [('rising', 100),
+                                            ('falling', 100),
+                                            ('both', 200)])
+def test_crossings(codes, edge, expected):
+    # 100 periods, the hysteresis rejects the noise
+    count = reduce(Crossings(0.0, 0.2, edge), codes).result()
+    assert abs(count - expected) <= 1
+
+
+def test_crossings_rejects_invalid_edge():
+    with pytest.raises(ValueError):
+        Crossings(edge='up')
+
+
+def test_feeder(codes):
+    reducers = {'stats': Statistics(), 'envelope': Envelope(1000)}
+    feed = feeder(reducers, Preamble)
+    for offset in range(0, len(codes), 30000):
+        feed(offset, codes[offset:offset + 30000])
+    assert np.isclose(reducers['stats'].result()['mean'],
+                      volts(codes).mean())
+    mins, _ = reducers['envelope'].result()
+    assert len(mins) == 100
@@ -0,0 +1,88 @@
+import pytest
+
+from Agilent import SpectrumAnalyzer as AgilentSpectrumAnalyzer
+from RigolInterface import SpectrumAnalyzer
+from SimulatedDevice import SimulatedResource
+
+
+def error(device):
+    return device.resource.query(':SYSTem:ERRor?').strip()
+
+
+def test_configure_sends_only_changed_settings(scope):
+    settings = {':CHANnel1:SCALe': 0.1, ':CHANnel1:OFFSet': 0}
+    assert scope.configure(settings) == 2
+    writes = scope.resource.writes
+    assert scope.configure(settings) == 0
+    assert scope.resource.writes == writes
+    assert scope.configure({':CHANnel1:SCALe': 0.1,
+                            ':CHANnel1:OFFSet': 1}) == 1
+    assert scope.resource.writes == writes + 1
+    assert error(scope).startswith('0,')
+
+
+def test_query_setting_and_invalidate(scope):
+    trips = scope.resource.round_trips
+    value = scope.query_setting(':ACQuire:MDEPth')
+    assert scope.query_setting(':ACQuire:MDEPth') == value
+    assert scope.resource.round_trips == trips + 1
+    scope.invalidate(':ACQuire:MDEPth')
+    scope.query_setting(':ACQuire:MDEPth')
+    assert scope.resource.round_trips == trips + 2
+
+
+def test_batch_sends_one_message(scope):
+    writes = scope.resource.writes
+    with scope.batch():
+        scope.write(':CHANnel1:SCALe 0.2')
+        scope.write(':CHANnel2:SCALe 0.5')
+        scope.configure({':CHANnel1:OFFSet': 0.1})
+        assert scope.resource.writes == writes
+    assert scope.resource.writes == writes + 1
+    assert float(scope.resource.query(':CHANnel2:SCALe?')) == 0.5
+
+
+def test_batch_with_opc_and_errors_is_one_round_trip(scope, capsys):
+    scope.resource.instrument.push_error(-113, 'Undefined header')
+    trips = scope.resource.round_trips
+    with scope.batch(opc=True, check_errors=True):
+        scope.write(':CHANnel1:SCALe 0.2')
+        scope.write(':CHANnel1:OFFSet 0')
+    assert scope.resource.round_trips == trips + 1
+    assert 'ERROR' in capsys.readouterr().out
+
+
+def test_batch_splits_long_messages(scope):
+    writes = scope.resource.writes
+    with scope.batch():
+        for n in range(200):
+            scope.write(f':CHANnel1:OFFSet {n/1000}')
+    assert scope.resource.writes - writes > 1
+    assert float(scope.resource.query(':CHANnel1:OFFSet?')) == 0.199
+
+
+def test_batch_discards_on_exception(scope):
+    scope.configure({':CHANnel1:SCALe': 0.1})
+    writes = scope.resource.writes
+    with pytest.raises(RuntimeError):
+        with scope.batch():
+            scope.write(':CHANnel1:SCALe 0.5')
+            raise RuntimeError
+    assert scope.resource.writes == writes
+    assert scope.settings == {}
+    assert float(scope.resource.query(':CHANnel1:SCALe?')) == 0.1
+
+
+@pytest.mark.parametrize('cls, model', [(SpectrumAnalyzer, 'DSA815'),
+                                        (AgilentSpectrumAnalyzer, 'N9010A')])
+def test_front_panel_changes_are_restored(cls, model):
+    sa = cls(SimulatedResource(model))
+    sa.span(center=1e6, span=1e5, swt=0.01)
+    writes = sa.resource.writes
+    sa.span(center=1e6, span=1e5, swt=0.01)
+    assert sa.resource.writes == writes
+    sa.resource.instrument.front_panel(':FREQuency:CENTer 2e6')
+    sa.span(center=1e6, span=1e5, swt=0.01)
+    assert float(sa.resource.query(':FREQuency:CENTer?')) == 1e6
+    assert error(sa).startswith('0,')
+    sa.close()